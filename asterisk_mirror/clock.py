@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+import time
+from threading import Condition
+
+# Clock
+# Usage:
+#  clock = Clock()
+#  clock.wait(event, 1.0)   # event.wait(1.0)
+#
+#  clock = VirtualClock(threads=2)  # 2 threads wait on the clock
+#  clock.schedule(5.0, stepper.interrupt)
+#  clock.advance(3600)      # lets the threads run an hour of virtual time
+#
+class Clock:
+    def __str__(self) -> str:
+        return self.__class__.__name__
+
+    def monotonic_ns(self) -> int:
+        return time.monotonic_ns()
+
+    def time(self) -> float:
+        return time.time()
+
+    def wait(self, event, timeout: float=None) -> bool:
+        return event.wait(timeout)
+
+    def notify(self):
+        # wakes waiters to check their events (events set outside of the clock)
+        pass
+
+# ----------------------------------------------------------------------
+# 待ち時間を実時間で待たずに次の期限まで進める仮想時計
+# ----------------------------------------------------------------------
+class VirtualClock(Clock):
+    def __init__(self, start: float=None, threads: int=1):
+        self.epoch = time.time() if start is None else start
+        self.threads = threads
+        self.now = 0
+        # multiple threads run only while advance() is called
+        self.limit = None if threads <= 1 else 0
+        self._cond = Condition()
+        self._waiters = []
+        self._timers = []
+        self._sequence = itertools.count()
+
+    def monotonic_ns(self) -> int:
+        return self.now
+
+    def time(self) -> float:
+        return self.epoch + self.now/1000000000
+
+    def schedule(self, delay: float, callback):
+        # calls the callback when the virtual time passes the delay
+        with self._cond:
+            heapq.heappush(self._timers, (self.now+round(delay*1000000000), next(self._sequence), callback))
+
+    def wait(self, event, timeout: float=None) -> bool:
+        with self._cond:
+            deadline = None if timeout is None else self.now + max(0, round(timeout*1000000000))
+            waiter = (deadline, event)
+            self._waiters.append(waiter)
+            try:
+                while not self._is_ready(waiter):
+                    if not self._advance():
+                        # wait for the other threads or external events
+                        self._cond.wait(0.1)
+            finally:
+                self._waiters.remove(waiter)
+            return event.is_set()
+
+    def notify(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def advance(self, seconds: float):
+        # runs the waiting threads for the virtual seconds (called from a non-waiting thread)
+        with self._cond:
+            self.limit = self.now + round(seconds*1000000000)
+            self._cond.notify_all()
+            # returns when the threads have caught up with the limit
+            while self.now < self.limit or not self._is_idle():
+                if not self._advance():
+                    self._cond.wait(0.1)
+
+    def _is_ready(self, waiter) -> bool:
+        deadline, event = waiter
+        return event.is_set() or (deadline is not None and self.now >= deadline)
+
+    def _is_idle(self) -> bool:
+        return len(self._waiters) >= self.threads and not any(self._is_ready(waiter) for waiter in self._waiters)
+
+    def _advance(self) -> bool:
+        # moves the time to the next deadline when all threads are waiting
+        while self._timers and self._timers[0][0] <= self.now:
+            _, _, callback = heapq.heappop(self._timers)
+            callback()
+        if any(self._is_ready(waiter) for waiter in self._waiters):
+            self._cond.notify_all()
+            return False
+        if len(self._waiters) < self.threads:
+            return False
+        deadlines = [deadline for deadline, _ in self._waiters if deadline is not None]
+        if self._timers:
+            deadlines.append(self._timers[0][0])
+        if self.limit is not None:
+            deadlines.append(self.limit)
+        if not deadlines:
+            return False
+        next_time = min(deadlines)
+        if next_time <= self.now:
+            return False
+        self.now = next_time
+        while self._timers and self._timers[0][0] <= self.now:
+            _, _, callback = heapq.heappop(self._timers)
+            callback()
+        self._cond.notify_all()
+        return True
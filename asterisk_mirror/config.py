@@ -1,7 +1,13 @@
 # -*- coding: utf-8 -*-
 
+import os
 from configparser import ConfigParser
-from threading import Lock
+from threading import Event, Lock, Thread
+
+from asterisk_mirror.log import get_logger
+from asterisk_mirror.morse import MORSE_MAP
+
+log = get_logger('AsteriskConfig')
 
 _CONFIG_FILE = '/boot/asterisk-mirror.cfg'
 
@@ -12,30 +18,132 @@ step_pin = 13
 direction_pin = 19
 enable_pin = 9
 
+# microsteps of the driver per full step (1, 2, 4, 8, 16), steps and speeds count them
+microsteps = 8
+
+# driver mode pins MS1, MS2, MS3 to switch the microsteps (empty for a fixed resolution)
+mode_pins =
+
+# microsteps of fast moves, switched with the mode pins
+coarse_microsteps = 2
+
+# steps faster than this interval (secs) move in coarse microsteps
+coarse_interval = 0.0005
+
+# GPIO backend (rpi, waveform, recording, simulated)
+gpio = rpi
+
+# generate pulses in a dedicated process
+process = False
+
+# real-time scheduling of the stepping thread or process (none, fifo, rr)
+realtime = none
+
+# real-time priority (1-99)
+priority = 50
+
+# cpu cores to pin the stepping thread or process to (e.g. 3 or 2-3, empty for all)
+cpus =
+
+# lock memory to avoid page faults
+lock_memory = False
+
+# runtime of the scenes (threads, asyncio)
+runtime = threads
+
 # scene transition interval (secs)
 transition = 300
 
+# home sensor input pin (empty for no sensor), active low with a pull-up
+home_pin =
+home_active_low = True
+
+# interval to find the home position again between scenes (secs, 0 for only at startup)
+home_interval = 0
+
+# file to record the position for a warm start (empty to disable)
+state_file =
+
+# interval to check the config file for changes (secs, 0 to disable)
+reload_interval = 5
+
 # logics
 logics = MorseLogic, YearLogic, FlucLogic
 
+[Telemetry]
+# record step timings (not with System.process)
+enabled = False
+
+# step timings to keep
+capacity = 4096
+
+# metrics endpoint (host:port or unix socket path, empty to disable)
+listen = 127.0.0.1:9464
+
+[Log]
+# lowest level to write (debug, info, warning, error)
+level = info
+
+# where to write (stdout, stderr, file:/path)
+sink = stdout
+
+# records of one message a sec at most (0 for unlimited)
+rate = 20
+
+# records to buffer before dropping the oldest
+capacity = 4096
+
+[Trace]
+# binary trace of the steps (empty to disable, not with System.process)
+file =
+
+# bytes of a trace file before rotating it
+max_bytes = 16777216
+
+# rotated trace files to keep
+backups = 3
+
+[Control]
+# control api (host:port or unix socket path, empty to disable)
+listen =
+
+[Watchdog]
+# secs a heartbeat may be late before escalating: interrupt, restart the scene, exit (0 to disable)
+timeout = 10
+
+# secs between checks and keepalives to the service manager (NOTIFY_SOCKET)
+interval = 1
+
 [MorseLogic]
 # a message to encode morse-codes
 message = asterisk
 
+# a streaming source of the message instead (file:/path, fifo:/path, stdin)
+source =
+
 # stepper speed
 speed = 1.0
 
 # stepper counts
 steps = 40
 
+# stepper easing (linear, trapezoid, scurve, sine)
+easing = linear
+
 [YearLogic]
 # stepper speed
 speed = 1.0
 
+# stepper easing (linear, trapezoid, scurve, sine)
+easing = linear
+
 [FlucLogic]
 # stepper speed
 speed = 1.0
 
+# stepper easing on start (linear, trapezoid, scurve, sine)
+easing = linear
+
 # rotate fluctuation
 fluctuate = False
 
@@ -44,6 +152,141 @@ rate = 0.5
 
 '''
 
+# types of the known keys: a type or (type, choices) ([Motor:name] sections share Motor.*)
+_EASINGS = ('linear', 'trapezoid', 'scurve', 'sine')
+_SCHEMA = {
+    'System.step_pin': int,
+    'System.direction_pin': int,
+    'System.enable_pin': int,
+    'System.microsteps': int,
+    'System.coarse_microsteps': int,
+    'System.coarse_interval': float,
+    'System.gpio': (str, ('rpi', 'waveform', 'recording', 'simulated')),
+    'System.home_active_low': bool,
+    'System.home_interval': float,
+    'System.process': bool,
+    'System.realtime': (str, ('none', 'fifo', 'rr')),
+    'System.priority': int,
+    'System.lock_memory': bool,
+    'System.runtime': (str, ('threads', 'asyncio')),
+    'System.transition': int,
+    'System.reload_interval': float,
+    'Motor.step_pin': int,
+    'Motor.direction_pin': int,
+    'Motor.enable_pin': int,
+    'Motor.microsteps': int,
+    'Motor.gpio': (str, ('rpi', 'waveform', 'recording', 'simulated')),
+    'Motor.home_pin': int,
+    'Log.level': (str, ('debug', 'info', 'warning', 'error')),
+    'Log.rate': int,
+    'Log.capacity': int,
+    'Trace.max_bytes': int,
+    'Trace.backups': int,
+    'Watchdog.timeout': float,
+    'Watchdog.interval': float,
+    'Telemetry.enabled': bool,
+    'Telemetry.capacity': int,
+    'MorseLogic.speed': float,
+    'MorseLogic.steps': int,
+    'MorseLogic.easing': (str, _EASINGS),
+    'YearLogic.speed': float,
+    'YearLogic.easing': (str, _EASINGS),
+    'FlucLogic.speed': float,
+    'FlucLogic.easing': (str, _EASINGS),
+    'FlucLogic.fluctuate': bool,
+    'FlucLogic.rate': float,
+}
+
+def _encodable(message: str) -> bool:
+    return all(char.upper() in MORSE_MAP for char in message)
+
+# constraints on the cast values: (predicate, what a valid value is)
+_CHECKS = {
+    'Log.sink': (lambda sink: sink in ('stdout', 'stderr') or (sink.startswith('file:') and len(sink) > len('file:')), "stdout, stderr or file:/path"),
+    'Log.rate': (lambda rate: rate >= 0, "0 or more"),
+    'Log.capacity': (lambda capacity: capacity > 0, "more than 0"),
+    'MorseLogic.message': (_encodable, "characters with morse codes"),
+    'MorseLogic.source': (lambda source: source in ('', 'stdin', 'queue') or (source.partition(':')[0] in ('file', 'fifo') and source.partition(':')[2] != ''), "empty, file:/path, fifo:/path, stdin or queue"),
+}
+
+def _cast(value: str, cast):
+    if cast is int:
+        return int(value)
+    elif cast is float:
+        return float(value)
+    elif cast is bool:
+        return value.lower() == "true"
+    else:
+        return value
+
+# ----------------------------------------------------------------------
+# 読み込み時に型変換・検証した変更不可の設定値
+# ----------------------------------------------------------------------
+class ConfigSection:
+    __slots__ = ('_name', '_values')
+
+    def __init__(self, name: str, values: dict):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_values', values)
+
+    def __getattr__(self, key: str):
+        try:
+            return self._values[key]
+        except KeyError:
+            raise AttributeError(self._name + "." + key) from None
+
+    def __setattr__(self, key: str, value):
+        raise AttributeError("config snapshot is immutable")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._values
+
+class ConfigSnapshot:
+    def __init__(self, configs: dict, generation: int=0):
+        self.configs = configs
+        self.generation = generation
+        self._cache = {}
+        sections = {}
+        for section, items in configs.items():
+            values = {}
+            for key, value in items.items():
+                schema = _SCHEMA.get(section.split(':', 1)[0] + "." + key, str)
+                cast, choices = schema if isinstance(schema, tuple) else (schema, None)
+                try:
+                    if cast is bool and value.lower() not in ('true', 'false'):
+                        raise ValueError("not a boolean")
+                    values[key] = _cast(value, cast)
+                except ValueError as e:
+                    raise ValueError("invalid config: " + section + "." + key + " = " + value + " (" + str(e) + ")")
+                if choices is not None and values[key] not in choices:
+                    raise ValueError("invalid config: " + section + "." + key + " = " + value + " (choose from " + ", ".join(choices) + ")")
+                check = _CHECKS.get(section.split(':', 1)[0] + "." + key)
+                if check is not None and not check[0](values[key]):
+                    raise ValueError("invalid config: " + section + "." + key + " = " + value + " (" + check[1] + ")")
+            sections[section] = ConfigSection(section, values)
+        self._sections = sections
+
+    def __getattr__(self, section: str) -> ConfigSection:
+        try:
+            return self.__dict__['_sections'][section]
+        except KeyError:
+            raise AttributeError(section) from None
+
+    def get(self, keys: str, cast=None):
+        # raw values walked by dotted keys, cast once and cached
+        try:
+            return self._cache[(keys, cast)]
+        except KeyError:
+            pass
+        value = self.configs
+        for key in keys.split('.'):
+            if not key in value:
+                return None
+            value = value[key]
+        value = _cast(value, cast)
+        self._cache[(keys, cast)] = value
+        return value
+
 class AsteriskConfig:
     _instance = None
     _lock = Lock()
@@ -52,35 +295,90 @@ class AsteriskConfig:
         with cls._lock:
             if cls._instance is None:
                 cls._instance = super().__new__(cls)
+                cls._instance.snapshot = None
                 cls._instance.load()
         return cls._instance
 
     def __init__(self):
         pass
 
-    def load(self, files: list=[_CONFIG_FILE]):
-        print("AsteriskConfig: load files:", files)
+    def _parse(self, files: list) -> ConfigSnapshot:
         parser = ConfigParser()
         parser.read_string(_CONFIG_DEFAULT)
         parser.read(files)
-        self.configs = {}
+        configs = {}
         for section in parser.sections():
-            self.configs[section] = dict(parser.items(section))
+            configs[section] = dict(parser.items(section))
+        generation = 0 if self.snapshot is None else self.snapshot.generation+1
+        return ConfigSnapshot(configs, generation)
+
+    def _mtimes(self) -> list:
+        mtimes = []
+        for file in self.files:
+            try:
+                mtimes.append(os.stat(file).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+    def load(self, files: list=[_CONFIG_FILE]):
+        log.info("load files:", files)
+        self.files = list(files)
+        self.mtimes = self._mtimes()
+        self.snapshot = self._parse(self.files)
+        self.configs = self.snapshot.configs
         return self
 
+    def changed(self) -> bool:
+        # cheap check of the modification times of the loaded files
+        return self._mtimes() != self.mtimes
+
+    def reload(self) -> bool:
+        # swaps the snapshot if the files have a new valid configuration
+        self.mtimes = self._mtimes()
+        try:
+            snapshot = self._parse(self.files)
+        except ValueError as e:
+            log.warning("keeps the current config:", e)
+            return False
+        if snapshot.configs == self.snapshot.configs:
+            return False
+        log.info("reloaded files:", self.files)
+        self.snapshot = snapshot
+        self.configs = snapshot.configs
+        return True
+
+    @property
+    def generation(self) -> int:
+        return self.snapshot.generation
+
     def get(self, keys: str, cast=None):
-        value = self.configs
-        for key in keys.split('.'):
-            if not key in value:
-                return None
-            value = value[key]
-        
-        #print(keys, ":", value, "->", cast)
-        if cast is int:
-            return int(value)
-        elif cast is float:
-            return float(value)
-        elif cast is bool:
-            return value.lower() == "true"
-        else:
-            return value
+        return self.snapshot.get(keys, cast)
+
+# ----------------------------------------------------------------------
+# 設定ファイルの変更を監視して再読み込みするスレッド
+# ----------------------------------------------------------------------
+class ConfigWatcher:
+    def __init__(self, config: AsteriskConfig, interval: float=5.0):
+        self.config = config
+        self.interval = interval
+        self.stop_event = Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None and self.interval > 0:
+            self.stop_event.clear()
+            self.thread = Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread = None
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.check()
+
+    def check(self):
+        if self.config.changed():
+            self.config.reload()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import json
+from http.server import BaseHTTPRequestHandler
+
+from asterisk_mirror.httpd import HTTPService
+from asterisk_mirror.log import get_logger
+
+log = get_logger('ControlServer')
+
+# ControlServer
+# Usage:
+#  server = ControlServer(mirror, '/run/asterisk-mirror.sock')  # or host:port
+#  server.start()
+#  # curl --unix-socket /run/asterisk-mirror.sock http://localhost/state
+#  # curl --unix-socket /run/asterisk-mirror.sock -d '{"name": "YearLogic"}' http://localhost/logic
+#
+# GET  /state                                    -> logic, position, uptime, ...
+# POST /logic   {"name": "YearLogic"}            -> jumps to the logic
+# POST /message {"message": "hello"}             -> sets the message of MorseLogic
+# POST /speed   {"speed": 2.0, "logic": "..."}   -> the current logic if no logic is given
+# POST /pause, /resume
+#
+class _ControlHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/state':
+            self.send_error(404)
+            return
+        self._send(200, self.server.mirror.state())
+
+    def do_POST(self):
+        mirror = self.server.mirror
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(body, dict):
+                raise ValueError("a json object is expected")
+            if self.path == '/logic':
+                mirror.select_logic(str(body['name']))
+            elif self.path == '/message':
+                mirror.set_message(str(body['message']))
+            elif self.path == '/speed':
+                mirror.set_speed(float(body['speed']), body.get('logic'))
+            elif self.path == '/pause':
+                mirror.pause()
+            elif self.path == '/resume':
+                mirror.resume()
+            else:
+                self.send_error(404)
+                return
+        except KeyError as e:
+            self._send(400, {'error': "missing key: " + str(e)})
+            return
+        except (ValueError, TypeError) as e:
+            self._send(400, {'error': str(e)})
+            return
+        self._send(200, mirror.state())
+
+    def _send(self, status: int, data: dict):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class ControlServer(HTTPService):
+    def __init__(self, mirror, listen: str):
+        super().__init__(listen, _ControlHandler)
+        self.server.mirror = mirror
+        log.info("started", listen=listen)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import math
+from array import array
+from functools import lru_cache
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Easing profiles
+# Usage:
+#  offsets = delay_table(400, 1.0, 'trapezoid', 0.001)
+#  # offsets[i] is the time (ns) of the (i+1)th step after the 1st one
+#
+EASINGS = ('linear', 'trapezoid', 'scurve', 'sine')
+
+RAMP_STEPS = 200        # steps to accelerate to the full speed
+MIN_VELOCITY = 0.2      # start/stop velocity relative to the full speed
+
+def _ramp(x, easing: str):
+    # velocity (MIN_VELOCITY..1) at the ramp position x (0..1)
+    lib = math if numpy is None else numpy
+    if easing == 'trapezoid':
+        # constant acceleration: v^2 grows linearly with the distance
+        return lib.sqrt(MIN_VELOCITY**2 + (1-MIN_VELOCITY**2)*x)
+    elif easing == 'scurve':
+        return MIN_VELOCITY + (1-MIN_VELOCITY)*x*x*(3-2*x)
+    elif easing == 'sine':
+        return MIN_VELOCITY + (1-MIN_VELOCITY)*(0.5-0.5*lib.cos(math.pi*x))
+    return 1.0
+
+@lru_cache(maxsize=64)
+def velocity_profile(steps: int, easing: str='linear'):
+    # relative velocities of each step of a move
+    if easing not in EASINGS:
+        raise ValueError("unknown easing: " + str(easing))
+    steps = abs(steps)
+    ramp = min(RAMP_STEPS, steps//2)
+    if numpy is not None:
+        index = numpy.arange(steps, dtype=numpy.float64)
+        # distance from the nearest end of the move
+        distance = numpy.minimum(index, steps-1-index) + 0.5
+        x = numpy.minimum(distance/ramp, 1.0) if ramp > 0 else numpy.ones(steps)
+        profile = _ramp(x, easing) * numpy.ones(steps)
+        profile.flags.writeable = False
+        return profile
+    profile = array('d', bytes(8*steps))
+    for i in range(steps):
+        distance = min(i, steps-1-i) + 0.5
+        profile[i] = _ramp(min(distance/ramp, 1.0) if ramp > 0 else 1.0, easing)
+    return profile
+
+@lru_cache(maxsize=256)
+def delay_table(steps: int, speed: float, easing: str='linear', base_time: float=0.001):
+    # cumulative step deadlines (ns) of a move relative to its 1st step
+    interval = base_time/speed*1000000000
+    profile = velocity_profile(steps, easing)
+    if numpy is not None:
+        offsets = numpy.cumsum(interval/profile).astype(numpy.int64)
+        offsets.flags.writeable = False
+        return offsets
+    offsets = array('q', bytes(8*len(profile)))
+    elapsed = 0.0
+    for i, velocity in enumerate(profile):
+        elapsed += interval/velocity
+        offsets[i] = int(elapsed)
+    return offsets
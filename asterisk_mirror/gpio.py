@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+from bisect import bisect_right
+
+from asterisk_mirror.clock import Clock
+
+try:
+    import pigpio
+except ImportError:
+    pigpio = None
+
+# GPIO backends
+# Usage:
+#  backend = create_backend('recording')
+#  backend.setup([13, 19, 9])
+#  backend.output(13, True)
+#  backend.send([(0, 13, True), (10000, 13, False)]) # pulse train: (offset ns, pin, value)
+#
+class GPIOBackend:
+    # True if a whole move can be sent as one pulse train
+    batched = False
+
+    def __init__(self):
+        self.clock = Clock()
+        self._edges = []
+        self._started = 0
+
+    def __str__(self) -> str:
+        return self.__class__.__name__
+
+    def setup(self, pins: list):
+        pass
+
+    def output(self, pin: int, value: bool):
+        raise NotImplementedError
+
+    def setup_input(self, pin: int):
+        pass
+
+    def input(self, pin: int) -> bool:
+        raise NotImplementedError
+
+    def send(self, edges: list):
+        # starts a pulse train and returns immediately
+        self._edges = edges
+        self._started = self.clock.monotonic_ns()
+
+    def cancel(self) -> int:
+        # stops the current pulse train and returns the number of edges sent
+        sent = self.sent()
+        self._edges = []
+        return sent
+
+    def sent(self) -> int:
+        elapsed = self.clock.monotonic_ns() - self._started
+        return bisect_right([edge[0] for edge in self._edges], elapsed)
+
+    def busy(self) -> bool:
+        # True while the pulse train is being played
+        return self.sent() < len(self._edges)
+
+    def cleanup(self):
+        pass
+
+# ----------------------------------------------------------------------
+# RPi.GPIO (or fake_rpi) を1出力ずつ呼び出すバックエンド
+# ----------------------------------------------------------------------
+class RPiGPIOBackend(GPIOBackend):
+    def __init__(self):
+        super().__init__()
+        import importlib.util
+        try:
+            importlib.util.find_spec('RPi.GPIO')
+            import RPi.GPIO as GPIO
+        except ImportError:
+            import fake_rpi
+            fake_rpi.toggle_print(False)
+            from fake_rpi.RPi import GPIO
+        self.GPIO = GPIO
+
+    def setup(self, pins: list):
+        self.GPIO.setwarnings(False)
+        self.GPIO.setmode(self.GPIO.BCM)
+        for pin in pins:
+            self.GPIO.setup(pin, self.GPIO.OUT)
+
+    def output(self, pin: int, value: bool):
+        self.GPIO.output(pin, value)
+
+    def setup_input(self, pin: int):
+        self.GPIO.setup(pin, self.GPIO.IN, pull_up_down=self.GPIO.PUD_UP)
+
+    def input(self, pin: int) -> bool:
+        return bool(self.GPIO.input(pin))
+
+# ----------------------------------------------------------------------
+# pigpio の waveform で1回の移動をまとめて送るバックエンド
+# ----------------------------------------------------------------------
+class WaveformBackend(GPIOBackend):
+    batched = True
+    max_pulses = 5000 # pulses per wave
+
+    def __init__(self, host: str='localhost', port: int=8888):
+        super().__init__()
+        if pigpio is None:
+            raise ImportError("WaveformBackend requires pigpio")
+        self.pi = pigpio.pi(host, port)
+        if not self.pi.connected:
+            raise IOError("pigpio daemon is not running")
+        self._waves = []
+
+    def setup(self, pins: list):
+        for pin in pins:
+            self.pi.set_mode(pin, pigpio.OUTPUT)
+
+    def output(self, pin: int, value: bool):
+        self.pi.write(pin, int(value))
+
+    def setup_input(self, pin: int):
+        self.pi.set_mode(pin, pigpio.INPUT)
+        self.pi.set_pull_up_down(pin, pigpio.PUD_UP)
+
+    def input(self, pin: int) -> bool:
+        return bool(self.pi.read(pin))
+
+    def send(self, edges: list):
+        self._clear()
+        # merge edges at the same offset into one pulse
+        pulses = []
+        on_mask, off_mask = 0, 0
+        for i, (offset, pin, value) in enumerate(edges):
+            if value:
+                on_mask |= 1<<pin
+            else:
+                off_mask |= 1<<pin
+            next_offset = edges[i+1][0] if i+1 < len(edges) else offset
+            if next_offset != offset or i+1 == len(edges):
+                # usecs between the rounded absolute times: no rounding error builds up along the train
+                pulses.append(pigpio.pulse(on_mask, off_mask, next_offset//1000 - offset//1000))
+                on_mask, off_mask = 0, 0
+        for begin in range(0, len(pulses), self.max_pulses):
+            self.pi.wave_add_generic(pulses[begin:begin+self.max_pulses])
+            self._waves.append(self.pi.wave_create())
+        super().send(edges)
+        if len(self._waves) == 1:
+            self.pi.wave_send_once(self._waves[0])
+        else:
+            self.pi.wave_chain(self._waves)
+
+    def busy(self) -> bool:
+        return bool(self.pi.wave_tx_busy())
+
+    def cancel(self) -> int:
+        sent = self.sent() if self.pi.wave_tx_busy() else len(self._edges)
+        self.pi.wave_tx_stop()
+        self._clear()
+        self._edges = []
+        return sent
+
+    def _clear(self):
+        for wave in self._waves:
+            self.pi.wave_delete(wave)
+        self._waves = []
+
+    def cleanup(self):
+        self._clear()
+        self.pi.stop()
+
+# ----------------------------------------------------------------------
+# 出力をリングバッファに記録するバックエンド (テスト用)
+# ----------------------------------------------------------------------
+class RecordingBackend(GPIOBackend):
+    def __init__(self, capacity: int=65536, batched: bool=False):
+        super().__init__()
+        self.batched = batched
+        self.capacity = capacity
+        self.times = array('q', bytes(8*capacity))
+        self.pins = array('H', bytes(2*capacity))
+        self.values = array('B', bytes(capacity))
+        self.count = 0
+        self.levels = {}
+
+    def setup(self, pins: list):
+        for pin in pins:
+            self.levels[pin] = False
+
+    def _record(self, timestamp: int, pin: int, value: bool):
+        index = self.count % self.capacity
+        self.times[index] = timestamp
+        self.pins[index] = pin
+        self.values[index] = value
+        self.levels[pin] = bool(value)
+        self.count += 1
+
+    def output(self, pin: int, value: bool):
+        self._record(self.clock.monotonic_ns(), pin, value)
+
+    def send(self, edges: list):
+        super().send(edges)
+        for offset, pin, value in edges:
+            self._record(self._started+offset, pin, value)
+
+    def cancel(self) -> int:
+        # forget the edges which were not played
+        unsent = len(self._edges)
+        sent = super().cancel()
+        self.count -= unsent - sent
+        return sent
+
+    def edges(self) -> list:
+        # recorded edges (timestamp ns, pin, value) in chronological order
+        begin = max(0, self.count-self.capacity)
+        return [(self.times[i%self.capacity], self.pins[i%self.capacity], bool(self.values[i%self.capacity]))
+                for i in range(begin, self.count)]
+
+    def pulses(self, pin: int) -> list:
+        # timestamps of rising edges of the pin
+        return [t for t, p, value in self.edges() if p == pin and value]
+
+    def clear(self):
+        self.count = 0
+
+# ----------------------------------------------------------------------
+# 機械的な位置と原点センサを模擬するバックエンド (テスト用)
+# ----------------------------------------------------------------------
+class SimulatedBackend(RecordingBackend):
+    def __init__(self, position: int=0, number_of_steps: int=1600, width: int=8, capacity: int=65536):
+        super().__init__(capacity)
+        # the mechanical position; the sensor pulls its pin low at [0, width)
+        self.position = position
+        self.number_of_steps = number_of_steps
+        self.width = width
+        self.step_pin = None
+        self.direction_pin = None
+        self.sensor_pin = None
+
+    def setup(self, pins: list):
+        super().setup(pins)
+        self.step_pin, self.direction_pin = pins[0], pins[1]
+
+    def setup_input(self, pin: int):
+        self.sensor_pin = pin
+
+    def input(self, pin: int) -> bool:
+        return pin != self.sensor_pin or self.position >= self.width
+
+    def output(self, pin: int, value: bool):
+        self._move(pin, value)
+        super().output(pin, value)
+
+    def cancel(self) -> int:
+        # a pulse train starts with its direction edge
+        edges = self._edges
+        sent = super().cancel()
+        dir = 1
+        for _, pin, value in edges[:sent]:
+            if pin == self.direction_pin:
+                dir = -1 if value else 1
+            elif pin == self.step_pin and value:
+                self.position = (self.position+dir) % self.number_of_steps
+        return sent
+
+    def _move(self, pin: int, value: bool):
+        # a rising edge of the step pin moves the rotor (direction pin high = backwards)
+        if pin == self.step_pin and value and not self.levels.get(pin):
+            dir = -1 if self.levels.get(self.direction_pin) else 1
+            self.position = (self.position+dir) % self.number_of_steps
+
+# factory
+def create_backend(name: str='rpi') -> GPIOBackend:
+    backends = {
+        'rpi': RPiGPIOBackend,
+        'waveform': WaveformBackend,
+        'recording': RecordingBackend,
+        'simulated': SimulatedBackend,
+    }
+    if name not in backends:
+        raise ValueError("unknown gpio backend: " + str(name))
+    return backends[name]()
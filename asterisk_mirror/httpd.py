@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import os
+import socketserver
+from http.server import ThreadingHTTPServer
+from threading import Thread
+
+# HTTPService
+# Usage:
+#  service = HTTPService('127.0.0.1:9464', Handler)  # or a unix socket path
+#  service.server.mirror = mirror  # handlers read attributes of self.server
+#  service.start()
+#
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        request, _ = super().get_request()
+        return request, ('localhost', 0)
+
+class HTTPService:
+    def __init__(self, listen: str, handler):
+        self.listen = listen
+        if listen.startswith('/'):
+            if os.path.exists(listen):
+                os.unlink(listen)
+            self.server = _UnixHTTPServer(listen, handler)
+        else:
+            host, port = listen.rsplit(':', 1)
+            self.server = ThreadingHTTPServer((host, int(port)), handler)
+            self.server.daemon_threads = True
+        self.thread = None
+
+    def address(self):
+        return self.server.server_address
+
+    def start(self):
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def attach(self, loop):
+        # accepts requests on an asyncio loop instead of a thread
+        self.server.timeout = 0
+        loop.add_reader(self.server.fileno(), self.server.handle_request)
+
+    def detach(self, loop):
+        loop.remove_reader(self.server.fileno())
+
+    def stop(self):
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread = None
+        self.server.server_close()
+        if self.listen.startswith('/') and os.path.exists(self.listen):
+            os.unlink(self.listen)
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+import atexit
+import os
+import sys
+import time
+from collections import deque
+from threading import Event, Lock, Thread
+
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+
+# Logger
+# Usage:
+#  log = get_logger('Stepper')
+#  log.info("homed at:", 0, moved=812)  # print-like arguments and structured fields
+#  log.debug("interrupting...")         # dropped without formatting below the level
+#  configure(level='debug', sink='file:/var/log/asterisk-mirror.log', rate=20)
+#
+class Logger:
+    __slots__ = ('name', 'writer')
+
+    def __init__(self, name: str, writer):
+        self.name = name
+        self.writer = writer
+
+    def log(self, level: int, *args, **fields):
+        # a deque append is atomic: the caller never waits for a lock or the sink
+        writer = self.writer
+        if level < writer.level:
+            return
+        records = writer.records
+        if len(records) == records.maxlen:
+            writer.dropped += 1
+        records.append((time.time(), level, self.name, args, fields))
+        if writer.thread is None:
+            writer.start()
+
+    def debug(self, *args, **fields):
+        self.log(10, *args, **fields)
+
+    def info(self, *args, **fields):
+        self.log(20, *args, **fields)
+
+    def warning(self, *args, **fields):
+        self.log(30, *args, **fields)
+
+    def error(self, *args, **fields):
+        self.log(40, *args, **fields)
+
+# ----------------------------------------------------------------------
+# 記録をまとめて書き出すスレッド
+# ----------------------------------------------------------------------
+class LogWriter:
+    interval = 0.1 # secs between batches
+
+    def __init__(self, level: str='info', sink: str='stdout', rate: int=20, capacity: int=4096):
+        self.thread = None
+        self.file = None
+        self.lock = Lock()
+        self.stop_event = Event()
+        self.dropped = 0
+        self.records = deque(maxlen=capacity)
+        self.configure(level, sink, rate, capacity)
+
+    def configure(self, level: str='info', sink: str='stdout', rate: int=20, capacity: int=4096):
+        if level not in LEVELS:
+            raise ValueError("unknown log level: " + str(level))
+        if sink not in ('stdout', 'stderr') and not sink.startswith('file:'):
+            raise ValueError("unknown log sink: " + str(sink))
+        with self.lock:
+            self.level = LEVELS[level]
+            # records of one message a sec at most (0 for unlimited)
+            self.rate = rate
+            if capacity != self.records.maxlen:
+                self.records = deque(self.records, maxlen=capacity)
+            if self.file is not None:
+                self.file.close()
+            self.sink = sink
+            self.file = None
+            self.failed = False
+            self.window = 0
+            self.counts = {}
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.stop_event.clear()
+                self.thread = Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+    def forked(self):
+        # a forked child starts a writer of its own with the next record
+        self.thread = None
+        self.lock = Lock()
+
+    def run(self):
+        try:
+            while not self.stop_event.wait(self.interval):
+                try:
+                    self.flush()
+                except OSError:
+                    # even stderr failed: the records are dropped
+                    pass
+        finally:
+            # the next record starts another writer if this one died
+            self.thread = None
+
+    def flush(self):
+        # drains the records into one write to the sink
+        with self.lock:
+            lines = []
+            records = self.records
+            while records:
+                record = records.popleft()
+                self._roll(record[0])
+                if self._allowed(record):
+                    lines.append(self.format(*record))
+            self._roll(time.time())
+            if self.dropped > 0:
+                lines.append(self.format(time.time(), 30, 'Log', ("dropped", self.dropped, "records"), {}))
+                self.dropped = 0
+            if lines:
+                try:
+                    file = self._open()
+                    file.write("\n".join(lines) + "\n")
+                    file.flush()
+                except OSError as e:
+                    # writes to stderr until configured again, reported once
+                    self.failed = True
+                    self.file = None
+                    lines.insert(0, self.format(time.time(), 40, 'Log', ("cannot write to", self.sink + ":", e, "(writes to stderr)"), {}))
+                    sys.stderr.write("\n".join(lines) + "\n")
+                    sys.stderr.flush()
+
+    def _roll(self, timestamp: float):
+        # rate limits each message (by its 1st argument) in windows of a sec
+        window = int(timestamp)
+        if window <= self.window:
+            return
+        for (name, message), count in self.counts.items():
+            if count > self.rate:
+                self.records.appendleft((timestamp, 30, name, ("suppressed", count-self.rate, "records of:", message), {}))
+        self.window, self.counts = window, {}
+
+    def _allowed(self, record: tuple) -> bool:
+        if self.rate <= 0:
+            return True
+        _, _, name, args, _ = record
+        key = (name, args[0] if args else None)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        return self.counts[key] <= self.rate
+
+    def format(self, timestamp: float, level: int, name: str, args: tuple, fields: dict) -> str:
+        line = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)) + ".%03d" % (timestamp*1000 % 1000)
+        line += " " + _NAMES[level] + " " + name + ": " + " ".join(str(arg) for arg in args)
+        if fields:
+            line += " " + " ".join(key + "=" + str(value) for key, value in fields.items())
+        return line
+
+    def _open(self):
+        # stdout and stderr are looked up on each write (they may be replaced)
+        if self.sink == 'stdout':
+            return sys.stdout
+        elif self.sink == 'stderr' or self.failed:
+            return sys.stderr
+        if self.file is None:
+            path = self.sink[len('file:'):]
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.file = open(path, 'a')
+        return self.file
+
+_NAMES = {level: name.upper() for name, level in LEVELS.items()}
+_writer = LogWriter()
+atexit.register(_writer.stop)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_writer.forked)
+
+def get_logger(name: str) -> Logger:
+    return Logger(name, _writer)
+
+def configure(level: str='info', sink: str='stdout', rate: int=20, capacity: int=4096):
+    _writer.configure(level, sink, rate, capacity)
+
+def flush():
+    _writer.flush()
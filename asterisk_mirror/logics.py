@@ -1,179 +1,334 @@
 # -*- coding: utf-8 -*-
 
-import time
+import asyncio
+from array import array
 from datetime import datetime
+from functools import lru_cache
 
 from asterisk_mirror.config import AsteriskConfig
+from asterisk_mirror.easing import RAMP_STEPS, velocity_profile
+from asterisk_mirror.log import get_logger
+from asterisk_mirror.morse import MORSE_MAP
+from asterisk_mirror.planner import MotionPlanner, Rest
+from asterisk_mirror.sources import open_source
+from asterisk_mirror.stepper import delay_offsets
 
 # ----------------------------------------------------------------------
 # ステッピングモータの動きを表す基底ロジック
 # ----------------------------------------------------------------------
 class AsteriskLogic:
+    # a configured speed is divided by the scale
+    scale = 1.0
+
     def __init__(self, stepper):
         self.stepper = stepper
+        self.speed = 1.0
+        self.log = get_logger(str(self))
     
     def __str__(self) -> str:
         return self.__class__.__name__
 
+    def configure(self):
+        # (re)reads the config snapshot, called on init and on scene transitions after a reload
+        pass
+
+    def release(self):
+        # called when another scene becomes active and this logic is dropped
+        pass
+
+    def set_speed(self, speed: float):
+        self.speed = speed / self.scale
+
+    def get_speed(self) -> float:
+        return self.speed * self.scale
+
+    def moves(self):
+        # the logic as a generator (None if it overrides execute instead): yields (steps, offsets)
+        # to move, receiving the steps moved, secs to hold the position or Rest secs to wait disabled
+        return None
+
     def execute(self):
-        raise Exception
+        # runs the moves blocking on the stepper (the MotorDriver submits them to the scheduler instead)
+        moves = self.moves()
+        if moves is None:
+            raise NotImplementedError(str(self) + " has neither moves nor execute")
+        stepper = self.stepper
+        enabled = False
+        reply = None
+        try:
+            while not stepper.is_interrupted():
+                try:
+                    item = moves.send(reply)
+                except StopIteration:
+                    break
+                reply = None
+                if isinstance(item, Rest):
+                    if enabled:
+                        stepper.disable()
+                        enabled = False
+                    stepper.wait(item)
+                    continue
+                if not enabled:
+                    stepper.enable()
+                    enabled = True
+                if isinstance(item, tuple):
+                    reply = stepper.rotate_by_offsets(*item)
+                else:
+                    stepper.wait(item)
+        finally:
+            moves.close()
+            if enabled:
+                stepper.disable()
     
-    def run(self):
-        print("AsteriskLogic: start logic:", self)
-        self.stepper.clear()
+    def run(self, clear: bool=True):
+        self.log.info("start logic")
+        if clear:
+            self.stepper.clear()
+        self._set_labels()
         while not self.stepper.is_interrupted():
-            started = time.time()
+            started = self.stepper.clock.time()
             # execute the logic
             self.execute()
             # wait if the exec time is less than 0.5sec
-            wait_time = 0.5 - (time.time()-started)
+            wait_time = 0.5 - (self.stepper.clock.time()-started)
             if wait_time > 0:
-                print("AsteriskLogic: wait:", wait_time)
+                self.log.debug("wait:", wait_time)
                 self.stepper.wait(wait_time)
 
+    def drive(self):
+        # run() as a generator of moves (None if the logic has no moves); the driver closes it
+        # on an interrupt
+        if type(self).moves is AsteriskLogic.moves:
+            return None
+        return self._drive()
+
+    def _drive(self):
+        self.log.info("start logic")
+        self._set_labels()
+        while True:
+            started = self.stepper.clock.time()
+            yield from self.moves()
+            wait_time = 0.5 - (self.stepper.clock.time()-started)
+            if wait_time > 0:
+                yield Rest(wait_time)
+
+    def _set_labels(self):
+        if self.stepper.telemetry is not None:
+            self.stepper.telemetry.set_label(str(self))
+        if self.stepper.trace is not None:
+            self.stepper.trace.set_label(str(self))
+
+    async def run_async(self, executor):
+        # runs the logic as a coroutine while the pulses are generated in the executor
+        # (the caller clears the interrupt, so an interrupt never gets lost)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(executor, self.run, False)
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # returns after the pulses have stopped
+            self.stepper.interrupt()
+            await asyncio.wait([future])
+            raise
+
 # ----------------------------------------------------------------------
 # モールス符号の動きをするロジック
 # ----------------------------------------------------------------------
 class MorseLogic(AsteriskLogic):
-    morse_map = {
-        "A" : ".-",
-        "B" : "-...",
-        "C" : "-.-.",
-        "D" : "-..",
-        "E" : ".",
-        "F" : "..-.",
-        "G" : "--.",
-        "H" : "....",
-        "I" : "..",
-        "J" : ".---",
-        "K" : "-.-",
-        "L" : ".-..",
-        "M" : "--",
-        "N" : "-.",
-        "O" : "---",
-        "P" : ".--.",
-        "Q" : "--.-",
-        "R" : ".-.",
-        "S" : "...",
-        "T" : "-",
-        "U" : "..-",
-        "V" : "...-",
-        "W" : ".--",
-        "X" : "-..-",
-        "Y" : "-.--",
-        "Z" : "--..",
-        "1" : ".----",
-        "2" : "..---",
-        "3" : "...--",
-        "4" : "....-",
-        "5" : ".....",
-        "6" : "-....",
-        "7" : "--...",
-        "8" : "---..",
-        "9" : "----.",
-        "0" : "-----",
-        "." : ".-.-.-",
-        "," : "--..--",
-        "?" : "..--..",
-        "!" : "-.-.--",
-        "/" : "-..-.",
-        "(" : "-.--.",
-        ")" : "-.--.-",
-        "&" : ".-...",
-        ":" : "---...",
-        ";" : "-.-.-.",
-        "=" : "-...-",
-        "+" : ".-.-.",
-        "-" : "-....-",
-        "_" : "..--.-",
-        "\"" : ".-..-.",
-        "@" : ".--.-.",
-        " " : "/"
-    }
-
-    def _encode_morse(self, message):
-        encoded = ""
-        for char in message[:]:
-            encoded += self.morse_map[char.upper()] + " "
-        return encoded[:-1]
+    scale = 2.5
+    morse_map = MORSE_MAP
+
+    def _encode_morse(self, message, strict: bool=True):
+        if not strict:
+            # skip characters without morse codes
+            message = [char for char in message if char.upper() in self.morse_map]
+        return " ".join(self.morse_map[char.upper()] for char in message)
 
     def __init__(self, stepper):
         super().__init__(stepper)
-        config = AsteriskConfig()
-        scale = 2.5
-        self.set_message(config.get('MorseLogic.message'))
-        self.speed = config.get('MorseLogic.speed', float) / scale
-        self.dot_steps = config.get('MorseLogic.steps', int)
+        self.source_spec = None
+        self.source = None
+        self.configure()
+
+    def configure(self):
+        config = AsteriskConfig().snapshot.MorseLogic
+        self.dot_steps = config.steps
+        self.easing = config.easing
+        self.message = config.message
+        self.set_speed(config.speed)
+        if config.source != self.source_spec:
+            if self.source is not None:
+                self.source.close()
+            self.source_spec = config.source
+            # shared with the next MorseLogic when this one is released
+            self.source = open_source(config.source)
+        self.log.info("configured", message=self.message, speed=self.get_speed())
+
+    def set_speed(self, speed: float):
+        super().set_speed(speed)
         self.dot_interval = self.stepper.base_time / self.speed * self.dot_steps
-        print("MorseLogic [", "message:", self.message, ", speed:", self.speed * scale, "]")
+        self.set_message(self.message)
 
     def set_message(self, message):
         self.message = message
         self.morse = self._encode_morse(message)
+        self.program = compile_morse(self.morse, self.dot_steps, self.dot_interval)
 
-    def execute(self):
-        print("MorseLogic: message:", self.message)
-        #print("MorseLogic: morse:", self.morse)
-        #print("MorseLogic:", "steps:", self.dot_steps, ", interval:", self.dot_interval)
-        for ch in list(self.morse):
-            print(ch, flush=True, end='')
-            if (ch == '.'):
-                self.stepper.rotate_by_steps(self.dot_steps, self.speed)
-                self.stepper.wait(self.dot_interval)
-            elif (ch == '-'):
-                self.stepper.rotate_by_steps(self.dot_steps*3, self.speed)
-                self.stepper.wait(self.dot_interval)
-            elif (ch == ' '):
-                self.stepper.wait(self.dot_interval*2) # 3-1
-            else:
-                self.stepper.wait(self.dot_interval*4) # 7-3
-
-            if self.stepper.is_interrupted():
+    def moves(self):
+        if self.source is not None:
+            yield from self.stream_moves()
+            return
+        self.log.info("message:", self.message)
+        yield from self._plan(self.program).moves()
+
+    def stream_moves(self):
+        # transmits words of the source until it runs dry, picking up new lines between words
+        self.source.start()
+        words = 0
+        while True:
+            program = self._next_word()
+            if program is None:
                 break
-        print('', flush=True)
-        self.stepper.wait(self.dot_interval*8) # 15-7
+            yield from self._plan(program).moves()
+            words += 1
+        if words == 0:
+            yield Rest(self.dot_interval*8)
+
+    def _next_word(self) -> tuple:
+        # the compiled next word of the source with morse codes (None when it runs dry)
+        while True:
+            word = self.source.next_word()
+            if word is None:
+                return None
+            morse = self._encode_morse(word, strict=False)
+            if morse:
+                self.log.info("word:", word)
+                # a word followed by an inter-word gap
+                return compile_morse(morse + " /", self.dot_steps, self.dot_interval, 0)
+
+    def _plan(self, program: tuple) -> MotionPlanner:
+        # the compiled segments: rotate and hold (the driver stays enabled)
+        planner = MotionPlanner(self.stepper)
+        for steps, hold in zip(*program):
+            planner.move_by(steps, self.speed, self.easing).hold(hold)
+        return planner
+
+@lru_cache(maxsize=256)
+def compile_morse(morse: str, dot_steps: int, dot_interval: float, tail: int=8) -> tuple:
+    # compiles morse codes into segments of (steps, hold secs) with merged gaps
+    # dot: 1, dash: 3, inter-elem: 1, inter-letters: 3, inter-words: 7, end of message: 15
+    gaps = {'.': 1, '-': 1, ' ': 2, '/': 4} # 3-1, 7-3
+    steps = array('i')
+    units = []
+    for ch in morse:
+        if ch in '.-':
+            steps.append(dot_steps if ch == '.' else dot_steps*3)
+            units.append(0)
+        elif not steps:
+            # a leading gap
+            steps.append(0)
+            units.append(0)
+        units[-1] += gaps[ch]
+    if not steps:
+        steps.append(0)
+        units.append(0)
+    units[-1] += tail # end of message: 15-7
+    return steps, array('d', (dot_interval*unit for unit in units))
 
 # ----------------------------------------------------------------------
 # 1年のうちの今位置に移動するロジック
 # ----------------------------------------------------------------------
 class YearLogic(AsteriskLogic):
+    max_sleep = 600 # secs to sleep at once, to follow wall clock jumps
+    margin = 0.001 # secs after a step boundary to wake up at
+
     def __init__(self, stepper, target=None):
         super().__init__(stepper)
         self.target = target
-        self.speed = AsteriskConfig().get('YearLogic.speed', float)
-        print("YearLogic [", "target:", target, "]")
+        self.configure()
 
-    def execute(self):
-        now = datetime.now() if self.target == None else self.target
-        begin = datetime(now.year, 1, 1)
-        last  = datetime(now.year+1, 1, 1)
+    def configure(self):
+        config = AsteriskConfig().snapshot.YearLogic
+        self.set_speed(config.speed)
+        self.easing = config.easing
+        self.log.info("configured", target=self.target)
+
+    def moves(self):
+        angle, wakeup = self._angle()
+        step = int(self.stepper.number_of_steps*angle/2.0)
+        yield from MotionPlanner(self.stepper).move_to(step, self.speed, self.easing).moves()
+        if wakeup is None:
+            yield Rest(self.max_sleep)
+            return
+        # waits on the monotonic clock in slices and re-reads the wall clock after each one,
+        # so a wall clock jump (NTP, manual setting) moves the wakeup within max_sleep secs
+        clock = self.stepper.clock
+        while True:
+            remaining = wakeup - clock.time()
+            if remaining <= 0:
+                return
+            started_wall, started = clock.time(), clock.monotonic_ns()
+            yield Rest(min(remaining, self.max_sleep))
+            drift = (clock.time()-started_wall) - (clock.monotonic_ns()-started)/1000000000
+            if abs(drift) > 1.0:
+                self.log.warning("wall clock jumped:", drift, "secs")
+
+    def _angle(self) -> tuple:
+        # the angle of now in the year and the wall clock secs of the next step boundary
+        # (None for a fixed target); elapsed secs of the year are not affected by DST
+        now = self.stepper.clock.time() if self.target == None else self.target.timestamp()
+        year = datetime.fromtimestamp(now).year
+        begin = datetime(year, 1, 1).timestamp()
+        last  = datetime(year+1, 1, 1).timestamp()
         angle = 2.0 * (now-begin) / (last-begin)
-        print("YearLogic: angle:", angle)
-        self.stepper.set_angle(angle, self.speed)
-        self.stepper.wait(10)
+        self.log.info("angle:", angle)
+        if self.target != None:
+            return angle, None
+        number_of_steps = self.stepper.number_of_steps
+        step = int(number_of_steps*(now-begin)/(last-begin))
+        return angle, begin + (step+1)*(last-begin)/number_of_steps + self.margin
 
 # ----------------------------------------------------------------------
 # 回転運動するロジック
 # ----------------------------------------------------------------------
 class FlucLogic(AsteriskLogic):
+    scale = 3
+    chunk_steps = 1024
+
     def __init__(self, stepper):
         super().__init__(stepper)
-        scale = 3
-        self.fluctuate = AsteriskConfig().get('FlucLogic.fluctuate', bool)
-        self.rate = AsteriskConfig().get('FlucLogic.rate', float)
-        self.speed = AsteriskConfig().get('FlucLogic.speed', float) / scale
-        print("FlucLogic [", "speed:", self.speed*scale, "]")
+        self.configure()
 
-    def execute(self):
-        fluc = 0.4
-        self.stepper.enable()
-        while not self.stepper.is_interrupted():
-            started = time.time()
-            self.stepper.step(1)
+    def configure(self):
+        config = AsteriskConfig().snapshot.FlucLogic
+        self.fluctuate = config.fluctuate
+        self.rate = config.rate
+        self.set_speed(config.speed)
+        self.easing = config.easing
+        self.log.info("configured", speed=self.get_speed())
+
+    def generate(self, delays: array, fluc: float, index: int, ramp: list) -> float:
+        # fills delays after each step with the intermittent chaotic map and returns the last fluc
+        interval = self.stepper.base_time/self.speed
+        rate, fluctuate = self.rate, self.fluctuate
+        for i in range(len(delays)):
             fluc = fluc+2*fluc*fluc if fluc < 0.5 else fluc-2*(1-fluc)*(1-fluc)
-            wait_time = (self.stepper.base_time/self.speed)
-            if self.fluctuate:
-                wait_time = wait_time*(1-self.rate+fluc*self.rate)
-            wait_time = wait_time-(time.time()-started)
-            self.stepper.wait(wait_time)
-        self.stepper.disable()
+            wait_time = interval
+            if index+i < len(ramp):
+                wait_time = wait_time/ramp[index+i]
+            if fluctuate:
+                wait_time = wait_time*(1-rate+fluc*rate)
+            delays[i] = wait_time
+        return fluc
+
+    def moves(self):
+        fluc = 0.4
+        # accelerate from standstill along the 1st half of the easing profile
+        ramp = velocity_profile(RAMP_STEPS*2, self.easing)[:RAMP_STEPS].tolist()
+        delays = array('d', bytes(8*self.chunk_steps))
+        index = 0
+        while True:
+            # hands each chunk to the stepper as one timed batch
+            fluc = self.generate(delays, fluc, index, ramp)
+            yield len(delays), delay_offsets(delays)
+            index += len(delays)
@@ -1,14 +1,34 @@
 # -*- coding: utf-8 -*-
 
+import argparse
+import math
+import os
 import uuid
 import signal
-from threading import Thread, Event, Timer
+from datetime import datetime
+from threading import Thread, Event, Timer, current_thread
 from typing import List
-from importlib import import_module
 
-from asterisk_mirror.config import AsteriskConfig
+from asterisk_mirror.config import _CONFIG_FILE, AsteriskConfig, ConfigWatcher
+from asterisk_mirror.clock import Clock
 from asterisk_mirror.stepper import Stepper
-from asterisk_mirror.logics import MorseLogic, YearLogic, FlucLogic
+from asterisk_mirror.process import ProcessStepper
+from asterisk_mirror.realtime import apply_realtime, parse_cpus
+from asterisk_mirror.gpio import create_backend
+from asterisk_mirror.telemetry import StepTelemetry, MetricsServer
+from asterisk_mirror.control import ControlServer
+from asterisk_mirror.runtime import AsyncRuntime
+from asterisk_mirror.scheduler import StepScheduler, SchedulerStepper
+from asterisk_mirror.motors import MotorDriver, load_motors
+from asterisk_mirror.state import StateFile, restore
+from asterisk_mirror.sensor import GPIOSensor
+from asterisk_mirror.trace import TraceRecorder
+from asterisk_mirror.log import get_logger, configure as configure_log, flush as flush_log
+from asterisk_mirror.showplan import ShowPlanner, format_report
+from asterisk_mirror.registry import LogicRegistry, LazyLogic
+from asterisk_mirror.watchdog import Watchdog, SceneStalled, raise_in_thread
+
+log = get_logger('AsteriskMirror')
 
 # innner methods
 def _merge_dict(source: str, destination: str):
@@ -22,70 +42,395 @@ def _merge_dict(source: str, destination: str):
 
 # AsteriskMirror
 class AsteriskMirror:
-    def __init__(self):
+    def __init__(self, clock=None):
         # configurations
         config = AsteriskConfig()
+        self.configure_log()
+        self.clock = Clock() if clock is None else clock
         self.stop_event = Event()
+        # wakes the timer to restart its interval (a logic selected or stopping)
+        self.timer_event = Event()
+        # cleared while paused
+        self.resume_event = Event()
+        self.resume_event.set()
+        self.selected_index = None
+        self.started_at = None
         self.main_thread = None
         self.timer_thread = None
-        self.stepper = Stepper([config.get('System.step_pin', int), config.get('System.direction_pin', int), config.get('System.enable_pin', int)])
+        self.realtime = {
+            'policy': config.get('System.realtime'),
+            'priority': config.get('System.priority', int),
+            'cpus': parse_cpus(config.get('System.cpus')),
+            'lock_memory': config.get('System.lock_memory', bool),
+        }
+        pins = [config.get('System.step_pin', int), config.get('System.direction_pin', int), config.get('System.enable_pin', int)]
+        # one scheduler thread generates the pulses of all motors if more motors are configured
+        self.scheduler = None
+        if any(section.startswith('Motor:') for section in config.snapshot.configs):
+            self.scheduler = StepScheduler(self.clock)
+        home = None
+        if config.get('System.home_pin'):
+            home = {'pin': config.get('System.home_pin', int), 'active_low': config.get('System.home_active_low', bool)}
+        mode_pins = config.get('System.mode_pins')
+        microsteps = {
+            'microsteps': config.get('System.microsteps', int),
+            'mode_pins': [int(pin) for pin in mode_pins.split(',')] if mode_pins else None,
+            'coarse_microsteps': config.get('System.coarse_microsteps', int),
+            'coarse_interval': config.get('System.coarse_interval', float),
+        }
+        if config.get('System.process', bool):
+            # generates pulses in a dedicated process
+            self.stepper = ProcessStepper(pins, backend=config.get('System.gpio'), realtime=self.realtime, home=home, microsteps=microsteps)
+        else:
+            if self.scheduler is not None:
+                self.stepper = SchedulerStepper(self.scheduler, pins, backend=create_backend(config.get('System.gpio')))
+            else:
+                self.stepper = Stepper(pins, backend=create_backend(config.get('System.gpio')), clock=self.clock)
+            self.stepper.configure_microsteps(**microsteps)
+            if home is not None:
+                self.stepper.sensor = GPIOSensor(self.stepper.backend, **home)
+        self.homing = home is not None
+        self.home_interval = config.get('System.home_interval', float)
+        self.homed_at = None
+        self.registry = LogicRegistry()
+        self.motors = load_motors(self.scheduler, self.registry) if self.scheduler is not None else []
+        self.driver = MotorDriver(self.scheduler, self.motors) if self.motors else None
+        state_file = config.get('System.state_file')
+        if state_file:
+            # resumes from the recorded positions instead of assuming 0
+            if restore(self.stepper, StateFile(state_file)):
+                # a clean shutdown needs no homing at startup
+                self.homed_at = self.clock.time()
+            for motor in self.motors:
+                if restore(motor.stepper, StateFile(state_file + "." + motor.name)):
+                    motor.homed_at = self.clock.time()
         self.transition = config.get('System.transition', int)
+        self.metrics_server = None
+        if isinstance(self.stepper, ProcessStepper) and (config.get('Telemetry.enabled', bool) or config.get('Trace.file')):
+            # the steps happen in the child process where nothing records them
+            log.warning("no telemetry or trace of a stepper process")
+        elif config.get('Telemetry.enabled', bool):
+            self.stepper.telemetry = StepTelemetry(config.get('Telemetry.capacity', int))
+            if config.get('Telemetry.listen'):
+                self.metrics_server = MetricsServer(self.stepper.telemetry, config.get('Telemetry.listen'))
+        if config.get('Trace.file') and not isinstance(self.stepper, ProcessStepper):
+            self.stepper.trace = TraceRecorder(config.get('Trace.file'), config.get('Trace.max_bytes', int),
+                config.get('Trace.backups', int), self.stepper.clock)
+        if config.get('Trace.file'):
+            for motor in self.motors:
+                motor.stepper.trace = TraceRecorder(config.get('Trace.file') + "." + motor.name,
+                    config.get('Trace.max_bytes', int), config.get('Trace.backups', int), motor.stepper.clock)
+        self.control_server = None
+        if config.get('Control.listen'):
+            self.control_server = ControlServer(self, config.get('Control.listen'))
         self.logics = []
         self.logic_index = -1
+        self.generation = config.generation
+        self.watcher = ConfigWatcher(config, config.get('System.reload_interval', float))
+        self.runtime = AsyncRuntime(self) if config.get('System.runtime') == 'asyncio' else None
+        # heartbeats of the transition timer, the scene and the moves (see supervise)
+        self.watchdog = None
+        if config.get('Watchdog.timeout', float) > 0:
+            self.watchdog = Watchdog(config.get('Watchdog.timeout', float), config.get('Watchdog.interval', float),
+                self.escalate, self.clock)
+            self.stepper.watchdog = self.watchdog
 
-        # load and append logics
-        module = import_module('asterisk_mirror.logics')
+        # logics are imported and constructed when their scenes become active
         for logic_str in config.get('System.logics').split(','):
-            logic_cls = getattr(module, logic_str.strip())
-            logic = logic_cls(self.stepper)
-            self.logics.append(logic)
+            self.logics.append(LazyLogic(self.registry, logic_str.strip(), self.stepper))
 
-        print("AsteriskMirror [", "transition:", self.transition, "]")
+        log.info("started", transition=self.transition)
         
     def start(self):
         if self.main_thread is not None:
-            print("AsteriskMirror: already started.")
+            log.warning("already started.")
+            return
+        log.info("starting...")
+        self.started_at = self.clock.time()
+        if self.scheduler is not None:
+            self.scheduler.start(self.realtime)
+        if self.runtime is not None:
+            # scenes, servers and the config watcher run on one event loop
+            self.stop_event.clear()
+            if self.driver is not None:
+                self.driver.start(self)
+            self.runtime.start()
+            self.main_thread = self.runtime.thread
             return
-        print ("AsteriskMirror: starting...")
         # renew threads
         if self.timer_thread is not None:
             self.stop_event.set()
         self.timer_thread = Thread(target=self.timer_run)
         self.stop_event.clear()
         self.main_thread = Thread(target=self.run)
+        if self.driver is not None:
+            self.driver.start(self)
 
         # start threads
         self.main_thread.start()
         self.timer_thread.start()
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+        if self.control_server is not None:
+            self.control_server.start()
+        self.watcher.start()
 
     def stop(self):
-        print("AsteriskMirror: stopping...")
+        log.info("stopping...")
         self.stop_event.set()
+        self.timer_event.set()
+        self.resume_event.set()
+        # the scenes stop before the steppers exit and record their positions
+        self.stepper.interrupt()
+        for motor in self.motors:
+            motor.stepper.interrupt()
+        if self.runtime is not None:
+            self.runtime.stop()
+        elif self.main_thread is not None and self.main_thread is not current_thread():
+            self.main_thread.join(1.0)
+        if self.driver is not None:
+            self.driver.stop()
         self.stepper.exit()
+        for motor in self.motors:
+            motor.stepper.exit()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        self.clock.notify()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.control_server is not None:
+            self.control_server.stop()
+        self.watcher.stop()
         self.timer_thread = None
         self.main_thread = None
 
     def timer_run(self):
         while not self.stop_event.is_set():
-            # set a new index of logics
+            self.beat('timer', self.transition)
+            self.timer_event.clear()
+            self.next_logic()
+            # interrupt stepper thread and main thread (the scene stops in timeout secs)
+            self.beat('logic')
+            self.stepper.interrupt()
+            self.clock.wait(self.timer_event, self.transition)
+        self.idle('timer')
+
+    def next_logic(self):
+        # set a new index of logics (or the selected one)
+        if self.selected_index is None:
             self.logic_index = (self.logic_index+1)%len(self.logics)
-            print("AsteriskMirror: changes logic:", self.logics[self.logic_index])
-            # interrupt stepper thread and main thread
+        else:
+            self.logic_index, self.selected_index = self.selected_index, None
+        log.info("changes logic:", self.logics[self.logic_index])
+        for index, logic in enumerate(self.logics):
+            if index != self.logic_index:
+                logic.release()
+        for motor in self.motors:
+            motor.next_logic()
+
+    # ------------------------------------------------------------------
+    # runtime controls (see control.py)
+    # ------------------------------------------------------------------
+    def _find_logic(self, name: str):
+        for index, logic in enumerate(self.logics):
+            if str(logic) == name:
+                return index, logic
+        raise ValueError("unknown logic: " + name)
+
+    def select_logic(self, name: str):
+        # jumps to the logic now and restarts the transition interval
+        self.selected_index, _ = self._find_logic(name)
+        self.timer_event.set()
+        self._notify()
+
+    def set_message(self, message: str):
+        index, logic = self._find_logic('MorseLogic')
+        if any(char.upper() not in logic.morse_map for char in message):
+            raise ValueError("no morse codes for: " + message)
+        logic.set_message(message)
+        if index == self.logic_index:
+            # restarts the scene with the new message
             self.stepper.interrupt()
-            self.stop_event.wait(self.transition)
+
+    def set_speed(self, speed: float, name: str=None):
+        if not math.isfinite(speed) or speed <= 0:
+            raise ValueError("speed must be positive")
+        if name is None:
+            if self.logic_index < 0:
+                raise ValueError("no logic is running")
+            index, logic = self.logic_index, self.logics[self.logic_index]
+        else:
+            index, logic = self._find_logic(name)
+        logic.set_speed(speed)
+        if index == self.logic_index:
+            self.stepper.interrupt()
+
+    def pause(self):
+        self.resume_event.clear()
+        self.stepper.interrupt()
+        for motor in self.motors:
+            motor.stepper.interrupt()
+
+    def resume(self):
+        self.resume_event.set()
+        for motor in self.motors:
+            # wakes the idle motors
+            motor.stepper.interrupt()
+        self._notify()
+
+    def _notify(self):
+        self.clock.notify()
+        if self.runtime is not None:
+            self.runtime.notify()
+
+    def state(self) -> dict:
+        logic = self.logics[self.logic_index] if self.logic_index >= 0 else None
+        state = {
+            'logic': str(logic) if logic is not None else None,
+            'index': self.logic_index,
+            'logics': [str(each) for each in self.logics],
+            'position': self.stepper.current_step,
+            'paused': not self.resume_event.is_set(),
+            'uptime': self.clock.time() - self.started_at if self.started_at is not None else 0.0,
+            'transition': self.transition,
+            # the constructed logics only
+            'speeds': {str(each): each.get_speed() for each in self.logics if each.loaded},
+            'motors': {motor.name: motor.state() for motor in self.motors},
+            'imports': dict(self.registry.import_times),
+        }
+        configs = AsteriskConfig().snapshot.configs
+        for each in self.logics:
+            # a released logic reads its message again when constructed
+            if each.loaded and hasattr(each.logic, 'message'):
+                state['message'] = each.logic.message
+            elif 'set_message' in each.overrides:
+                state['message'] = each.overrides['set_message'][0]
+            elif 'message' in configs.get(str(each), {}):
+                state['message'] = configs[str(each)]['message']
+        return state
+
+    def home(self):
+        # finds the home position at startup, then every home_interval secs between scenes
+        if not self.homing:
+            return
+        if self.homed_at is not None and (self.home_interval <= 0 or self.clock.time()-self.homed_at < self.home_interval):
+            return
+        self.homed_at = self.clock.time()
+        self.stepper.clear()
+        self.stepper.rotate_to_balance()
+
+    def apply_config(self):
+        # applies a reloaded config snapshot to the logics (pins and logics need a restart)
+        config = AsteriskConfig()
+        if config.generation == self.generation:
+            return
+        log.info("applies config generation:", config.generation)
+        self.generation = config.generation
+        self.configure_log()
+        self.transition = config.snapshot.System.transition
+        for logic in self.logics:
+            logic.configure()
+
+    def configure_log(self):
+        config = AsteriskConfig().snapshot.Log
+        configure_log(config.level, config.sink, config.rate, config.capacity)
 
     def run(self):
         #print("AsteriskMirror.run starting...")
-        while not self.stop_event.is_set():
-            if self.logic_index >= 0 and len(self.logics) > 0:
-                logic = self.logics[self.logic_index]
-                logic.run()
-            else:
-                # wait until a right logic-index will be set
-                self.stop_event.wait(1)
+        if not isinstance(self.stepper, ProcessStepper) and self.scheduler is None:
+            # this thread generates pulses
+            apply_realtime(**self.realtime)
+        while True:
+            # the whole iteration catches a stall raised at any instruction of this thread
+            try:
+                if self.stop_event.is_set():
+                    break
+                # the previous scene has stopped here
+                self.idle('logic')
+                if not self.resume_event.is_set():
+                    # paused (the scenes keep changing; the current one starts on resume)
+                    self.clock.wait(self.resume_event, 1)
+                elif self.logic_index >= 0 and len(self.logics) > 0:
+                    # a scene transition
+                    self.home()
+                    self.apply_config()
+                    # cleared before checking the state again: a pause or a transition from here interrupts the scene
+                    self.stepper.clear()
+                    logic = self.logics[self.logic_index]
+                    if self.resume_event.is_set():
+                        logic.run(clear=False)
+                else:
+                    # wait until a right logic-index will be set (timer_run interrupts the stepper)
+                    self.clock.wait(self.stepper.interrupt_event, 1)
+            except SceneStalled:
+                # raised by the watchdog (the logic is constructed again)
+                if self.logic_index >= 0:
+                    log.warning("restarts the scene:", self.logics[self.logic_index])
+                    self.logics[self.logic_index].release()
+
+    # ------------------------------------------------------------------
+    # supervision (see watchdog.py)
+    # ------------------------------------------------------------------
+    def beat(self, name: str, within: float=0.0):
+        if self.watchdog is not None:
+            self.watchdog.beat(name, within)
+
+    def idle(self, name: str):
+        if self.watchdog is not None:
+            self.watchdog.idle(name)
+
+    def scene_thread(self) -> int:
+        # ident of the thread running the logics
+        if self.runtime is not None:
+            return self.runtime.worker
+        return self.main_thread.ident if self.main_thread is not None else None
+
+    def escalate(self, name: str, action: str):
+        # called by the watchdog on a stalled heartbeat, one more action each timeout
+        if action == 'interrupt':
+            self.stepper.interrupt()
+            for motor in self.motors:
+                motor.stepper.interrupt()
+            self.timer_event.set()
+            self._notify()
+        elif action == 'restart':
+            # a stalled timer is left to the exit
+            if name == 'timer' or not raise_in_thread(self.scene_thread()):
+                log.warning("cannot restart the scene:", name)
+        else:
+            # the service manager starts it again
+            log.error("exits on a stalled heartbeat:", name)
+            flush_log()
+            os._exit(1)
+
+    def supervise(self):
+        # blocks until stopped, checking the heartbeats (called by main)
+        if self.watchdog is not None:
+            self.watchdog.run(self.stop_event)
+        else:
+            while not self.stop_event.wait(1):
+                pass
 
 # main
-def main():
+def main(argv: list=None):
+    parser = argparse.ArgumentParser(prog='asterisk_mirror', description='runs the asterisk mirror')
+    commands = parser.add_subparsers(dest='command')
+    plan_parser = commands.add_parser('plan', help='computes the timings of the scenes without moving')
+    plan_parser.add_argument('--config', action='append', help='config files (default: ' + _CONFIG_FILE + ')')
+    plan_parser.add_argument('--horizon', type=float, default=86400, help='secs to plan')
+    plan_parser.add_argument('--start', help='wall clock to start at (e.g. 2024-06-01T12:00, default: now)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'plan':
+        # the report alone on stdout
+        configure_log(sink='stderr')
+        config = AsteriskConfig().load(args.config or [_CONFIG_FILE]).snapshot.Log
+        configure_log(config.level, 'stderr', config.rate, config.capacity)
+        start = datetime.fromisoformat(args.start).timestamp() if args.start else None
+        report = ShowPlanner().plan(args.horizon, start)
+        print(format_report(report))
+        return 0
+
     AsteriskConfig()
     mirror = AsteriskMirror()
     mirror.start()
@@ -95,6 +440,8 @@ def main():
         mirror.stop()
     signal.signal(signal.SIGINT, handler)
     signal.signal(signal.SIGTERM, handler)
+    mirror.supervise()
+    return 0
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
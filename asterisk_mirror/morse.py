@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+# morse codes of the characters MorseLogic can send (imported by the config checks without the logics)
+MORSE_MAP = {
+    "A" : ".-",
+    "B" : "-...",
+    "C" : "-.-.",
+    "D" : "-..",
+    "E" : ".",
+    "F" : "..-.",
+    "G" : "--.",
+    "H" : "....",
+    "I" : "..",
+    "J" : ".---",
+    "K" : "-.-",
+    "L" : ".-..",
+    "M" : "--",
+    "N" : "-.",
+    "O" : "---",
+    "P" : ".--.",
+    "Q" : "--.-",
+    "R" : ".-.",
+    "S" : "...",
+    "T" : "-",
+    "U" : "..-",
+    "V" : "...-",
+    "W" : ".--",
+    "X" : "-..-",
+    "Y" : "-.--",
+    "Z" : "--..",
+    "1" : ".----",
+    "2" : "..---",
+    "3" : "...--",
+    "4" : "....-",
+    "5" : ".....",
+    "6" : "-....",
+    "7" : "--...",
+    "8" : "---..",
+    "9" : "----.",
+    "0" : "-----",
+    "." : ".-.-.-",
+    "," : "--..--",
+    "?" : "..--..",
+    "!" : "-.-.--",
+    "/" : "-..-.",
+    "(" : "-.--.",
+    ")" : "-.--.-",
+    "&" : ".-...",
+    ":" : "---...",
+    ";" : "-.-.-.",
+    "=" : "-...-",
+    "+" : ".-.-.",
+    "-" : "-....-",
+    "_" : "..--.-",
+    "\"" : ".-..-.",
+    "@" : ".--.-.",
+    " " : "/"
+}
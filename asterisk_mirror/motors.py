@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+from threading import Thread
+
+from asterisk_mirror.config import AsteriskConfig
+from asterisk_mirror.gpio import create_backend
+from asterisk_mirror.planner import Rest
+from asterisk_mirror.scheduler import SchedulerStepper
+from asterisk_mirror.sensor import GPIOSensor
+from asterisk_mirror.registry import LogicRegistry, LazyLogic
+from asterisk_mirror.log import get_logger
+
+log = get_logger('Motor')
+
+# Motor
+# Usage:
+#  [Motor:left]           # in the config file
+#  step_pin = 20
+#  direction_pin = 21
+#  enable_pin = 16
+#  logics = FlucLogic, YearLogic  # System.logics if omitted
+#
+#  motors = load_motors(scheduler, LogicRegistry())  # one Motor for each [Motor:name] section
+#  driver = MotorDriver(scheduler, motors)
+#  driver.start(mirror)  # one thread drives the logics of all motors
+#
+class Motor:
+    def __init__(self, name: str, stepper, logics: list):
+        self.name = name
+        self.stepper = stepper
+        self.logics = logics
+        self.logic_index = -1
+        self.generation = AsteriskConfig().generation
+        self.homed_at = None
+        self.program = None # moves of the current logic (see AsteriskLogic.drive)
+        self.parts = [] # parts of the current move left to submit (see Stepper._segments)
+        self.move = None # the part on the scheduler
+        self.moved = 0
+        self.held_until = None # monotonic ns the current hold ends at
+        self.enabled = False
+        self.thread = None # runs a logic without moves (see _begin)
+        self.halted = False # the current logic has failed
+        log.info("configured", name=name, logics=[str(logic) for logic in logics])
+
+    def __str__(self) -> str:
+        return "Motor(" + self.name + ")"
+
+    def next_logic(self):
+        # follows the scene transitions of the mirror with its own rotation
+        self.logic_index = (self.logic_index+1)%len(self.logics)
+        for index, logic in enumerate(self.logics):
+            if index != self.logic_index:
+                logic.release()
+        self.halted = False
+        self.stepper.interrupt()
+
+    def apply_config(self):
+        config = AsteriskConfig()
+        if config.generation == self.generation:
+            return
+        self.generation = config.generation
+        for logic in self.logics:
+            logic.configure()
+
+    def home(self, interval: float):
+        # same as AsteriskMirror.home for the sensor of this motor
+        if self.stepper.sensor is None:
+            return
+        if self.homed_at is not None and (interval <= 0 or self.stepper.clock.time()-self.homed_at < interval):
+            return
+        self.homed_at = self.stepper.clock.time()
+        self.stepper.clear()
+        self.stepper.rotate_to_balance()
+
+    def advance(self, mirror) -> float:
+        # drives the moves of the current logic as far as they go without waiting and returns
+        # the secs until the next call (None: when the scheduler changes)
+        stepper = self.stepper
+        if self.move is not None:
+            if not self.move.done.is_set():
+                return None
+            self.moved += stepper.step_size * self.move.actual_steps
+            self.move = None
+        if self.thread is not None:
+            if self.thread.is_alive():
+                return None
+            self.thread = None
+        idle = mirror.stop_event.is_set() or not mirror.resume_event.is_set()
+        if stepper.is_interrupted() or idle:
+            self._end()
+        if idle or self.logic_index < 0 or self.halted:
+            return None
+        reply = None
+        if self.program is None:
+            if not self._begin(mirror):
+                return None
+        elif self.parts:
+            self._submit()
+            return None
+        elif self.held_until is not None:
+            remaining = self.held_until - stepper.clock.monotonic_ns()
+            if remaining > 0:
+                return remaining/1000000000
+            self.held_until = None
+        else:
+            # all parts of the move are done
+            stepper.set_step_size(1)
+            stepper.save_state()
+            reply = self.moved
+        try:
+            item = self.program.send(reply)
+        except StopIteration:
+            self._end()
+            return 0
+        except Exception as e:
+            log.error("logic failed:", self.logics[self.logic_index], motor=self.name, error=repr(e))
+            self._end()
+            self.halted = True
+            return None
+        # enabled to move or hold the position, disabled to rest (as AsteriskLogic.execute does)
+        enables = not isinstance(item, Rest)
+        if enables != self.enabled:
+            self.enabled = enables
+            stepper.enable(enables)
+        if isinstance(item, tuple):
+            steps, offsets = item
+            self.parts = stepper._segments(steps, offsets)
+            self.moved = 0
+            self._submit()
+            return None
+        self.held_until = stepper.clock.monotonic_ns() + int(item*1000000000)
+        return item
+
+    def _begin(self, mirror) -> bool:
+        # homes and reconfigures before the logic starts, as the logic loop of the mirror does
+        # (homing blocks the driver)
+        self.home(mirror.home_interval)
+        self.apply_config()
+        logic = self.logics[self.logic_index]
+        self.stepper.clear()
+        self.program = logic.drive()
+        if self.program is None:
+            # a logic with execute only blocks: it runs on a thread of its own until interrupted
+            self.thread = Thread(target=self._run, args=(logic,), daemon=True)
+            self.thread.start()
+            return False
+        return True
+
+    def _run(self, logic):
+        try:
+            logic.run(False)
+        except Exception as e:
+            log.error("logic failed:", logic, motor=self.name, error=repr(e))
+            self.halted = True
+        finally:
+            # wakes the driver
+            self.stepper.scheduler.notify()
+
+    def _submit(self):
+        size, steps, offsets = self.parts.pop(0)
+        self.stepper.set_step_size(size)
+        self.move = self.stepper.scheduler.submit(self.stepper, steps, offsets)
+
+    def _end(self):
+        if self.program is None:
+            return
+        self.program.close()
+        self.program = None
+        self.parts = []
+        self.held_until = None
+        self.stepper.set_step_size(1)
+        self.stepper.save_state()
+        if self.enabled:
+            self.enabled = False
+            self.stepper.disable()
+
+    def state(self) -> dict:
+        return {
+            'logic': str(self.logics[self.logic_index]) if self.logic_index >= 0 else None,
+            'position': self.stepper.current_step,
+        }
+
+# ----------------------------------------------------------------------
+# 全モータのロジックを1つのスレッドで進めるドライバ
+# ----------------------------------------------------------------------
+class MotorDriver:
+    # the scheduler thread generates the pulses; this thread submits the moves of all motors
+    # and sleeps until a move ends, a hold is over or a stepper is interrupted
+    def __init__(self, scheduler, motors: list):
+        self.scheduler = scheduler
+        self.motors = motors
+        self.running = False
+        self.thread = None
+
+    def start(self, mirror):
+        if self.thread is None and self.motors:
+            self.running = True
+            self.thread = Thread(target=self.run, args=(mirror,), daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.scheduler.notify()
+        if self.thread is not None:
+            self.thread.join(1.0)
+            self.thread = None
+
+    def run(self, mirror):
+        changed = self.scheduler.changed
+        while self.running:
+            # cleared first: a move ending meanwhile wakes the next wait
+            changed.clear()
+            timeouts = [motor.advance(mirror) for motor in self.motors]
+            timeouts = [timeout for timeout in timeouts if timeout is not None]
+            self.scheduler.clock.wait(changed, min(timeouts, default=1.0))
+
+def load_motors(scheduler, registry: LogicRegistry) -> list:
+    config = AsteriskConfig().snapshot
+    motors = []
+    for section in config.configs:
+        if not section.startswith('Motor:'):
+            continue
+        values = getattr(config, section)
+        pins = [values.step_pin, values.direction_pin, values.enable_pin]
+        backend = create_backend(values.gpio if 'gpio' in values else config.System.gpio)
+        stepper = SchedulerStepper(scheduler, pins, backend=backend)
+        mode_pins = values.mode_pins if 'mode_pins' in values else None
+        stepper.configure_microsteps(values.microsteps if 'microsteps' in values else config.System.microsteps,
+            [int(pin) for pin in mode_pins.split(',')] if mode_pins else None,
+            config.System.coarse_microsteps, config.System.coarse_interval)
+        if 'home_pin' in values:
+            stepper.sensor = GPIOSensor(backend, values.home_pin, config.System.home_active_low)
+        names = values.logics if 'logics' in values else config.System.logics
+        logics = [LazyLogic(registry, name.strip(), stepper) for name in names.split(',')]
+        motors.append(Motor(section.split(':', 1)[1], stepper, logics))
+    return motors
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+from functools import lru_cache
+
+from asterisk_mirror.easing import RAMP_STEPS, delay_table, velocity_profile
+
+class Rest(float):
+    # secs to wait with the driver disabled, yielded by AsteriskLogic.moves (plain secs hold the position)
+    pass
+
+# MotionPlanner
+# Usage:
+#  planner = MotionPlanner(stepper)
+#  planner.move_to(800, 2.0, 'trapezoid')  # absolute: the shorter way round
+#  planner.move_by(40).move_by(40)         # merged into one move of 80 steps
+#  planner.hold(0.5)                       # keeps the driver enabled
+#  planner.execute()
+#  yield from planner.moves()             # or moves and holds of AsteriskLogic.moves
+#
+def shortest_steps(current: int, target: int, number_of_steps: int) -> int:
+    # relative steps from current to target in the shorter direction (forward on a tie)
+    steps = (target - current) % number_of_steps
+    return steps if steps <= number_of_steps//2 else steps - number_of_steps
+
+@lru_cache(maxsize=128)
+def blend(segments: tuple, easing: str='linear', base_time: float=0.001) -> array:
+    # cumulative step deadlines (ns) of same-direction ((steps, speed), ...) segments moved as one:
+    # ramps only at both ends and interpolates the speed across the joints
+    speeds = array('d')
+    for steps, speed in segments:
+        speeds.extend([speed]*abs(steps))
+    joint = 0
+    for (steps_a, speed_a), (steps_b, speed_b) in zip(segments, segments[1:]):
+        joint += abs(steps_a)
+        window = min(RAMP_STEPS//2, abs(steps_a)//2, abs(steps_b)//2)
+        for i in range(-window, window):
+            speeds[joint+i] = speed_a + (speed_b-speed_a)*(i+window+0.5)/(2*window)
+    profile = velocity_profile(len(speeds), easing)
+    offsets = array('q', bytes(8*len(speeds)))
+    elapsed = 0.0
+    for i in range(len(speeds)):
+        elapsed += base_time/speeds[i]/profile[i]*1000000000
+        offsets[i] = int(elapsed)
+    return offsets
+
+class MotionPlanner:
+    def __init__(self, stepper):
+        self.stepper = stepper
+        self.segments = [] # [steps, speed, easing, hold secs]
+        self.position = stepper.current_step
+
+    def move_to(self, step: int, speed: float=1.0, easing: str='linear'):
+        return self.move_by(shortest_steps(self.position, step, self.stepper.number_of_steps), speed, easing)
+
+    def move_by(self, steps: int, speed: float=1.0, easing: str='linear'):
+        if steps == 0:
+            return self
+        self.position = (self.position+steps) % self.stepper.number_of_steps
+        last = self.segments[-1] if self.segments else None
+        if last is not None and last[0] != 0 and last[3] == 0 and (last[0] > 0) == (steps > 0) and last[1:3] == [speed, easing]:
+            # back-to-back moves of the same kind
+            last[0] += steps
+        else:
+            self.segments.append([steps, speed, easing, 0.0])
+        return self
+
+    def hold(self, secs: float):
+        if secs > 0:
+            if not self.segments:
+                self.segments.append([0, 1.0, 'linear', 0.0])
+            self.segments[-1][3] += secs
+        return self
+
+    def plan(self) -> list:
+        # (steps, offsets, hold secs) of each run: same-direction segments without holds in between
+        runs = []
+        run = []
+        for segment in self.segments:
+            steps, _, _, hold = segment
+            if run and (steps == 0 or (run[-1][0] > 0) != (steps > 0)):
+                runs.append(self._run(run))
+                run = []
+            if steps == 0:
+                runs.append((0, None, hold))
+                continue
+            run.append(segment)
+            if hold > 0:
+                runs.append(self._run(run))
+                run = []
+        if run:
+            runs.append(self._run(run))
+        return runs
+
+    def _run(self, run: list) -> tuple:
+        steps = sum(segment[0] for segment in run)
+        if len(run) == 1:
+            offsets = delay_table(abs(steps), run[0][1], run[0][2], self.stepper.base_time).tolist()
+        else:
+            offsets = blend(tuple((segment[0], segment[1]) for segment in run), run[0][2], self.stepper.base_time).tolist()
+        return steps, offsets, run[-1][3]
+
+    def moves(self):
+        # the planned runs as (steps, offsets) moves and hold secs (see AsteriskLogic.moves)
+        for steps, offsets, hold in self.plan():
+            if steps != 0:
+                yield steps, offsets
+            if hold > 0:
+                yield hold
+        self.segments = []
+
+    def execute(self) -> int:
+        # moves the planned runs with the driver enabled throughout and returns the steps moved
+        stepper = self.stepper
+        moved = 0
+        if not stepper.plans:
+            # the stepper takes whole moves only
+            for steps, speed, easing, hold in self.segments:
+                moved += stepper.rotate_by_steps(steps, speed, easing)
+                stepper.wait(hold)
+                if stepper.is_interrupted():
+                    break
+        else:
+            stepper.enable()
+            for steps, offsets, hold in self.plan():
+                if steps != 0:
+                    moved += stepper._transit(steps, offsets)
+                if hold > 0 and not stepper.is_interrupted():
+                    stepper.wait(hold)
+                if stepper.is_interrupted():
+                    break
+            stepper.save_state()
+            stepper.disable()
+        self.segments = []
+        self.position = stepper.current_step
+        return moved
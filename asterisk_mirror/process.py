@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import struct
+from multiprocessing import shared_memory
+from threading import Lock
+
+from asterisk_mirror.easing import EASINGS
+from asterisk_mirror.gpio import create_backend
+from asterisk_mirror.realtime import apply_realtime
+from asterisk_mirror.sensor import GPIOSensor
+from asterisk_mirror.stepper import Stepper, offset_delays
+from asterisk_mirror.log import get_logger
+
+log = get_logger('ProcessStepper')
+
+# shared memory layout
+_HEADER = struct.Struct('<qqqq')    # head, tail, current_step, pid
+_SLOT = struct.Struct('<iiqdq')     # op, easing, steps, speed, result
+_DELAY = 'd'                        # secs after each step of rotate_by_delays, after the ring
+
+_OP_STEP = 1
+_OP_ROTATE = 2
+_OP_ENABLE = 3
+_OP_POSITION = 4
+_OP_EXIT = 5
+_OP_HOME = 6
+_OP_DELAYS = 7
+
+# ProcessStepper
+# Usage:
+#  stepper = ProcessStepper([13, 19, 9], backend='rpi')  # pulses are generated in a child process
+#  stepper.rotate_by_steps(100)
+#  stepper.exit()
+#
+class ProcessStepper(Stepper):
+    # commands carry whole moves, not planned offsets
+    plans = False
+
+    def __init__(self, pins: list=[13, 19, 9], base_time: float=0.001, backend: str='rpi', capacity: int=64, realtime: dict=None, home: dict=None, microsteps: dict=None, delay_capacity: int=4096):
+        # no commands until the ring is ready (Stepper.__init__ sets the position)
+        self.shm = None
+        self._lock = Lock()
+        super().__init__(pins, base_time, multiprocessing.Event(), backend)
+        # the child process switches the microsteps
+        self.microsteps = microsteps['microsteps'] if microsteps else 8
+        self.number_of_steps = 200 * self.microsteps
+        self.coarse_microsteps = self.microsteps
+
+        # command ring and delays of rotate_by_delays on shared memory
+        self.capacity = capacity
+        self.delay_capacity = delay_capacity
+        self.shm = shared_memory.SharedMemory(create=True, size=_HEADER.size+_SLOT.size*capacity+8*delay_capacity)
+        _HEADER.pack_into(self.shm.buf, 0, 0, 0, 0, 0)
+        self._delay_lock = Lock()
+        self._head = 0
+        self._last_step = 0
+        self._done = multiprocessing.Semaphore(0)
+        self._commands = multiprocessing.Semaphore(0)
+        self.process = multiprocessing.Process(target=_run, daemon=True,
+            args=(self.shm.name, pins, base_time, backend, capacity, self.interrupt_event, self._commands, self._done, realtime, home, microsteps))
+        self.process.start()
+        self._header(3, self.process.pid)
+
+        log.info("started", pid=self.process.pid, backend=backend, capacity=capacity)
+
+    def setup_backend(self, backend: str):
+        # the child process owns the pins
+        self.backend = None
+
+    def _header(self, index: int, value: int=None) -> int:
+        offset = index*8
+        if value is not None:
+            struct.pack_into('<q', self.shm.buf, offset, value)
+        return struct.unpack_from('<q', self.shm.buf, offset)[0]
+
+    def _enqueue(self, op: int, steps: int=0, speed: float=1.0, easing: str='linear') -> int:
+        with self._lock:
+            if self.shm is None:
+                return 0
+            # wait for a free slot
+            while self._head - self._header(1) >= self.capacity:
+                self._done.acquire(timeout=0.1)
+            offset = _HEADER.size + _SLOT.size*(self._head % self.capacity)
+            _SLOT.pack_into(self.shm.buf, offset, op, EASINGS.index(easing), steps, speed, 0)
+            self._head += 1
+            self._header(0, self._head)
+            self._commands.release()
+            return self._head
+
+    def _result(self, seq: int) -> int:
+        # waits until the command is done and returns its result
+        while self.shm is not None and self._header(1) < seq:
+            self._done.acquire(timeout=0.1)
+        if self.shm is None:
+            return 0
+        offset = _HEADER.size + _SLOT.size*((seq-1) % self.capacity)
+        return _SLOT.unpack_from(self.shm.buf, offset)[4]
+
+    @property
+    def current_step(self) -> int:
+        return self._header(2) if self.shm is not None else self._last_step
+
+    @current_step.setter
+    def current_step(self, step: int):
+        self._result(self._enqueue(_OP_POSITION, step))
+
+    def exit(self):
+        self.interrupt()
+        # disable and stop the child process
+        if self._enqueue(_OP_EXIT) == 0:
+            return
+        with self._lock:
+            shm, self.shm = self.shm, None
+        self.process.join(1.0)
+        if self.process.is_alive():
+            self.process.terminate()
+        self._last_step = struct.unpack_from('<q', shm.buf, 16)[0]
+        shm.close()
+        shm.unlink()
+        if self.state is not None:
+            self.state.close(self._last_step, self.number_of_steps)
+
+    def enable(self, enables: bool=True):
+        self._enqueue(_OP_ENABLE, int(enables))
+
+    def step(self, dir: int=1):
+        self._enqueue(_OP_STEP, dir)
+
+    def rotate_by_steps(self, steps: int, speed: float=1.0, easing: str='linear') -> int:
+        if steps == 0:
+            return 0
+        actual_steps = self._result(self._enqueue(_OP_ROTATE, steps, speed, easing))
+        self.save_state()
+        return actual_steps
+
+    def rotate_by_delays(self, delays, dir: int=1) -> int:
+        # hands the delays to the child in chunks of the shared delay buffer
+        moved = 0
+        with self._delay_lock:
+            for begin in range(0, len(delays), self.delay_capacity):
+                chunk = delays[begin:begin+self.delay_capacity]
+                if self.shm is None:
+                    break
+                struct.pack_into('<%d%s' % (len(chunk), _DELAY), self.shm.buf, _HEADER.size+_SLOT.size*self.capacity, *chunk)
+                moved += self._result(self._enqueue(_OP_DELAYS, dir*len(chunk)))
+                if self.is_interrupted():
+                    break
+        self.save_state()
+        return moved
+
+    def rotate_by_offsets(self, steps: int, offsets: list) -> int:
+        if steps == 0:
+            return 0
+        return self.rotate_by_delays(offset_delays(offsets), 1 if steps > 0 else -1)
+
+    def rotate_to_balance(self) -> int:
+        moved = self._result(self._enqueue(_OP_HOME))
+        self.save_state()
+        return moved
+
+# ----------------------------------------------------------------------
+# 子プロセスでパルスを生成するループ
+# ----------------------------------------------------------------------
+class _SharedStepper(Stepper):
+    def __init__(self, shm, *args, **kwargs):
+        self.shm = shm
+        super().__init__(*args, **kwargs)
+
+    def step(self, dir: int=1):
+        super().step(dir)
+        # shares the position on every step
+        struct.pack_into('<q', self.shm.buf, 16, self.current_step)
+
+def _run(name: str, pins: list, base_time: float, backend: str, capacity: int, interrupt_event, commands, done, realtime: dict=None, home: dict=None, microsteps: dict=None):
+    if realtime:
+        apply_realtime(**realtime)
+    shm = shared_memory.SharedMemory(name=name)
+    stepper = _SharedStepper(shm, pins, base_time, interrupt_event, create_backend(backend))
+    if microsteps:
+        stepper.configure_microsteps(**microsteps)
+    if home:
+        stepper.sensor = GPIOSensor(stepper.backend, **home)
+    tail = 0
+    while True:
+        commands.acquire()
+        offset = _HEADER.size + _SLOT.size*(tail % capacity)
+        op, easing, steps, speed, _ = _SLOT.unpack_from(shm.buf, offset)
+        result = 0
+        if op == _OP_STEP:
+            stepper.step(steps)
+        elif op == _OP_ROTATE:
+            result = stepper.rotate_by_steps(steps, speed, EASINGS[easing])
+        elif op == _OP_ENABLE:
+            stepper.enable(bool(steps))
+        elif op == _OP_HOME:
+            result = stepper.rotate_to_balance()
+        elif op == _OP_DELAYS:
+            delays = struct.unpack_from('<%d%s' % (abs(steps), _DELAY), shm.buf, _HEADER.size+_SLOT.size*capacity)
+            result = stepper.rotate_by_delays(delays, 1 if steps > 0 else -1)
+        elif op == _OP_POSITION:
+            stepper.current_step = steps % stepper.number_of_steps
+        elif op == _OP_EXIT:
+            break
+        struct.pack_into('<q', shm.buf, offset+_SLOT.size-8, result)
+        struct.pack_into('<q', shm.buf, 16, stepper.current_step)
+        tail += 1
+        struct.pack_into('<q', shm.buf, 8, tail)
+        done.release()
+    stepper.disable()
+    stepper.backend.cleanup()
+    shm.close()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import ctypes
+import ctypes.util
+import os
+
+from asterisk_mirror.log import get_logger
+
+log = get_logger('Realtime')
+
+# mlockall(2) flags
+_MCL_CURRENT = 1
+_MCL_FUTURE = 2
+
+_POLICIES = {
+    'fifo': 'SCHED_FIFO',
+    'rr': 'SCHED_RR',
+}
+
+# Real-time guarantees for the stepping thread or process
+# Usage:
+#  obtained = apply_realtime(policy='fifo', priority=50, cpus=[3], lock_memory=True)
+#  # {'policy': 'fifo', 'priority': 50, 'cpus': [3], 'lock_memory': True}
+#
+def set_scheduler(policy: str, priority: int) -> bool:
+    # sets the policy of the calling thread (0 = the calling thread on linux)
+    if policy not in _POLICIES or not hasattr(os, 'sched_setscheduler'):
+        return False
+    policy_id = getattr(os, _POLICIES[policy])
+    low, high = os.sched_get_priority_min(policy_id), os.sched_get_priority_max(policy_id)
+    priority = max(low, min(high, priority))
+    try:
+        os.sched_setscheduler(0, policy_id, os.sched_param(priority))
+    except (OSError, PermissionError) as e:
+        log.warning("cannot set", _POLICIES[policy], error=e)
+        return False
+    return True
+
+def set_affinity(cpus: list) -> bool:
+    if not cpus or not hasattr(os, 'sched_setaffinity'):
+        return False
+    try:
+        os.sched_setaffinity(0, cpus)
+    except (OSError, ValueError) as e:
+        log.warning("cannot pin to cpus", cpus, error=e)
+        return False
+    return True
+
+def set_memory_lock() -> bool:
+    name = ctypes.util.find_library('c')
+    if name is None:
+        return False
+    libc = ctypes.CDLL(name, use_errno=True)
+    if libc.mlockall(_MCL_CURRENT | _MCL_FUTURE) != 0:
+        log.warning("cannot lock memory", error=os.strerror(ctypes.get_errno()))
+        return False
+    return True
+
+def apply_realtime(policy: str='none', priority: int=50, cpus: list=None, lock_memory: bool=False) -> dict:
+    # applies the settings to the calling thread and returns the guarantees actually obtained
+    obtained = {}
+    if policy != 'none' and set_scheduler(policy, priority):
+        obtained['policy'] = policy
+        obtained['priority'] = os.sched_getparam(0).sched_priority
+    if cpus and set_affinity(cpus):
+        obtained['cpus'] = sorted(os.sched_getaffinity(0))
+    if lock_memory and set_memory_lock():
+        obtained['lock_memory'] = True
+    log.info("applied", requested={'policy': policy, 'priority': priority, 'cpus': cpus, 'lock_memory': lock_memory}, obtained=obtained)
+    return obtained
+
+def parse_cpus(value: str) -> list:
+    # '2,3' or '0-3' -> [2, 3] or [0, 1, 2, 3]
+    cpus = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if '-' in item:
+            first, last = item.split('-', 1)
+            cpus += range(int(first), int(last)+1)
+        elif item:
+            cpus.append(int(item))
+    return cpus
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import time
+from importlib import import_module, metadata
+
+from asterisk_mirror.log import get_logger
+
+log = get_logger('LogicRegistry')
+
+# LogicRegistry
+# Usage:
+#  registry = LogicRegistry()         # the built-in logics and the 'asterisk_mirror.logics' entry points
+#  logic = LazyLogic(registry, 'FlucLogic', stepper)
+#  logic.run()                        # imported and constructed when its scene becomes active
+#  logic.release()                    # another scene is active
+#
+#  # setup.py of a package with more logics
+#  entry_points={'asterisk_mirror.logics': ['TideLogic = asterisk_tide:TideLogic']}
+#
+class LogicRegistry:
+    group = 'asterisk_mirror.logics'
+    builtins = {
+        'MorseLogic': 'asterisk_mirror.logics:MorseLogic',
+        'YearLogic': 'asterisk_mirror.logics:YearLogic',
+        'FlucLogic': 'asterisk_mirror.logics:FlucLogic',
+    }
+
+    def __init__(self):
+        self.specs = dict(self.builtins)
+        self.classes = {}
+        # msecs to import each logic
+        self.import_times = {}
+        for entry_point in _entry_points(self.group):
+            if entry_point.name in self.specs:
+                log.warning("ignored a logic of the same name:", entry_point.name, value=entry_point.value)
+                continue
+            self.specs[entry_point.name] = entry_point
+
+    def names(self) -> list:
+        return list(self.specs)
+
+    def check(self, name: str):
+        if name not in self.specs:
+            raise ValueError("unknown logic: " + name)
+
+    def load(self, name: str):
+        # the logic class, imported on first use
+        if name not in self.classes:
+            self.check(name)
+            spec = self.specs[name]
+            started = time.perf_counter()
+            if isinstance(spec, str):
+                module, attr = spec.split(':')
+                logic_cls = getattr(import_module(module), attr)
+            else:
+                logic_cls = spec.load()
+            self.import_times[name] = (time.perf_counter()-started)*1000
+            self.classes[name] = logic_cls
+            log.info("imported", name, msecs=round(self.import_times[name], 3))
+        return self.classes[name]
+
+    def create(self, name: str, stepper):
+        return self.load(name)(stepper)
+
+def _entry_points(group: str) -> list:
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        return list(entry_points.select(group=group))
+    return list(entry_points.get(group, [])) # python < 3.10
+
+# ----------------------------------------------------------------------
+# シーンが始まるまで作らないロジック
+# ----------------------------------------------------------------------
+class LazyLogic:
+    # stands for a logic of the registry: constructed when its scene becomes active and
+    # released when another one does (speeds and messages set meanwhile are applied again)
+
+    def __init__(self, registry: LogicRegistry, name: str, stepper):
+        registry.check(name)
+        self.registry = registry
+        self.name = name
+        self.stepper = stepper
+        self.logic = None
+        self.overrides = {}
+
+    def __str__(self) -> str:
+        return self.name
+
+    def __getattr__(self, key: str):
+        # other attributes of the logic (e.g. message, morse_map)
+        if key.startswith('_') or key in ('registry', 'name', 'stepper', 'logic', 'overrides'):
+            raise AttributeError(key)
+        return getattr(self.get(), key)
+
+    @property
+    def loaded(self) -> bool:
+        return self.logic is not None
+
+    def get(self):
+        if self.logic is None:
+            logic = self.registry.create(self.name, self.stepper)
+            for method, args in self.overrides.items():
+                getattr(logic, method)(*args)
+            self.logic = logic
+        return self.logic
+
+    def release(self):
+        if self.logic is not None:
+            log.debug("released", self.name)
+            self.logic.release()
+            self.logic = None
+
+    def configure(self):
+        # a reloaded config replaces the overrides; a released logic reads it when constructed
+        self.overrides = {}
+        if self.logic is not None:
+            self.logic.configure()
+
+    def set_speed(self, speed: float):
+        self._override('set_speed', speed)
+
+    def set_message(self, message: str):
+        self._override('set_message', message)
+
+    def _override(self, method: str, *args):
+        getattr(self.get(), method)(*args)
+        self.overrides[method] = args
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, get_ident
+
+from asterisk_mirror.process import ProcessStepper
+from asterisk_mirror.realtime import apply_realtime
+from asterisk_mirror.watchdog import SceneStalled
+from asterisk_mirror.log import get_logger
+
+log = get_logger('AsyncRuntime')
+
+# AsyncRuntime
+# Usage:
+#  runtime = AsyncRuntime(mirror)  # System.runtime = asyncio
+#  runtime.start()  # the transition timer, servers and config watcher share one loop
+#  runtime.stop()
+#
+class AsyncRuntime:
+    def __init__(self, mirror):
+        self.mirror = mirror
+        self.loop = None
+        self.thread = None
+        self.executor = None
+        self.worker = None
+        self.scene = None
+        self.changed = None
+        self.stopping = None
+
+    def start(self):
+        mirror = self.mirror
+        pulses = not isinstance(mirror.stepper, ProcessStepper) and mirror.scheduler is None
+        def initializer():
+            # the watchdog restarts a scene stalled in this thread
+            self.worker = get_ident()
+            if pulses:
+                # the executor thread generates pulses
+                apply_realtime(**mirror.realtime)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stepper', initializer=initializer)
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self._run)
+        self.thread.start()
+
+    def stop(self, timeout: float=5.0):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._stop)
+            self.thread.join(timeout)
+
+    def notify(self):
+        # wakes the coroutines to check the state of the mirror (called from other threads)
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._notify)
+
+    def _run(self):
+        try:
+            self.loop.run_until_complete(self.main())
+        finally:
+            self.loop.close()
+
+    def _stop(self):
+        self.stopping.set()
+
+    def _notify(self):
+        self.changed.set()
+
+    async def main(self):
+        mirror = self.mirror
+        self.changed = asyncio.Event()
+        self.stopping = asyncio.Event()
+        servers = [server for server in (mirror.metrics_server, mirror.control_server) if server is not None]
+        for server in servers:
+            server.attach(self.loop)
+        tasks = [asyncio.ensure_future(self.transitions()), asyncio.ensure_future(self.watch_config())]
+        try:
+            await self.stopping.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.cancel_scene()
+            for server in servers:
+                server.detach(self.loop)
+            self.executor.shutdown(wait=False)
+
+    async def transitions(self):
+        mirror = self.mirror
+        while True:
+            mirror.beat('timer', mirror.transition)
+            mirror.timer_event.clear()
+            mirror.next_logic()
+            # the scene stops in timeout secs
+            mirror.beat('logic')
+            await self.cancel_scene()
+            mirror.idle('logic')
+            self.scene = asyncio.ensure_future(self.run_scene(mirror.logics[mirror.logic_index]))
+            # waits for the transition or a selected logic
+            deadline = self.loop.time() + mirror.transition
+            while True:
+                self.changed.clear()
+                if mirror.timer_event.is_set() or self.loop.time() >= deadline:
+                    break
+                await self.wait_changed(deadline - self.loop.time())
+
+    async def cancel_scene(self):
+        if self.scene is not None:
+            self.scene.cancel()
+            await asyncio.gather(self.scene, return_exceptions=True)
+            self.scene = None
+
+    async def run_scene(self, logic):
+        mirror = self.mirror
+        while True:
+            self.changed.clear()
+            if not mirror.resume_event.is_set():
+                # paused
+                await self.wait_changed()
+                continue
+            try:
+                # the previous scene has stopped here
+                await self.loop.run_in_executor(self.executor, mirror.home)
+                mirror.apply_config()
+                # cleared before checking the pause again: a pause from here interrupts the scene
+                mirror.stepper.clear()
+                if not mirror.resume_event.is_set():
+                    continue
+                # returns when the scene is restarted or paused by the control api
+                await logic.run_async(self.executor)
+            except SceneStalled:
+                # raised by the watchdog (the logic is constructed again)
+                log.warning("restarts the scene:", logic)
+                logic.release()
+
+    async def wait_changed(self, timeout: float=None):
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def watch_config(self):
+        watcher = self.mirror.watcher
+        if watcher.interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(watcher.interval)
+            watcher.check()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+from threading import Event, Condition, Thread
+
+from asterisk_mirror.clock import Clock
+from asterisk_mirror.realtime import apply_realtime
+from asterisk_mirror.stepper import Stepper
+from asterisk_mirror.log import get_logger
+
+log = get_logger('StepScheduler')
+
+# StepScheduler
+# Usage:
+#  scheduler = StepScheduler()
+#  left = SchedulerStepper(scheduler, [13, 19, 9])
+#  right = SchedulerStepper(scheduler, [20, 21, 16])
+#  scheduler.start()
+#  left.rotate_by_steps(400)  # blocks the caller; pulses come from the scheduler thread
+#  # phase-locked moves starting at the same deadline
+#  moves = scheduler.group([(left, 400, offsets), (right, -400, offsets)])
+#
+class _Move:
+    def __init__(self, stepper, steps: int, offsets: list, start: int, until=None):
+        self.stepper = stepper
+        self.until = until
+        self.dir = 1 if steps > 0 else -1
+        self.steps = abs(steps)
+        self.offsets = offsets
+        # the first step is due at start, the (i+1)th at start+offsets[i]
+        self.start = start
+        self.index = 0
+        self.late_steps = 0
+        self.max_lag = offsets[-1]//len(offsets)*stepper.max_lag_steps
+        self.done = Event()
+
+    @property
+    def actual_steps(self) -> int:
+        return self.dir * self.index
+
+    def deadline(self) -> int:
+        return self.start + (self.offsets[self.index-1] if self.index > 0 else 0)
+
+class StepScheduler:
+    # merges the step deadlines of several motors into one timeline served by one thread
+    def __init__(self, clock=None):
+        self.clock = Clock() if clock is None else clock
+        self.lead = 1000000 # ns from a group submission to its first step
+        self.thread = None
+        self.running = False
+        self._heap = []
+        self._cond = Condition()
+        self._wake = Event()
+        self.changed = Event() # set when a move ends or a stepper is interrupted (wakes the MotorDriver)
+        self._sequence = itertools.count()
+
+    def start(self, realtime: dict=None):
+        if self.thread is None:
+            self.running = True
+            self.thread = Thread(target=self.run, args=(realtime,), daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        self.notify()
+        if self.thread is not None:
+            self.thread.join(1.0)
+            self.thread = None
+        # releases the callers of moves left behind
+        for _, _, move in self._heap:
+            move.done.set()
+        self._heap = []
+
+    def notify(self):
+        # wakes the scheduler thread to check new moves or interrupts
+        self._wake.set()
+        self.changed.set()
+        self.clock.notify()
+
+    def submit(self, stepper, steps: int, offsets: list, start: int=None, until=None) -> _Move:
+        return self.group([(stepper, steps, offsets)], start, until)[0]
+
+    def group(self, moves: list, start: int=None, until=None) -> list:
+        # (stepper, steps, offsets) moves whose first steps share the start deadline (ns)
+        if start is None:
+            start = self.clock.monotonic_ns() + (self.lead if len(moves) > 1 else 0)
+        moves = [_Move(stepper, steps, offsets, start, until) for stepper, steps, offsets in moves]
+        with self._cond:
+            for move in moves:
+                heapq.heappush(self._heap, (start, next(self._sequence), move))
+            self._cond.notify_all()
+        self.notify()
+        return moves
+
+    def run(self, realtime: dict=None):
+        if realtime:
+            apply_realtime(**realtime)
+        while True:
+            with self._cond:
+                while self.running and not self._heap:
+                    self._cond.wait()
+                if not self.running:
+                    break
+                self._wake.clear()
+                self._drop_interrupted()
+                if not self._heap:
+                    continue
+                deadline, _, move = self._heap[0]
+            remaining = deadline - self.clock.monotonic_ns()
+            if remaining > 0:
+                # an earlier move or an interrupt may arrive while waiting
+                self.clock.wait(self._wake, remaining/1000000000)
+                continue
+            with self._cond:
+                heapq.heappop(self._heap)
+            self._step(move, deadline)
+            if move.index < move.steps and not (move.until is not None and move.until()):
+                with self._cond:
+                    heapq.heappush(self._heap, (move.deadline(), next(self._sequence), move))
+            else:
+                self._finish(move)
+
+    def _step(self, move: _Move, deadline: int):
+        stepper = move.stepper
+        now = self.clock.monotonic_ns()
+        if stepper.telemetry is not None:
+            stepper.telemetry.record(deadline, now)
+        if move.index > 0 and now > deadline:
+            # catch up by stepping at once, or resync if too far behind
+            move.late_steps += 1
+            if now - deadline > move.max_lag:
+                move.start += now - deadline
+        stepper.step(move.dir)
+        if stepper.trace is not None:
+            stepper.trace.record(now, move.dir*stepper.step_size)
+        move.index += 1
+
+    def _drop_interrupted(self):
+        interrupted = [entry for entry in self._heap if entry[2].stepper.is_interrupted()]
+        if interrupted:
+            self._heap = [entry for entry in self._heap if not entry[2].stepper.is_interrupted()]
+            heapq.heapify(self._heap)
+            for _, _, move in interrupted:
+                log.debug("interrupted:", move.stepper)
+                self._finish(move)
+
+    def _finish(self, move: _Move):
+        if move.late_steps > 0:
+            move.stepper.missed_deadlines += move.late_steps
+            if move.stepper.telemetry is not None:
+                move.stepper.telemetry.miss(move.late_steps)
+            log.warning("behind schedule", late=move.late_steps, steps=move.index)
+        move.done.set()
+        self.changed.set()
+        self.clock.notify()
+
+# ----------------------------------------------------------------------
+# スケジューラにステップを任せるステッパ
+# ----------------------------------------------------------------------
+class SchedulerStepper(Stepper):
+    def __init__(self, scheduler: StepScheduler, pins: list=[13, 19, 9], base_time: float=0.001, interrupt_event=None, backend=None):
+        self.scheduler = scheduler
+        super().__init__(pins, base_time, interrupt_event, backend, scheduler.clock)
+
+    def __str__(self) -> str:
+        return "SchedulerStepper(" + str(self.step_pin) + ")"
+
+    def interrupt(self):
+        super().interrupt()
+        self.scheduler.notify()
+
+    def _rotate(self, steps: int, offsets: list, until=None) -> int:
+        move = self.scheduler.submit(self, steps, offsets, until=until)
+        self.clock.wait(move.done)
+        return move.actual_steps
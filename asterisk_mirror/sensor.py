@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+from asterisk_mirror.log import get_logger
+
+log = get_logger('GPIOSensor')
+
+# Home sensors (end-stop or hall sensor)
+# Usage:
+#  stepper.sensor = GPIOSensor(stepper.backend, 26)  # active low with a pull-up
+#  stepper.rotate_to_balance()  # finds the home position
+#
+class Sensor:
+    def triggered(self) -> bool:
+        return False
+
+class GPIOSensor(Sensor):
+    def __init__(self, backend, pin: int, active_low: bool=True):
+        self.backend = backend
+        self.pin = pin
+        self.active_low = active_low
+        backend.setup_input(pin)
+        log.info("configured", pin=pin, active_low=active_low, backend=backend)
+
+    def triggered(self) -> bool:
+        return self.backend.input(self.pin) != self.active_low
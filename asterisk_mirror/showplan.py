@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+
+from asterisk_mirror.config import AsteriskConfig
+from asterisk_mirror.easing import RAMP_STEPS, delay_table, velocity_profile
+from asterisk_mirror.gpio import create_backend
+from asterisk_mirror.planner import shortest_steps
+from asterisk_mirror.registry import LogicRegistry
+from asterisk_mirror.stepper import Stepper
+
+# ShowPlanner
+# Usage:
+#  AsteriskConfig().load(['/boot/asterisk-mirror.cfg'])
+#  report = ShowPlanner().plan(86400)  # scenes and totals of a day, without moving
+#
+#  $ asterisk_mirror plan --config /boot/asterisk-mirror.cfg --horizon 86400
+#
+class ShowPlanner:
+    sample_steps = 65536 # FlucLogic steps generated before extrapolating at their mean interval
+
+    def __init__(self):
+        config = AsteriskConfig()
+        # the configured logics on a stepper that never pulses
+        self.stepper = Stepper(backend=create_backend('recording'))
+        self.stepper.configure_microsteps(config.get('System.microsteps', int))
+        self.transition = config.get('System.transition', int)
+        self.logics = []
+        registry = LogicRegistry()
+        for logic_str in config.get('System.logics').split(','):
+            name = logic_str.strip()
+            if not hasattr(self, '_plan_' + name):
+                raise ValueError("cannot plan logic: " + name)
+            self.logics.append(registry.create(name, self.stepper))
+        self._fluc = {}
+
+    def plan(self, horizon: float, start: float=None) -> dict:
+        # scenes of the horizon (secs) from the start (wall clock secs, default now)
+        start = self.stepper.clock.time() if start is None else start
+        position = 0
+        scenes = []
+        elapsed = 0.0
+        index = 0
+        while elapsed < horizon:
+            logic = self.logics[index % len(self.logics)]
+            duration = min(self.transition, horizon-elapsed)
+            scene = getattr(self, '_plan_' + str(logic))(logic, start+elapsed, duration, position)
+            position = (position + scene.pop('moved')) % self.stepper.number_of_steps
+            scene.update({'logic': str(logic), 'start': elapsed, 'duration': duration})
+            scenes.append(scene)
+            elapsed += duration
+            index += 1
+        return {
+            'horizon': horizon,
+            'transition': self.transition,
+            'scenes': scenes,
+            'steps': sum(scene['steps'] for scene in scenes),
+            'peak_rate': max((scene['peak_rate'] for scene in scenes), default=0.0),
+            'duty_cycle': sum(scene['enabled'] for scene in scenes)/horizon if horizon > 0 else 0.0,
+        }
+
+    def _move(self, steps: int, speed: float, easing: str) -> tuple:
+        # (secs, peak steps/sec) of a move
+        if steps == 0:
+            return 0.0, 0.0
+        offsets = delay_table(abs(steps), speed, easing, self.stepper.base_time)
+        peak = speed/self.stepper.base_time*max(velocity_profile(abs(steps), easing))
+        return offsets[-1]/1000000000, peak
+
+    def _plan_MorseLogic(self, logic, wall: float, duration: float, position: int) -> dict:
+        # the program repeats (with at least 0.5 secs per message) with the driver enabled while replayed
+        base_time = self.stepper.base_time
+        ends = []
+        elapsed = peak = 0.0
+        total = 0
+        for steps, hold in zip(*logic.program):
+            secs, rate = self._move(steps, logic.speed, logic.easing)
+            ends.append((elapsed, elapsed+secs, steps))
+            elapsed += secs + hold
+            total += steps
+            peak = max(peak, rate)
+        replay = elapsed
+        cycle = max(replay, 0.5)
+        cycles = int(duration // cycle)
+        rest = duration - cycles*cycle
+        steps = cycles*total
+        enabled = cycles*replay + min(rest, replay)
+        for begin, end, move in ends:
+            if rest >= end:
+                steps += move
+            elif rest > begin:
+                offsets = delay_table(abs(move), logic.speed, logic.easing, base_time)
+                steps += (1 + bisect_right(offsets, int((rest-begin)*1000000000))) * (1 if move > 0 else -1)
+        return {'steps': abs(steps), 'moved': steps, 'peak_rate': peak if steps else 0.0, 'enabled': enabled,
+            'cycle': replay, 'source': logic.source_spec or None}
+
+    def _plan_YearLogic(self, logic, wall: float, duration: float, position: int) -> dict:
+        # a move to the position of the year, then a step at each step boundary
+        number_of_steps = self.stepper.number_of_steps
+        def step_of(now):
+            year = datetime.fromtimestamp(now).year
+            begin = datetime(year, 1, 1).timestamp()
+            last = datetime(year+1, 1, 1).timestamp()
+            return int(number_of_steps*(now-begin)/(last-begin)) + year*number_of_steps
+        first = step_of(wall)
+        moved = shortest_steps(position, first % number_of_steps, number_of_steps)
+        secs, peak = self._move(moved, logic.speed, logic.easing)
+        boundaries = step_of(wall+duration) - first
+        if boundaries > 0:
+            step_secs, step_peak = self._move(1, logic.speed, logic.easing)
+            secs += boundaries*step_secs
+            peak = max(peak, step_peak)
+        return {'steps': abs(moved)+boundaries, 'moved': moved+boundaries, 'peak_rate': peak, 'enabled': min(secs, duration)}
+
+    def _plan_FlucLogic(self, logic, wall: float, duration: float, position: int) -> dict:
+        # every scene restarts the map, so a scene of the same duration moves the same
+        key = (duration, logic.speed, logic.easing, logic.fluctuate, logic.rate)
+        if key not in self._fluc:
+            self._fluc[key] = self._sample_fluc(logic, duration)
+        steps, peak = self._fluc[key]
+        return {'steps': steps, 'moved': steps, 'peak_rate': peak, 'enabled': duration}
+
+    def _sample_fluc(self, logic, duration: float) -> tuple:
+        ramp = velocity_profile(RAMP_STEPS*2, logic.easing)[:RAMP_STEPS].tolist()
+        delays = array('d', bytes(8*logic.chunk_steps))
+        fluc, index, elapsed, peak = 0.4, 0, 0.0, 0.0
+        ramped = 0.0
+        while index < self.sample_steps:
+            fluc = logic.generate(delays, fluc, index, ramp)
+            for delay in delays:
+                if elapsed + delay > duration:
+                    return index, peak
+                elapsed += delay
+                index += 1
+                peak = max(peak, 1/delay)
+                if index == RAMP_STEPS:
+                    ramped = elapsed
+        # the rest at the mean interval after the ramp
+        mean = (elapsed-ramped) / (index-RAMP_STEPS)
+        return index + int((duration-elapsed)/mean), peak
+
+def format_report(report: dict) -> str:
+    lines = ["%10s  %-12s %10s %10s %12s %8s" % ('start', 'logic', 'secs', 'steps', 'peak steps/s', 'duty')]
+    for scene in report['scenes']:
+        lines.append("%10.1f  %-12s %10.1f %10d %12.1f %7.1f%%" % (scene['start'], scene['logic'], scene['duration'],
+            scene['steps'], scene['peak_rate'], 100*scene['enabled']/scene['duration'] if scene['duration'] else 0.0))
+    totals = {}
+    for scene in report['scenes']:
+        total = totals.setdefault(scene['logic'], [0, 0.0, 0, 0.0])
+        total[0] += 1
+        total[1] += scene['duration']
+        total[2] += scene['steps']
+        total[3] += scene['enabled']
+    for logic, (count, secs, steps, enabled) in totals.items():
+        lines.append("%s: %d scenes, %.1f secs, %d steps, %.1f%% enabled" % (logic, count, secs, steps, 100*enabled/secs if secs else 0.0))
+    lines.append("total: %.1f secs, %d steps, peak %.1f steps/s, %.1f%% enabled" % (report['horizon'], report['steps'],
+        report['peak_rate'], 100*report['duty_cycle']))
+    cycles = {scene['logic']: scene['cycle'] for scene in report['scenes'] if 'cycle' in scene}
+    for logic, cycle in cycles.items():
+        line = "%s: %.1f secs a message" % (logic, cycle)
+        if cycle > report['transition']:
+            line += ", longer than the transition of %d secs: cut off in every scene" % report['transition']
+        lines.append(line)
+    if any(scene.get('source') for scene in report['scenes']):
+        lines.append("note: MorseLogic streams from a source; planned with the configured message")
+    return "\n".join(lines)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+import sys
+from queue import Queue, Empty, Full
+from threading import Event, Thread
+
+from asterisk_mirror.log import get_logger
+
+log = get_logger('MessageSource')
+
+# Message sources for MorseLogic
+# Usage:
+#  source = create_source('file:/home/pi/poem.txt')  # or fifo:/path, stdin, queue
+#  source.start()
+#  source.put("more words")  # any source accepts words from the application
+#  word = source.next_word()  # None if no word is available yet
+#  source = open_source('fifo:/run/asterisk-mirror.fifo')  # shared until closed
+#
+class MessageSource:
+    max_word = 256 # characters
+    max_line = 4096 # characters read at once
+    retry_interval = 5.0 # secs to read again after an error (e.g. a missing file)
+
+    def __init__(self, maxsize: int=256):
+        self.queue = Queue(maxsize)
+        self.closed = Event()
+        self.thread = None
+
+    def __str__(self) -> str:
+        return self.__class__.__name__
+
+    def start(self):
+        if self.thread is None:
+            self.thread = Thread(target=self._read_words, daemon=True)
+            self.thread.start()
+
+    def close(self):
+        self.closed.set()
+
+    def read(self):
+        # generates text chunks from the source
+        return iter(())
+
+    def put(self, text: str):
+        for word in text.split():
+            self.queue.put(word)
+
+    def next_word(self) -> str:
+        try:
+            return self.queue.get_nowait()
+        except Empty:
+            return None
+
+    def _read_words(self):
+        while not self.closed.is_set():
+            try:
+                self._queue_words()
+                return
+            except OSError as e:
+                log.warning("cannot read", self, error=str(e), retry=self.retry_interval)
+                self.closed.wait(self.retry_interval)
+
+    def _queue_words(self):
+        for word in words(self.read(), self.max_word):
+            # blocks while the queue is full to bound the memory
+            while not self.closed.is_set():
+                try:
+                    self.queue.put(word, timeout=0.5)
+                    break
+                except Full:
+                    pass
+            if self.closed.is_set():
+                break
+
+def words(chunks, max_word: int=256):
+    # splits text chunks into words, joining words split across chunks
+    rest = ''
+    for chunk in chunks:
+        text = rest + chunk
+        parts = text.split()
+        rest = parts.pop() if parts and not text[-1].isspace() else ''
+        if len(rest) >= max_word:
+            # no more carried over: a long word is cut at this chunk boundary
+            parts.append(rest)
+            rest = ''
+        yield from parts
+    if rest:
+        yield rest
+
+# ----------------------------------------------------------------------
+# テキストファイル (追記を監視する)
+# ----------------------------------------------------------------------
+class FileSource(MessageSource):
+    def __init__(self, path: str, follow: bool=True, interval: float=1.0):
+        super().__init__()
+        self.path = path
+        self.follow = follow
+        self.interval = interval
+
+    def __str__(self) -> str:
+        return "FileSource(" + self.path + ")"
+
+    def read(self):
+        with open(self.path) as f:
+            while not self.closed.is_set():
+                chunk = f.readline(self.max_line)
+                if chunk:
+                    yield chunk
+                elif self.follow:
+                    # waits for appended lines
+                    self.closed.wait(self.interval)
+                else:
+                    break
+
+# ----------------------------------------------------------------------
+# 名前付きパイプ (書き込み側が閉じたら開き直す)
+# ----------------------------------------------------------------------
+class FifoSource(MessageSource):
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+
+    def __str__(self) -> str:
+        return "FifoSource(" + self.path + ")"
+
+    def read(self):
+        while not self.closed.is_set():
+            # blocks until a writer opens the pipe
+            with open(self.path) as f:
+                while not self.closed.is_set():
+                    chunk = f.readline(self.max_line)
+                    if not chunk:
+                        break
+                    yield chunk
+
+# ----------------------------------------------------------------------
+# 標準入力
+# ----------------------------------------------------------------------
+class StdinSource(MessageSource):
+    def read(self):
+        while not self.closed.is_set():
+            chunk = sys.stdin.readline(self.max_line)
+            if not chunk:
+                break
+            yield chunk
+
+# factory
+def create_source(spec: str) -> MessageSource:
+    # '' -> None, 'file:/path', 'fifo:/path', 'stdin', 'queue'
+    if not spec:
+        return None
+    kind, _, path = spec.partition(':')
+    if kind == 'file':
+        return FileSource(path)
+    elif kind == 'fifo':
+        return FifoSource(path)
+    elif kind == 'stdin':
+        return StdinSource()
+    elif kind == 'queue':
+        return MessageSource()
+    raise ValueError("unknown message source: " + spec)
+
+# sources kept open across logics constructed again (the readers keep their positions and words)
+_sources = {}
+
+def open_source(spec: str) -> MessageSource:
+    # the open source of the spec, created on first use (the sources of other specs are closed)
+    for other in [other for other in _sources if other != spec]:
+        _sources.pop(other).close()
+    if not spec:
+        return None
+    source = _sources.get(spec)
+    if source is None or source.closed.is_set():
+        source = _sources[spec] = create_source(spec)
+    return source
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import mmap
+import os
+import struct
+import zlib
+
+from asterisk_mirror.log import get_logger
+
+log = get_logger('StateFile')
+
+# a record in each of the two slots: seq, position, number of steps, clean shutdown, crc32
+_RECORD = struct.Struct('<QqiiI')
+_BODY = struct.Struct('<Qqii')
+
+# StateFile
+# Usage:
+#  state = StateFile('/var/lib/asterisk-mirror/state')
+#  record = state.load()  # (position, number_of_steps, clean) or None
+#  stepper.state = state  # saves the position after every move
+#  state.close(stepper.current_step, stepper.number_of_steps)  # marks a clean shutdown
+#
+class StateFile:
+    def __init__(self, path: str):
+        self.path = path
+        self.seq = 0
+        self.position = 0
+        self.number_of_steps = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self.fd).st_size < 2*_RECORD.size:
+            os.ftruncate(self.fd, 2*_RECORD.size)
+        self.map = mmap.mmap(self.fd, 2*_RECORD.size)
+        self.record = self._read()
+        if self.record is not None:
+            self.seq = self.record[0]
+
+    def _read(self) -> tuple:
+        # the newest record with a valid checksum (the other slot survives a torn write)
+        records = []
+        for slot in range(2):
+            record = _RECORD.unpack_from(self.map, slot*_RECORD.size)
+            if record[0] > 0 and zlib.crc32(_BODY.pack(*record[:4])) == record[4]:
+                records.append(record)
+        return max(records) if records else None
+
+    def load(self) -> tuple:
+        if self.record is None:
+            return None
+        _, position, number_of_steps, clean, _ = self.record
+        return position, number_of_steps, bool(clean)
+
+    def save(self, position: int, number_of_steps: int, clean: bool=False):
+        # one store into the mapped page; the kernel writes it back (nothing after close)
+        if self.map is None:
+            return
+        self.seq += 1
+        self.position = position
+        self.number_of_steps = number_of_steps
+        body = _BODY.pack(self.seq, position, number_of_steps, int(clean))
+        _RECORD.pack_into(self.map, (self.seq % 2)*_RECORD.size, self.seq, position, number_of_steps, int(clean), zlib.crc32(body))
+
+    def close(self, position: int=None, number_of_steps: int=None):
+        # the position at the shutdown (the last saved one if omitted) recorded as clean
+        if self.map is None:
+            return
+        self.save(self.position if position is None else position,
+            self.number_of_steps if number_of_steps is None else number_of_steps, clean=True)
+        self.map.flush()
+        self.map.close()
+        os.close(self.fd)
+        self.map = None
+
+def restore(stepper, state: StateFile) -> bool:
+    # resumes the stepper from the recorded position and records it from now on
+    # (returns True if the position was recorded at a clean shutdown)
+    record = state.load()
+    restored = False
+    if record is None:
+        log.info("no position recorded in", state.path)
+    else:
+        position, number_of_steps, clean = record
+        if number_of_steps != stepper.number_of_steps:
+            log.warning("ignored a position of", number_of_steps, "steps per revolution")
+        else:
+            if not clean:
+                log.warning("no clean shutdown, the position may be off by a move")
+            stepper.current_step = position
+            restored = clean
+            log.info("resumes from position:", position)
+    state.save(stepper.current_step, stepper.number_of_steps)
+    stepper.state = state
+    return restored
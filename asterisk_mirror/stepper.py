@@ -1,43 +1,82 @@
 # -*- coding: utf-8 -*-
 
+from itertools import accumulate
 from threading import Event, Thread, Condition
-import time
+from asterisk_mirror.clock import Clock
+from asterisk_mirror.easing import delay_table
+from asterisk_mirror.gpio import RPiGPIOBackend
+from asterisk_mirror.planner import shortest_steps
+from asterisk_mirror.log import get_logger
 
-import importlib.util
-try:
-    importlib.util.find_spec('RPi.GPIO')
-    import RPi.GPIO as GPIO
-except ImportError:
-    import fake_rpi
-    fake_rpi.toggle_print(False)
-    from fake_rpi.RPi import GPIO
+log = get_logger('Stepper')
+
+def delay_offsets(delays) -> list:
+    # step deadlines (ns) of delays (secs after each step)
+    return list(accumulate(int(delay*1000000000) for delay in delays))
+
+def offset_delays(offsets) -> list:
+    # delays (secs after each step) of step deadlines (ns)
+    return [(offset-previous)/1000000000 for previous, offset in zip([0]+list(offsets), offsets)]
+
+# MS1, MS2, MS3 levels of each resolution (A4988 and compatible drivers)
+_MODES = {
+    1: (False, False, False),
+    2: (True, False, False),
+    4: (False, True, False),
+    8: (True, True, False),
+    16: (True, True, True),
+}
 
 # Stepper
 # Usage:
 #  stepper = Stepper([1,2,3])
 #  stepper.step(10)      # 10ステップすすむ
 #  stepper.set_angle(1.0) # 下を向く
+#  stepper.configure_microsteps(16, [17, 27, 22], 2)  # 1/16 steps, 1/2 steps for fast moves
 #
 class Stepper:
-    def __init__(self, pins: list=[13, 19, 9], base_time: float=0.001, interrupt_event=None):
+    # True if MotionPlanner may send planned offsets to _rotate
+    plans = True
+
+    def __init__(self, pins: list=[13, 19, 9], base_time: float=0.001, interrupt_event=None, backend=None, clock=None):
         # CONFIG
         self.step_pin = pins[0]
         self.direction_pin = pins[1]
         self.enable_pin = pins[2]
         self.base_time = base_time
         self.interrupt_event = Event() if interrupt_event is None else interrupt_event
-        self.current_step = 0
+        self.clock = Clock() if clock is None else clock
+        self.current_step = 0 # in the finest microsteps
+        self.phase = 0 # translator index of the driver: moved by pulses only (homing and restores set current_step)
         self.number_of_steps = 200 * 8 # 1/8 steps
+        self.microsteps = 8
+        self.mode_pins = None # MS1-MS3 pins (None for the fixed resolution of the driver)
+        self.coarse_microsteps = 8 # resolution of fast transit
+        self.coarse_interval = 0.0005 # secs: steps faster than this move coarse
+        self.step_size = 1 # finest microsteps per pulse
+        self.max_lag_steps = 3 # steps to catch up before resync
+        self.missed_deadlines = 0
+        self.telemetry = None
+        self.state = None # StateFile to record the position after moves
+        self.sensor = None # home sensor for rotate_to_balance
+        self.trace = None # TraceRecorder of the steps
+        self.watchdog = None # Watchdog expecting each move to end by its last deadline
+        self.home_speed = 4.0 # speed of the coarse seek
+        self.approach_speed = 0.1 # speed of the precise approach
+        self.backoff_steps = 40
+        self.pulse_width = 10000 # ns
+        self.direction_setup = 1000 # ns from a direction edge to the first step (200ns for A4988, 650ns for DRV8825)
 
         # GPIO
-        GPIO.setwarnings(False)
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.step_pin, GPIO.OUT)
-        GPIO.setup(self.direction_pin, GPIO.OUT)
-        GPIO.setup(self.enable_pin, GPIO.OUT)
-        GPIO.output(self.enable_pin, False)
+        self.setup_backend(backend)
+
+        log.info("configured", step_pin=self.step_pin, dir_pin=self.direction_pin, enable_pin=self.enable_pin, backend=self.backend)
 
-        print("Stepper [", "step_pin:", self.step_pin, ", dir_pin:", self.direction_pin, ", enable_pin:", self.enable_pin, "]")
+    def setup_backend(self, backend):
+        self.backend = RPiGPIOBackend() if backend is None else backend
+        self.backend.clock = self.clock
+        self.backend.setup([self.step_pin, self.direction_pin, self.enable_pin])
+        self.backend.output(self.enable_pin, False)
 
     def __del__(self):
         self.exit()
@@ -45,17 +84,54 @@ class Stepper:
     def exit(self):
         self.interrupt()
         self.disable()
+        if self.state is not None:
+            # the position reached, also in the middle of a move
+            self.state.close(self.current_step, self.number_of_steps)
+        if self.trace is not None:
+            self.trace.close()
+
+    def configure_microsteps(self, microsteps: int=8, mode_pins: list=None, coarse_microsteps: int=None, coarse_interval: float=0.0005):
+        # the finest resolution, and the driver mode pins to switch to coarse_microsteps for fast moves
+        if microsteps not in _MODES or (coarse_microsteps is not None and coarse_microsteps not in _MODES):
+            raise ValueError("microsteps must be one of " + str(sorted(_MODES)))
+        self.microsteps = microsteps
+        self.number_of_steps = 200 * microsteps
+        self.mode_pins = list(mode_pins) if mode_pins else None
+        self.coarse_microsteps = microsteps if self.mode_pins is None or coarse_microsteps is None else min(coarse_microsteps, microsteps)
+        self.coarse_interval = coarse_interval
+        self.step_size = 1
+        if self.mode_pins is not None:
+            self.backend.setup(self.mode_pins)
+            for pin, value in zip(self.mode_pins, _MODES[microsteps]):
+                self.backend.output(pin, value)
+        log.info("microsteps", microsteps=microsteps, coarse=self.coarse_microsteps, mode_pins=self.mode_pins)
+
+    def set_step_size(self, size: int) -> bool:
+        # finest microsteps per pulse: switches the mode pins (False without them)
+        if size == self.step_size:
+            return True
+        if self.mode_pins is None or self.microsteps//size not in _MODES:
+            return False
+        for pin, value in zip(self.mode_pins, _MODES[self.microsteps//size]):
+            self.backend.output(pin, value)
+        self.step_size = size
+        return True
+
+    def save_state(self):
+        # one store per move instead of one per step
+        if self.state is not None:
+            self.state.save(self.current_step, self.number_of_steps)
 
     def wait(self, time: float):
         #print("Stepper: waiting:", time)
-        self.interrupt_event.wait(time)
+        self.clock.wait(self.interrupt_event, time)
     
     def interrupt(self):
-        print("Stepper: interrupting...")
+        log.debug("interrupting...")
         self.interrupt_event.set()
     
     def clear(self):
-        print("Stepper: clearing...")
+        log.debug("clearing...")
         self.interrupt_event.clear()
     
     def is_interrupted(self) -> bool:
@@ -63,21 +139,30 @@ class Stepper:
     
     def reset(self, speed: float=1.0) -> int :
         self.clear()
-        steps = -self.current_step if self.current_step<self.number_of_steps/2 else self.number_of_steps-self.current_step
+        steps = shortest_steps(self.current_step, 0, self.number_of_steps)
         #print("steps=", steps, ", current=", self.current_step)
         return self.rotate_by_steps(steps, speed)
 
     def enable(self, enables: bool=True):
-        GPIO.output(self.enable_pin, not enables)
+        self.backend.output(self.enable_pin, not enables)
     
     def disable(self):
         self.enable(False)
 
     def step(self, dir: int=1):
-        GPIO.output(self.direction_pin, dir<0)
-        GPIO.output(self.step_pin, True)
-        GPIO.output(self.step_pin, False)
-        self.current_step = (self.current_step+dir) % self.number_of_steps
+        self.backend.output(self.direction_pin, dir<0)
+        self.backend.output(self.step_pin, True)
+        self.backend.output(self.step_pin, False)
+        self.current_step = (self.current_step+dir*self.step_size) % self.number_of_steps
+        self.phase = (self.phase+dir*self.step_size) % self.number_of_steps
+
+    def wait_until(self, deadline: int) -> bool:
+        # waits until the absolute deadline (clock.monotonic_ns) and returns False if it is already overdue
+        remaining = deadline - self.clock.monotonic_ns()
+        if remaining <= 0:
+            return False
+        self.clock.wait(self.interrupt_event, remaining/1000000000)
+        return True
 
     def rotate_by_steps(self, steps: int, speed: float=1.0, easing: str='linear') -> int:
         #print("Stepper: rotate:", steps, "interrupted:", self.is_interrupted())
@@ -86,28 +171,183 @@ class Stepper:
         
         # enable motor
         self.enable()
-        wait_time = self.base_time/speed
-        # repeat steps
+        offsets = delay_table(abs(steps), speed, easing, self.base_time).tolist()
+        actual_steps = self._transit(steps, offsets)
+        self.save_state()
+        # disable motor
+        self.disable()
+        return actual_steps
+
+    def rotate_by_delays(self, delays, dir: int=1) -> int:
+        # steps once per delay (secs after each step) without toggling the enable pin
+        if len(delays) == 0:
+            return 0
+        return self.rotate_by_offsets(dir*len(delays), delay_offsets(delays))
+
+    def rotate_by_offsets(self, steps: int, offsets: list) -> int:
+        # steps against deadlines (ns, see _rotate) without toggling the enable pin
+        if steps == 0:
+            return 0
+        actual_steps = self._transit(steps, offsets)
+        self.save_state()
+        return actual_steps
+
+    def _transit(self, steps: int, offsets: list) -> int:
+        watchdog = self.watchdog
+        if watchdog is None:
+            return self._transit_coarse(steps, offsets)
+        watchdog.beat('step', offsets[-1]/1000000000)
+        try:
+            return self._transit_coarse(steps, offsets)
+        finally:
+            watchdog.idle('step')
+
+    def _transit_coarse(self, steps: int, offsets: list) -> int:
+        moved = 0
+        for size, part_steps, part_offsets in self._segments(steps, offsets):
+            self.set_step_size(size)
+            moved += size * self._rotate(part_steps, part_offsets)
+            if self.is_interrupted():
+                break
+        self.set_step_size(1)
+        return moved
+
+    def _segments(self, steps: int, offsets: list) -> list:
+        # (step size, steps, offsets) parts of a move: the fast part in coarse microsteps, fewer
+        # pulses at the same deadlines (the coarse part starts at a position on the coarse grid)
+        factor = self.microsteps // self.coarse_microsteps
+        count = abs(steps)
+        if factor <= 1 or count < 4*factor:
+            return [(1, steps, offsets)]
+        dir = 1 if steps > 0 else -1
+        deadlines = [0] + list(offsets) # deadlines[i] of the (i+1)th step, deadlines[count] at the end
+        threshold = self.coarse_interval*1000000000
+        fast = [deadlines[i+1]-deadlines[i] < threshold for i in range(count)]
+        # the driver switches modes at a position common to both: a coarse step of its translator
+        start = next((i for i in range(count) if fast[i] and (self.phase+dir*i) % factor == 0), count)
+        end = start
+        while end+factor <= count and all(fast[end:end+factor]):
+            end += factor
+        if end-start < 2*factor:
+            return [(1, steps, offsets)]
+        return [(size, dir*((stop-begin)//size), [deadlines[i]-deadlines[begin] for i in range(begin+size, stop+1, size)])
+            for begin, stop, size in ((0, start, 1), (start, end, factor), (end, count, 1)) if stop > begin]
+
+    def _rotate(self, steps: int, offsets: list, until=None) -> int:
+        # steps against absolute deadlines: offsets[i] is the deadline (ns) after the (i+1)th step
+        # (until is checked after each step to stop the move, e.g. at a sensor)
+        if self.backend.batched and until is None:
+            return self._rotate_by_train(steps, offsets)
+        max_lag = offsets[-1]//len(offsets)*self.max_lag_steps
+        late_steps = 0
         step = (1 if steps>0 else -1)
-        for actual_steps in range(step, steps+step, step):
-            #print("step:", step, " wait:", wait_time)
+        telemetry = self.telemetry
+        trace = self.trace
+        started = self.clock.monotonic_ns()
+        scheduled = started
+        for actual_steps, offset in zip(range(step, steps+step, step), offsets):
+            #print("step:", step, " offset:", offset)
+            if telemetry is not None:
+                telemetry.record(scheduled, self.clock.monotonic_ns())
             self.step(step)
-            self.interrupt_event.wait(wait_time)
+            if trace is not None:
+                trace.record(self.clock.monotonic_ns(), step*self.step_size)
+            if until is not None and until():
+                break
+            deadline = started + offset
+            if not self.wait_until(deadline):
+                # catch up by skipping the wait, or resync if too far behind
+                late_steps += 1
+                lag = self.clock.monotonic_ns() - deadline
+                if lag > max_lag:
+                    started += lag
+            scheduled = started + offset
             if self.is_interrupted():
-                print("Stepper: interrupted.")
+                log.debug("interrupted.")
                 break
-        # disable motor
-        self.disable()
+        if late_steps > 0:
+            self.missed_deadlines += late_steps
+            if telemetry is not None:
+                telemetry.miss(late_steps)
+            log.warning("behind schedule", late=late_steps, steps=abs(actual_steps))
+        return actual_steps
+
+    def pulse_train(self, steps: int, offsets: list) -> list:
+        # edges (offset ns, pin, value) of a move whose steps start at 0 and offsets[:-1]
+        # after the direction setup time
+        setup = self.direction_setup
+        edges = [(0, self.direction_pin, steps<0)]
+        for offset in [0] + offsets[:abs(steps)-1]:
+            edges.append((setup+offset, self.step_pin, True))
+            edges.append((setup+offset+self.pulse_width, self.step_pin, False))
+        return edges
+
+    def _rotate_by_train(self, steps: int, offsets: list) -> int:
+        step = (1 if steps>0 else -1)
+        edges = self.pulse_train(steps, offsets)
+        self.backend.send(edges)
+        started = self.clock.monotonic_ns() + self.direction_setup
+        self.wait_until(started + offsets[-1])
+        # the host may wake before the train has been played
+        while self.backend.busy() and not self.is_interrupted():
+            self.wait(self.base_time)
+        if self.is_interrupted():
+            log.debug("interrupted.")
+        # counts the pulses played before stopping
+        sent = self.backend.cancel()
+        actual_steps = step * sum(1 for _, pin, value in edges[:sent] if pin == self.step_pin and value)
+        self.current_step = (self.current_step+actual_steps*self.step_size) % self.number_of_steps
+        self.phase = (self.phase+actual_steps*self.step_size) % self.number_of_steps
+        if self.telemetry is not None:
+            self.telemetry.add_steps(abs(actual_steps))
+        if self.trace is not None:
+            for offset in [0] + offsets[:abs(actual_steps)-1]:
+                self.trace.record(started+offset, step*self.step_size)
         return actual_steps
 
     def rotate_to_balance(self) -> int:
-        return 0
+        # homing: a fast seek to the sensor, a back-off and a slow approach (returns the steps moved)
+        if self.sensor is None:
+            return 0
+        triggered = self.sensor.triggered
+        self.enable()
+        moved = 0
+        if triggered():
+            # leaves the sensor first
+            moved += self._seek(-self.number_of_steps//4, 1.0, 'linear', lambda: not triggered())
+            if triggered():
+                log.warning("cannot leave the home sensor")
+                self.disable()
+                return moved
+        moved += self._seek(self.number_of_steps, self.home_speed, 'trapezoid', triggered)
+        if triggered():
+            moved += self._seek(-self.backoff_steps, 1.0, 'linear')
+            moved += self._seek(2*self.backoff_steps, self.approach_speed, 'linear', triggered)
+        if triggered():
+            log.info("homed", position=self.current_step, moved=moved)
+            self.current_step = 0
+            self.save_state()
+        else:
+            log.warning("home sensor not found")
+        self.disable()
+        return moved
+
+    def _seek(self, steps: int, speed: float, easing: str, until=None) -> int:
+        offsets = delay_table(abs(steps), speed, easing, self.base_time).tolist()
+        if self.watchdog is None:
+            return self._rotate(steps, offsets, until)
+        self.watchdog.beat('step', offsets[-1]/1000000000)
+        try:
+            return self._rotate(steps, offsets, until)
+        finally:
+            self.watchdog.idle('step')
 
     def rotate_by_angle(self, radian: float, speed: float=1.0, easing: str='linear') -> int:
         steps = int(self.number_of_steps*radian/2.0)
         return self.rotate_by_steps(steps, speed, easing)
 
     def set_angle(self, radian: float, speed: float=1.0, easing: str='linear') -> int:
-        steps = int(self.number_of_steps*radian/2.0) - self.current_step
+        # the shorter way round
+        steps = shortest_steps(self.current_step, int(self.number_of_steps*radian/2.0), self.number_of_steps)
         # print("steps = " + str(steps) + ", current = " + str(self.current_step))
         return self.rotate_by_steps(steps, speed, easing)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import math
+from array import array
+from http.server import BaseHTTPRequestHandler
+
+from asterisk_mirror.httpd import HTTPService
+from asterisk_mirror.log import get_logger
+
+log = get_logger('MetricsServer')
+
+# StepTelemetry
+# Usage:
+#  telemetry = StepTelemetry(4096)
+#  stepper.telemetry = telemetry
+#  server = MetricsServer(telemetry, '127.0.0.1:9464')  # or a unix socket path
+#  server.start()
+#  # curl http://127.0.0.1:9464/metrics
+#
+class StepTelemetry:
+    # upper bounds of the latency histogram (secs)
+    buckets = (0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+
+    def __init__(self, capacity: int=4096):
+        self.capacity = capacity
+        self.scheduled = array('q', bytes(8*capacity))
+        self.actual = array('q', bytes(8*capacity))
+        self.label_ids = array('B', bytes(capacity))
+        self.count = 0
+        self.missed = 0
+        self.labels = ['idle']
+        self.label_id = 0
+        self.steps = [0]
+
+    def set_label(self, label: str):
+        # steps recorded after this call are counted for the label (logic name)
+        if label not in self.labels:
+            self.labels.append(label)
+            self.steps.append(0)
+        self.label_id = self.labels.index(label)
+
+    def record(self, scheduled: int, actual: int):
+        # records a step scheduled and actually pulsed at (ns)
+        index = self.count % self.capacity
+        self.scheduled[index] = scheduled
+        self.actual[index] = actual
+        self.label_ids[index] = self.label_id
+        self.count += 1
+        self.steps[self.label_id] += 1
+
+    def add_steps(self, steps: int):
+        # counts steps without timings (pulse trains)
+        self.steps[self.label_id] += steps
+
+    def miss(self, steps: int=1):
+        self.missed += steps
+
+    def window(self) -> list:
+        # (scheduled, actual, label id) of the recent steps in chronological order
+        begin = max(0, self.count-self.capacity)
+        return [(self.scheduled[i%self.capacity], self.actual[i%self.capacity], self.label_ids[i%self.capacity])
+                for i in range(begin, self.count)]
+
+    def latencies(self) -> list:
+        return [(actual-scheduled)/1000000000 for scheduled, actual, _ in self.window()]
+
+    def histogram(self) -> list:
+        # cumulative counts of latencies for each bucket
+        latencies = self.latencies()
+        return [sum(1 for latency in latencies if latency <= bound) for bound in self.buckets]
+
+    def jitter(self) -> float:
+        # standard deviation of the latencies
+        latencies = self.latencies()
+        if len(latencies) < 2:
+            return 0.0
+        mean = sum(latencies)/len(latencies)
+        return math.sqrt(sum((latency-mean)**2 for latency in latencies)/(len(latencies)-1))
+
+    def rates(self) -> dict:
+        # steps per second of each label in the recent window
+        window = self.window()
+        if len(window) < 2:
+            return {}
+        span = (window[-1][1]-window[0][1])/1000000000
+        rates = {}
+        for _, _, label_id in window:
+            rates[self.labels[label_id]] = rates.get(self.labels[label_id], 0) + 1
+        return {label: (count/span if span > 0 else 0.0) for label, count in rates.items()}
+
+    def render(self) -> str:
+        # metrics in the prometheus text format
+        latencies = self.latencies()
+        lines = [
+            "# HELP asterisk_mirror_step_latency_seconds Delay of recent steps behind their schedule.",
+            "# TYPE asterisk_mirror_step_latency_seconds histogram",
+        ]
+        for bound, count in zip(self.buckets, self.histogram()):
+            lines.append('asterisk_mirror_step_latency_seconds_bucket{le="%g"} %d' % (bound, count))
+        lines.append('asterisk_mirror_step_latency_seconds_bucket{le="+Inf"} %d' % len(latencies))
+        lines.append('asterisk_mirror_step_latency_seconds_sum %.9f' % sum(latencies))
+        lines.append('asterisk_mirror_step_latency_seconds_count %d' % len(latencies))
+        lines += [
+            "# HELP asterisk_mirror_step_jitter_seconds Standard deviation of recent step latencies.",
+            "# TYPE asterisk_mirror_step_jitter_seconds gauge",
+            "asterisk_mirror_step_jitter_seconds %.9f" % self.jitter(),
+            "# HELP asterisk_mirror_missed_deadlines_total Steps pulsed after their deadline.",
+            "# TYPE asterisk_mirror_missed_deadlines_total counter",
+            "asterisk_mirror_missed_deadlines_total %d" % self.missed,
+            "# HELP asterisk_mirror_steps_total Steps pulsed by each logic.",
+            "# TYPE asterisk_mirror_steps_total counter",
+        ]
+        for label, steps in zip(self.labels, self.steps):
+            lines.append('asterisk_mirror_steps_total{logic="%s"} %d' % (label, steps))
+        lines += [
+            "# HELP asterisk_mirror_step_rate Steps per second of each logic in the recent window.",
+            "# TYPE asterisk_mirror_step_rate gauge",
+        ]
+        for label, rate in self.rates().items():
+            lines.append('asterisk_mirror_step_rate{logic="%s"} %.3f' % (label, rate))
+        return "\n".join(lines) + "\n"
+
+# ----------------------------------------------------------------------
+# メトリクスを HTTP (TCP または Unix ソケット) で返すサーバ
+# ----------------------------------------------------------------------
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.telemetry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class MetricsServer(HTTPService):
+    def __init__(self, telemetry: StepTelemetry, listen: str='127.0.0.1:9464'):
+        super().__init__(listen, _MetricsHandler)
+        self.server.telemetry = telemetry
+        log.info("started", listen=listen)
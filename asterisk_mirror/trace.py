@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+import struct
+import sys
+from queue import Queue
+from threading import Thread
+
+from asterisk_mirror.clock import Clock
+from asterisk_mirror.log import get_logger
+
+log = get_logger('TraceRecorder')
+
+# file header: magic, version, reserved, wall clock ns at the start of the file
+_HEADER = struct.Struct('<4sHHq')
+_MAGIC = b'AMTR'
+_VERSION = 1
+# a record: usecs after the previous step, direction, steps, logic id
+#  - count steps, each delta usecs after its predecessor (run-length encoded)
+#  - direction 0 and count 0: a gap of delta usecs without steps
+#  - direction 0 and count > 0: a label of the logic id, followed by count bytes of its name (8 bytes aligned)
+_RECORD = struct.Struct('<IbHB')
+_MAX_DELTA = 0xffffffff
+_MAX_COUNT = 0xffff
+
+# TraceRecorder
+# Usage:
+#  stepper.trace = TraceRecorder('/var/log/asterisk-mirror/motion.trace', clock=stepper.clock)
+#  stepper.trace.set_label('MorseLogic')
+#  ...
+#  stepper.trace.close()
+#
+#  $ python -m asterisk_mirror.trace replay motion.trace --gpio recording
+#  $ python -m asterisk_mirror.trace diff show-a.trace show-b.trace
+#
+class TraceRecorder:
+    batch_size = 4096 # bytes handed to the writer thread at once
+
+    def __init__(self, path: str, max_bytes: int=16*1024*1024, backups: int=3, clock=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.clock = Clock() if clock is None else clock
+        self.buffer = bytearray()
+        self.labels = []
+        self.label_id = 0
+        self.label_records = bytes()
+        self.last = self.clock.monotonic_ns()//1000 # usecs
+        # the pending run: [delta usecs, direction, count, logic id]
+        self.run = None
+        self.queue = Queue()
+        self.file = None
+        self.written = 0
+        self.thread = Thread(target=self._write, daemon=True)
+        self.thread.start()
+        self.set_label('idle')
+        log.info("started", path=path, max_bytes=max_bytes, backups=backups)
+
+    def set_label(self, label: str):
+        if label not in self.labels:
+            self.labels.append(label)
+            name = label.encode('utf-8')[:255]
+            record = _RECORD.pack(0, 0, len(name), len(self.labels)-1) + name + bytes(-len(name) % 8)
+            self.label_records += record
+            self._emit()
+            self.buffer += record
+        self.label_id = self.labels.index(label)
+
+    def record(self, timestamp: int, dir: int):
+        # a step pulsed at the timestamp (clock.monotonic_ns) in the direction
+        now = timestamp//1000
+        delta = now - self.last
+        self.last = now
+        run = self.run
+        if run is not None and run[0] == delta and run[1] == dir and run[3] == self.label_id and run[2] < _MAX_COUNT:
+            run[2] += 1
+        else:
+            self._emit()
+            while delta > _MAX_DELTA:
+                self.buffer += _RECORD.pack(_MAX_DELTA, 0, 0, self.label_id)
+                delta -= _MAX_DELTA
+            self.run = [delta, dir, 1, self.label_id]
+
+    def flush(self):
+        self._emit()
+        if self.buffer:
+            self.queue.put((bytes(self.buffer), self.label_records))
+            self.buffer = bytearray()
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def _emit(self):
+        if self.run is not None:
+            self.buffer += _RECORD.pack(*self.run)
+            self.run = None
+            if len(self.buffer) >= self.batch_size:
+                self.flush()
+
+    def _write(self):
+        # writes batches and rotates files off the stepping thread
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            chunk, label_records = item
+            if self.file is None or self.written >= self.max_bytes:
+                self._rotate(label_records)
+            self.file.write(chunk)
+            self.file.flush()
+            self.written += len(chunk)
+        if self.file is not None:
+            self.file.close()
+
+    def _rotate(self, label_records: bytes):
+        # path -> path.1 -> ... -> path.backups (a new file for every run, too)
+        if self.file is not None:
+            self.file.close()
+        if os.path.exists(self.path) and self.backups > 0:
+            for index in range(self.backups-1, 0, -1):
+                if os.path.exists(self.path + "." + str(index)):
+                    os.replace(self.path + "." + str(index), self.path + "." + str(index+1))
+            os.replace(self.path, self.path + ".1")
+        self.file = open(self.path, 'wb')
+        header = _HEADER.pack(_MAGIC, _VERSION, 0, int(self.clock.time()*1000000000))
+        self.file.write(header + label_records)
+        self.written = len(header) + len(label_records)
+
+# ----------------------------------------------------------------------
+# 読み込み・再生・比較
+# ----------------------------------------------------------------------
+def read_trace(path: str) -> list:
+    # steps (usecs after the start of the file, direction, logic name)
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, _, _ = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("not a motion trace: " + path)
+    steps = []
+    labels = {}
+    elapsed = 0
+    offset = _HEADER.size
+    while offset + _RECORD.size <= len(data):
+        delta, dir, count, label_id = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+        if dir == 0:
+            if count > 0:
+                labels[label_id] = data[offset:offset+count].decode('utf-8')
+                offset += count + (-count % 8)
+            else:
+                elapsed += delta
+            continue
+        label = labels.get(label_id, str(label_id))
+        for _ in range(count):
+            elapsed += delta
+            steps.append((elapsed, dir, label))
+    return steps
+
+def replay(steps: list, stepper, speed: float=1.0) -> int:
+    # drives the stepper with the recorded steps and timings (speed 2.0 = twice as fast)
+    if not steps:
+        return 0
+    moved = 0
+    stepper.enable()
+    begin = 0
+    while begin < len(steps) and not stepper.is_interrupted():
+        # a run of one direction; its last deadline is the next step after the run
+        end = begin
+        while end < len(steps) and steps[end][1] == steps[begin][1]:
+            end += 1
+        start = steps[begin][0]
+        times = [time for time, _, _ in steps[begin+1:end+1]]
+        if end == len(steps):
+            times.append(steps[end-1][0])
+        offsets = [max(0, int((time-start)*1000/speed)) for time in times]
+        # a step of coarse microsteps (dir -4: 4 of the finest microsteps backwards)
+        size, dir = abs(steps[begin][1]), (1 if steps[begin][1] > 0 else -1)
+        if not stepper.set_step_size(size):
+            # in the finest microsteps spread over each interval
+            offsets = [previous + (offset-previous)*(i+1)//size for previous, offset in zip([0]+offsets, offsets) for i in range(size)]
+            size, count = 1, (end-begin)*size
+        else:
+            count = end-begin
+        moved += size*stepper._rotate(dir*count, offsets)
+        stepper.set_step_size(1)
+        begin = end
+    stepper.disable()
+    return moved
+
+def diff(a: list, b: list, tolerance: int=1000) -> dict:
+    # compares two traces step by step (tolerance: usecs of timing deviation)
+    result = {
+        'steps': [len(a), len(b)],
+        'position': [sum(dir for _, dir, _ in a), sum(dir for _, dir, _ in b)],
+        'max_deviation': 0,
+        'divergence': None,
+    }
+    start_a = a[0][0] if a else 0
+    start_b = b[0][0] if b else 0
+    for index, (step_a, step_b) in enumerate(zip(a, b)):
+        deviation = abs((step_a[0]-start_a) - (step_b[0]-start_b))
+        result['max_deviation'] = max(result['max_deviation'], deviation)
+        if step_a[1] != step_b[1] or step_a[2] != step_b[2] or deviation > tolerance:
+            result['divergence'] = {'index': index, 'a': list(step_a), 'b': list(step_b)}
+            break
+    if result['divergence'] is None and len(a) != len(b):
+        index = min(len(a), len(b))
+        result['divergence'] = {'index': index, 'a': list(a[index]) if index < len(a) else None, 'b': list(b[index]) if index < len(b) else None}
+    return result
+
+def main(argv: list=None) -> int:
+    parser = argparse.ArgumentParser(prog='asterisk_mirror.trace', description='replays or compares motion traces')
+    commands = parser.add_subparsers(dest='command')
+    replay_parser = commands.add_parser('replay', help='drives a stepper with a trace')
+    replay_parser.add_argument('path')
+    replay_parser.add_argument('--gpio', default='recording', help='GPIO backend (rpi, waveform, recording, simulated)')
+    replay_parser.add_argument('--pins', default='13,19,9', help='step, direction and enable pins')
+    replay_parser.add_argument('--speed', type=float, default=1.0, help='replay speed')
+    diff_parser = commands.add_parser('diff', help='compares two traces')
+    diff_parser.add_argument('a')
+    diff_parser.add_argument('b')
+    diff_parser.add_argument('--tolerance', type=int, default=1000, help='usecs of timing deviation')
+    args = parser.parse_args(argv)
+
+    if args.command == 'replay':
+        from asterisk_mirror.gpio import create_backend
+        from asterisk_mirror.stepper import Stepper
+        stepper = Stepper([int(pin) for pin in args.pins.split(',')], backend=create_backend(args.gpio))
+        moved = replay(read_trace(args.path), stepper, args.speed)
+        print("replayed:", moved, "steps, position:", stepper.current_step)
+        return 0
+    elif args.command == 'diff':
+        result = diff(read_trace(args.a), read_trace(args.b), args.tolerance)
+        print("steps:", result['steps'], ", position:", result['position'], ", max deviation:", result['max_deviation'], "usecs")
+        if result['divergence'] is not None:
+            print("diverges at step", result['divergence']['index'], ":", result['divergence']['a'], "!=", result['divergence']['b'])
+            return 1
+        return 0
+    parser.print_help()
+    return 2
+
+if __name__ == '__main__':
+    sys.exit(main())
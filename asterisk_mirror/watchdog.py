@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import ctypes
+import os
+import socket
+
+from asterisk_mirror.clock import Clock
+from asterisk_mirror.log import get_logger
+
+log = get_logger('Watchdog')
+
+# actions on a stalled heartbeat, one more each timeout until it beats again
+ACTIONS = ('interrupt', 'restart', 'exit')
+
+class SceneStalled(Exception):
+    # raised in a scene thread stuck in a logic
+    pass
+
+def raise_in_thread(ident: int, exc_type=SceneStalled) -> bool:
+    # raises the exception in the thread at its next python instruction
+    if ident is None:
+        return False
+    return ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(ident), ctypes.py_object(exc_type)) == 1
+
+# SystemdNotifier
+# Usage:
+#  notifier = SystemdNotifier()  # NOTIFY_SOCKET of the service manager (a no-op without it)
+#  notifier.notify('READY=1')
+#  notifier.notify('WATCHDOG=1')
+#
+class SystemdNotifier:
+    def __init__(self, address: str=None):
+        address = os.environ.get('NOTIFY_SOCKET') if address is None else address
+        if address and address[0] == '@':
+            # an abstract socket
+            address = '\0' + address[1:]
+        self.address = address or None
+        self.socket = None
+
+    def notify(self, state: str) -> bool:
+        if self.address is None:
+            return False
+        try:
+            if self.socket is None:
+                self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.socket.sendto(state.encode('utf-8'), self.address)
+            return True
+        except OSError as e:
+            log.warning("cannot notify the service manager:", e)
+            return False
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+# Watchdog
+# Usage:
+#  watchdog = Watchdog(timeout=10, escalate=lambda name, action: ...)
+#  watchdog.beat('timer', 300)  # the next beat is due within 300 secs (and timeout secs of grace)
+#  watchdog.idle('step')        # no beat expected until the next one
+#  watchdog.run(stop_event)     # checks every interval secs and keeps the service manager alive
+#
+class Watchdog:
+    def __init__(self, timeout: float=10.0, interval: float=1.0, escalate=None, clock=None, notifier=None):
+        self.timeout = timeout
+        self.clock = Clock() if clock is None else clock
+        self.notifier = SystemdNotifier() if notifier is None else notifier
+        watchdog_usec = os.environ.get('WATCHDOG_USEC')
+        if watchdog_usec and self.notifier.address is not None:
+            # twice as often as the service manager expects
+            interval = min(interval, int(watchdog_usec)/2000000)
+        self.interval = interval
+        self.escalate = escalate
+        # monotonic secs by which the next beat of each heartbeat is due (None while idle)
+        self.deadlines = {}
+        # (action index, monotonic secs of the next action) of the stalled heartbeats
+        self.stalls = {}
+        log.info("configured", timeout=timeout, interval=self.interval, notify=self.notifier.address)
+
+    def _now(self) -> float:
+        return self.clock.monotonic_ns()/1000000000
+
+    def beat(self, name: str, within: float=0.0):
+        self.deadlines[name] = self._now() + within + self.timeout
+
+    def idle(self, name: str):
+        self.deadlines[name] = None
+
+    def check(self) -> bool:
+        # escalates the stalled heartbeats and returns True if all of them are alive
+        now = self._now()
+        healthy = True
+        for name, deadline in list(self.deadlines.items()):
+            if deadline is None or now < deadline:
+                if self.stalls.pop(name, None) is not None:
+                    log.info("recovered:", name)
+                continue
+            healthy = False
+            index, due = self.stalls.get(name, (-1, now))
+            if now < due or index+1 >= len(ACTIONS):
+                continue
+            index += 1
+            self.stalls[name] = (index, now + self.timeout)
+            log.error("stalled:", name, late=round(now-deadline, 3), action=ACTIONS[index])
+            if self.escalate is not None:
+                self.escalate(name, ACTIONS[index])
+        if healthy:
+            self.notifier.notify('WATCHDOG=1')
+        return healthy
+
+    def run(self, stop_event):
+        self.notifier.notify('READY=1')
+        try:
+            while not stop_event.is_set():
+                self.check()
+                self.clock.wait(stop_event, self.interval)
+        finally:
+            self.notifier.notify('STOPPING=1')
+            self.notifier.close()
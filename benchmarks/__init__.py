@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+# Benchmarks of the stepping hot path
+# Usage:
+#  $ python -m benchmarks --output bench.json
+#
+
+def summarize(samples: list) -> dict:
+    # distribution of samples (secs)
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    def percentile(rate: float) -> float:
+        return samples[min(len(samples)-1, int(len(samples)*rate))]
+    return {
+        'count': len(samples),
+        'mean': sum(samples)/len(samples),
+        'p50': percentile(0.5),
+        'p90': percentile(0.9),
+        'p99': percentile(0.99),
+        'max': samples[-1],
+    }
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import contextlib
+import json
+import platform
+import sys
+import time
+
+from benchmarks.bench_stepper import bench_step_rate, bench_wait_accuracy
+from benchmarks.bench_logics import bench_fluc, bench_morse
+
+BENCHMARKS = {
+    'step_rate': bench_step_rate,
+    'wait_accuracy': bench_wait_accuracy,
+    'fluc': bench_fluc,
+    'morse': bench_morse,
+}
+
+def main(argv: list=None):
+    parser = argparse.ArgumentParser(prog='benchmarks', description='benchmarks of the stepping hot path')
+    parser.add_argument('names', nargs='*', help='benchmarks to run: ' + ', '.join(BENCHMARKS) + ' (all by default)')
+    parser.add_argument('-o', '--output', help='JSON file to write results (stdout by default)')
+    args = parser.parse_args(argv)
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark: " + name)
+
+    results = {
+        'timestamp': time.time(),
+        'python': sys.version.split()[0],
+        'machine': platform.machine(),
+        'results': {},
+    }
+    for name in args.names or BENCHMARKS:
+        print("benchmarks: running:", name, file=sys.stderr)
+        # keeps stdout for the results
+        with contextlib.redirect_stdout(sys.stderr):
+            results['results'][name] = BENCHMARKS[name]()
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
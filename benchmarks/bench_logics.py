@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from asterisk_mirror.clock import VirtualClock
+from asterisk_mirror.gpio import create_backend, RecordingBackend
+from asterisk_mirror.logics import MorseLogic, FlucLogic
+from asterisk_mirror.stepper import Stepper
+
+def bench_fluc(steps: int=20000) -> dict:
+    # wall time per step of FlucLogic.execute (chaotic map + stepping) without real waits
+    results = {}
+    for fluctuate in (False, True):
+        clock = VirtualClock()
+        stepper = Stepper(backend=RecordingBackend(capacity=steps*8), clock=clock)
+        logic = FlucLogic(stepper)
+        logic.fluctuate = fluctuate
+        # interrupt after the virtual time of the steps
+        clock.schedule(stepper.base_time/logic.speed*steps, stepper.interrupt)
+        started = time.perf_counter()
+        logic.execute()
+        elapsed = time.perf_counter() - started
+        actual_steps = len(stepper.backend.pulses(stepper.step_pin))
+        results['fluctuate' if fluctuate else 'constant'] = {
+            'steps': actual_steps,
+            'sec_per_step': elapsed/actual_steps,
+        }
+    return results
+
+def bench_morse(message: str='sos', base_time: float=0.0002) -> dict:
+    # timing error of a whole MorseLogic message against its ideal duration
+    clock = VirtualClock()
+    logic = MorseLogic(Stepper(base_time=base_time, backend=create_backend('recording'), clock=clock))
+    logic.set_message(message)
+    logic.execute()
+    planned = clock.monotonic_ns()/1000000000
+
+    logic = MorseLogic(Stepper(base_time=base_time, backend=create_backend('recording')))
+    logic.set_message(message)
+    started = time.perf_counter()
+    logic.execute()
+    actual = time.perf_counter() - started
+    return {
+        'message': message,
+        'base_time': base_time,
+        'planned': planned,
+        'actual': actual,
+        'error': actual - planned,
+        'relative_error': (actual - planned)/planned,
+    }
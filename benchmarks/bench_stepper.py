@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import time
+from threading import Event
+
+from asterisk_mirror.gpio import create_backend
+from asterisk_mirror.stepper import Stepper
+from asterisk_mirror.telemetry import StepTelemetry
+from benchmarks import summarize
+
+BACKENDS = ('rpi', 'recording', 'waveform')
+BASE_TIMES = (0.0001, 0.00025, 0.0005, 0.001, 0.002)
+
+def bench_step_rate(steps: int=20000) -> dict:
+    # raw Stepper.step calls per second of each backend
+    results = {}
+    for name in BACKENDS:
+        try:
+            backend = create_backend(name)
+        except (ImportError, IOError) as e:
+            results[name] = {'skipped': str(e)}
+            continue
+        stepper = Stepper(backend=backend)
+        started = time.perf_counter()
+        for _ in range(steps):
+            stepper.step(1)
+        elapsed = time.perf_counter() - started
+        results[name] = {'steps': steps, 'steps_per_sec': steps/elapsed}
+        backend.cleanup()
+    return results
+
+def bench_wait_accuracy(samples: int=500) -> dict:
+    # oversleep of Event.wait and step latency of rotate_by_steps for each base_time
+    results = {}
+    event = Event()
+    for base_time in BASE_TIMES:
+        oversleeps = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            event.wait(base_time)
+            oversleeps.append(time.perf_counter() - started - base_time)
+        stepper = Stepper(base_time=base_time, backend=create_backend('recording'))
+        stepper.telemetry = StepTelemetry(samples)
+        stepper.rotate_by_steps(samples)
+        results[str(base_time)] = {
+            'event_wait_oversleep': summarize(oversleeps),
+            'step_latency': summarize(stepper.telemetry.latencies()),
+            'missed_deadlines': stepper.missed_deadlines,
+        }
+    return results
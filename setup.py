@@ -8,7 +8,8 @@ requires = ['rpi.gpio']
 #requires = ['fake_rpi', 'pylint']
 entries = {
     'console_scripts': [
-        'asterisk_mirror = asterisk_mirror.main:main'
+        'asterisk_mirror = asterisk_mirror.main:main',
+        'asterisk_mirror_trace = asterisk_mirror.trace:main'
     ]
 }
 
@@ -27,7 +28,7 @@ setup(
     author_email='yurayura@gmail.com',
     url='http://www.howeb.org',
     license=license,
-    packages=find_packages(exclude=('tests', 'docs')),
+    packages=find_packages(exclude=('tests', 'docs', 'benchmarks', 'benchmarks.*')),
     install_requires=requires,
     entry_points=entries
 )
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from asterisk_mirror.clock import VirtualClock
+from asterisk_mirror.config import AsteriskConfig
+from asterisk_mirror.main import AsteriskMirror
+
+from threading import Event, Thread
+import time
+
+class TestVirtualClock(unittest.TestCase):
+    def test_wait(self):
+        clock = VirtualClock(start=1000.0)
+        event = Event()
+        started = time.monotonic()
+        assert clock.wait(event, 3600) == False
+        assert clock.monotonic_ns() == 3600*1000000000
+        assert clock.time() == 4600.0
+        # an hour passes without sleeping
+        assert time.monotonic()-started < 0.1
+
+    def test_schedule(self):
+        clock = VirtualClock()
+        event = Event()
+        clock.schedule(2.5, event.set)
+        assert clock.wait(event, 10) == True
+        assert clock.monotonic_ns() == 2500000000
+
+    def test_threads(self):
+        clock = VirtualClock(threads=2)
+        event = Event()
+        ticks = []
+        def tick(interval: float):
+            while not clock.wait(event, interval):
+                ticks.append((clock.monotonic_ns()//1000000, interval))
+        threads = [Thread(target=tick, args=(interval,)) for interval in (2, 3)]
+        for thread in threads:
+            thread.start()
+        clock.advance(10)
+        event.set()
+        clock.notify()
+        for thread in threads:
+            thread.join()
+        # both threads woke up at their deadlines in the order of the virtual time
+        assert sorted(ticks) == [(2000, 2), (3000, 3), (4000, 2), (6000, 2), (6000, 3), (8000, 2), (9000, 3), (10000, 2)]
+
+class TestSimulation(unittest.TestCase):
+    def test_transitions(self):
+        AsteriskConfig().load(['tests/asterisk-mirror.cfg'])
+        clock = VirtualClock(threads=2)
+        mirror = AsteriskMirror(clock=clock)
+        changes = []
+        def run_logic(logic):
+            changes.append((clock.monotonic_ns()//1000000000, str(logic)))
+            mirror.stepper.clear()
+            mirror.stepper.wait(None)
+        for logic in mirror.logics:
+            logic.run = lambda clear=True, logic=logic: run_logic(logic)
+        mirror.start()
+        # a day of transitions every 60 secs
+        clock.advance(24*60*60)
+        mirror.stop()
+        assert len(changes) == 24*60+1
+        assert changes[:3] == [(0, 'MorseLogic'), (60, 'YearLogic'), (120, 'FlucLogic')]
+        assert changes[-2:] == [(24*60*60-60, 'FlucLogic'), (24*60*60, 'MorseLogic')]
+        AsteriskConfig().load()
+
+if __name__ == '__main__':
+    unittest.main()
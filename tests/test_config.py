@@ -3,7 +3,13 @@
 import unittest
 from unittest.mock import patch, MagicMock
 
-from asterisk_mirror.config import AsteriskConfig
+from asterisk_mirror.config import AsteriskConfig, ConfigWatcher
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
 
 class TestAsteriskConfig(unittest.TestCase):
     def test_singleton(self):
@@ -27,3 +33,69 @@ class TestAsteriskConfig(unittest.TestCase):
         assert config.get('System.transition', int) == 300
         assert config.get('System.transition', float) == 300.0
         assert config.get('FlucLogic.fluctuate', bool) == False
+
+    def test_snapshot(self):
+        snapshot = AsteriskConfig().load().snapshot
+        assert snapshot.System.transition == 300
+        assert snapshot.FlucLogic.fluctuate == False
+        assert snapshot.MorseLogic.message == 'asterisk'
+        with self.assertRaises(AttributeError):
+            snapshot.System.transition = 10
+        with self.assertRaises(AttributeError):
+            snapshot.System.unknown
+
+    def test_validation(self):
+        path = self._write("[FlucLogic]\nrate = fast\n")
+        with self.assertRaises(ValueError):
+            AsteriskConfig().load([path])
+        path = self._write("[MorseLogic]\neasing = bounce\n")
+        with self.assertRaises(ValueError):
+            AsteriskConfig().load([path])
+        path = self._write("[MorseLogic]\nmessage = astérisk\n")
+        with self.assertRaises(ValueError):
+            AsteriskConfig().load([path])
+        for source in ("ftp:/x", "file:"):
+            path = self._write("[MorseLogic]\nsource = " + source + "\n")
+            with self.assertRaises(ValueError):
+                AsteriskConfig().load([path])
+        for line in ("sink = syslog", "sink = file:", "rate = -1", "capacity = 0"):
+            path = self._write("[Log]\n" + line + "\n")
+            with self.assertRaises(ValueError):
+                AsteriskConfig().load([path])
+        AsteriskConfig().load()
+
+    def test_lazy_logics(self):
+        # the message check leaves the logics to LogicRegistry (in a fresh interpreter: other tests import them)
+        script = "import sys; from asterisk_mirror.config import AsteriskConfig; AsteriskConfig(); sys.exit('asterisk_mirror.logics' in sys.modules)"
+        assert subprocess.run([sys.executable, '-c', script], capture_output=True).returncode == 0
+
+    def test_reload(self):
+        path = self._write("[System]\ntransition = 60\n")
+        config = AsteriskConfig().load([path])
+        generation = config.generation
+        assert not config.changed()
+        # an invalid change keeps the current snapshot
+        self._write("[System]\ntransition = soon\n", path, 1)
+        assert config.changed()
+        assert not config.reload()
+        assert config.get('System.transition', int) == 60
+        # a valid change swaps the snapshot
+        self._write("[System]\ntransition = 120\n", path, 2)
+        watcher = ConfigWatcher(config, 0.01)
+        watcher.start()
+        for _ in range(100):
+            if config.generation != generation:
+                break
+            time.sleep(0.01)
+        watcher.stop()
+        assert config.generation == generation+1
+        assert config.snapshot.System.transition == 120
+        AsteriskConfig().load()
+
+    def _write(self, text: str, path: str=None, age: int=0) -> str:
+        path = path or os.path.join(tempfile.mkdtemp(), 'asterisk-mirror.cfg')
+        with open(path, 'w') as f:
+            f.write(text)
+        # distinct modification times
+        os.utime(path, ns=(age*1000000000, age*1000000000))
+        return path
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import json
+import os
+import socket
+import tempfile
+from urllib.request import urlopen, Request
+from urllib.error import HTTPError
+
+from asterisk_mirror.config import AsteriskConfig
+from asterisk_mirror.control import ControlServer
+from asterisk_mirror.main import AsteriskMirror
+
+import time
+
+class TestControlServer(unittest.TestCase):
+    def setUp(self):
+        AsteriskConfig().load()
+        self.mirror = AsteriskMirror()
+        self.server = ControlServer(self.mirror, '127.0.0.1:0')
+        self.server.start()
+        host, port = self.server.address()
+        self.url = 'http://%s:%d' % (host, port)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def post(self, path: str, data: dict=None) -> dict:
+        request = Request(self.url + path, json.dumps(data or {}).encode('utf-8'))
+        return json.loads(urlopen(request).read().decode('utf-8'))
+
+    def test_state(self):
+        state = json.loads(urlopen(self.url + '/state').read().decode('utf-8'))
+        assert state['logic'] is None
+        assert state['logics'] == ['MorseLogic', 'YearLogic', 'FlucLogic']
+        assert state['position'] == 0
+        assert state['paused'] == False
+        assert state['message'] == 'asterisk'
+
+    def test_controls(self):
+        state = self.post('/logic', {'name': 'FlucLogic'})
+        assert self.mirror.selected_index == 2
+        state = self.post('/message', {'message': 'hello world'})
+        assert state['message'] == 'hello world'
+        assert self.mirror.logics[0].morse.startswith('.... . .-.. .-.. ---')
+        state = self.post('/speed', {'logic': 'YearLogic', 'speed': 2.0})
+        assert state['speeds']['YearLogic'] == 2.0
+        state = self.post('/pause')
+        assert state['paused'] == True
+        state = self.post('/resume')
+        assert state['paused'] == False
+
+    def test_errors(self):
+        for path, data in (('/logic', {'name': 'NoLogic'}), ('/message', {'message': '#'}), ('/speed', {}),
+                ('/speed', {'speed': float('nan')}), ('/speed', {'speed': float('inf')})):
+            with self.assertRaises(HTTPError) as cm:
+                self.post(path, data)
+            assert cm.exception.code == 400
+        with self.assertRaises(HTTPError) as cm:
+            self.post('/reboot')
+        assert cm.exception.code == 404
+
+    def test_unix_socket(self):
+        path = os.path.join(tempfile.mkdtemp(), 'control.sock')
+        server = ControlServer(self.mirror, path)
+        server.start()
+        try:
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(path)
+            client.sendall(b'GET /state HTTP/1.0\r\n\r\n')
+            response = b''
+            while True:
+                data = client.recv(4096)
+                if not data:
+                    break
+                response += data
+            client.close()
+            assert b'"logics": ["MorseLogic", "YearLogic", "FlucLogic"]' in response
+        finally:
+            server.stop()
+        assert not os.path.exists(path)
+
+class TestSelectLogic(unittest.TestCase):
+    def test_select_logic(self):
+        AsteriskConfig().load()
+        mirror = AsteriskMirror()
+        mirror.start()
+        try:
+            time.sleep(0.01) # wait for starting threads
+            assert mirror.logic_index == 0
+            # jumps without waiting out the transition
+            mirror.select_logic('FlucLogic')
+            time.sleep(0.05)
+            assert mirror.logic_index == 2
+            assert mirror.state()['logic'] == 'FlucLogic'
+        finally:
+            mirror.stop()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest.mock import patch
+
+from asterisk_mirror import easing
+from asterisk_mirror.easing import delay_table, velocity_profile
+from asterisk_mirror.stepper import Stepper
+
+class TestEasing(unittest.TestCase):
+    def test_linear(self):
+        offsets = delay_table(10, 2.0, 'linear', 0.001)
+        assert list(offsets) == [500000*i for i in range(1, 11)]
+
+    def test_profiles(self):
+        for name in ('trapezoid', 'scurve', 'sine'):
+            profile = list(velocity_profile(1000, name))
+            # accelerates, cruises at the full speed and decelerates symmetrically
+            assert profile[0] < 0.3
+            assert profile[500] == 1.0
+            assert profile == profile[::-1]
+            assert all(a <= b for a, b in zip(profile[:500], profile[1:501]))
+            # an eased move takes longer than a linear one
+            assert delay_table(1000, 1.0, name)[-1] > delay_table(1000, 1.0)[-1]
+
+    def test_cache(self):
+        assert delay_table(40, 1.0, 'sine') is delay_table(40, 1.0, 'sine')
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            velocity_profile(10, 'bounce')
+
+    def test_without_numpy(self):
+        with patch.object(easing, 'numpy', None):
+            easing.velocity_profile.cache_clear()
+            easing.delay_table.cache_clear()
+            profile = velocity_profile(1000, 'trapezoid')
+            offsets = delay_table(1000, 1.0, 'trapezoid')
+        easing.velocity_profile.cache_clear()
+        easing.delay_table.cache_clear()
+        assert abs(profile[0] - velocity_profile(1000, 'trapezoid')[0]) < 1e-9
+        assert abs(offsets[-1] - delay_table(1000, 1.0, 'trapezoid')[-1]) <= 1
+
+    def test_rotate_with_easing(self):
+        stepper = Stepper(base_time=0.00001)
+        steps = stepper.rotate_by_steps(-100, 1.0, 'scurve')
+        assert steps == -100
+        assert stepper.current_step == stepper.number_of_steps-100
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest.mock import MagicMock, patch
+
+from asterisk_mirror.gpio import RecordingBackend, WaveformBackend, create_backend
+from asterisk_mirror.stepper import Stepper
+
+from threading import Thread
+import time
+
+class TestRecordingBackend(unittest.TestCase):
+    def test_ring_buffer(self):
+        backend = RecordingBackend(capacity=4)
+        for i in range(6):
+            backend.output(i, True)
+        # the oldest edges were overwritten
+        assert [pin for _, pin, _ in backend.edges()] == [2, 3, 4, 5]
+
+    def test_step_pulses(self):
+        backend = RecordingBackend()
+        stepper = Stepper([1,2,3], base_time=0.001, backend=backend)
+        backend.clear()
+        started = stepper.clock.monotonic_ns()
+        stepper.rotate_by_steps(-10)
+        pulses = backend.pulses(1)
+        assert len(pulses) == 10
+        # direction is low-active for negative steps
+        assert (2, True) in [(pin, value) for _, pin, value in backend.edges()]
+        # a pulse every 1ms: the 10th one never before its deadline at 9ms, whenever the 1st one came
+        assert 9000000 <= pulses[-1] - started < 20000000
+
+    def test_pulse_train(self):
+        backend = RecordingBackend(batched=True)
+        stepper = Stepper([1,2,3], base_time=0.0001, backend=backend)
+        backend.clear()
+        steps = stepper.rotate_by_steps(20)
+        assert steps == 20
+        assert stepper.current_step == 20
+        pulses = backend.pulses(1)
+        assert len(pulses) == 20
+        assert [b-a for a, b in zip(pulses, pulses[1:])] == [100000]*19
+        # the direction is set up before the 1st step
+        edges = [edge for edge in backend.edges() if edge[1] in (1, 2)]
+        assert edges[0][1] == 2 and edges[1][1] == 1
+        assert edges[1][0] - edges[0][0] == stepper.direction_setup
+
+    def test_early_wakeup(self):
+        backend = RecordingBackend(batched=True)
+        stepper = Stepper([1,2,3], base_time=0.0001, backend=backend)
+        backend.clear()
+        # the host wakes before the end of the train
+        stepper.wait_until = lambda deadline: True
+        assert stepper.rotate_by_steps(20) == 20
+        assert len(backend.pulses(1)) == 20
+
+    def test_interrupt_pulse_train(self):
+        backend = RecordingBackend(batched=True)
+        stepper = Stepper([1,2,3], base_time=0.001, backend=backend)
+        backend.clear()
+        def interrupt():
+            time.sleep(0.02)
+            stepper.interrupt()
+        thread = Thread(target=interrupt)
+        thread.start()
+        steps = stepper.rotate_by_steps(1000)
+        thread.join()
+        # only the pulses played before the interrupt are counted and recorded
+        assert 0 < steps < 100
+        assert stepper.current_step == steps
+        assert len(backend.pulses(1)) == steps
+
+    def test_create_backend(self):
+        assert isinstance(create_backend('recording'), RecordingBackend)
+        with self.assertRaises(ValueError):
+            create_backend('unknown')
+
+class TestWaveformBackend(unittest.TestCase):
+    def test_send(self):
+        with patch('asterisk_mirror.gpio.pigpio') as pigpio:
+            pigpio.pulse.side_effect = lambda on, off, delay: delay
+            backend = WaveformBackend()
+            # step edges 1.5 usecs apart: whole usecs each would drift 0.5 usecs a pulse
+            edges = [(i*1500, 1, i % 2 == 0) for i in range(1000)]
+            backend.send(edges)
+            delays = backend.pi.wave_add_generic.call_args[0][0]
+            assert sum(delays) == edges[-1][0]//1000
+            assert set(delays[:-1]) == {1, 2}
+
+if __name__ == '__main__':
+    unittest.main()
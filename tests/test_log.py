@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import io
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+from asterisk_mirror.log import Logger, LogWriter
+
+class SlowFile:
+    # a sink stalled like a slow SD card
+    def __init__(self):
+        self.lines = []
+
+    def write(self, text: str):
+        time.sleep(0.2)
+        self.lines.extend(text.splitlines())
+
+    def flush(self):
+        pass
+
+class TestLog(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.log')
+        os.close(fd)
+        self.writer = LogWriter('info', 'file:' + self.path)
+        self.writer.interval = 10 # drained by the tests
+        self.log = Logger('Stepper', self.writer)
+
+    def tearDown(self):
+        self.writer.stop()
+        os.remove(self.path)
+
+    def read(self) -> list:
+        self.writer.flush()
+        with open(self.path) as f:
+            return f.read().splitlines()
+
+    def test_format(self):
+        self.log.info("homed", position=0, moved=812)
+        self.log.debug("interrupting...")
+        lines = self.read()
+        assert len(lines) == 1
+        assert lines[0].endswith(" INFO Stepper: homed position=0 moved=812")
+
+    def test_rate_limit(self):
+        for i in range(100):
+            self.log.info("wait:", i)
+        lines = self.read()
+        # 20 a sec (or 40 if a window of a sec is over on the way)
+        assert 20 <= len(lines) <= 40
+        # the suppressed records are counted once the window is over
+        self.writer._roll(time.time()+1)
+        assert "WARNING Stepper: suppressed" in self.read()[-1]
+
+    def test_capacity(self):
+        self.writer.configure('info', 'file:' + self.path, 0, 16)
+        for i in range(100):
+            self.log.info("step:", i)
+        lines = self.read()
+        assert len(lines) == 17
+        assert lines[0].endswith("Stepper: step: 84")
+        assert lines[-1].endswith("Log: dropped 84 records")
+
+    def test_nonblocking(self):
+        sink = SlowFile()
+        self.writer.interval = 0.1
+        self.writer._open = lambda: sink
+        self.log.info("first")
+        time.sleep(0.15) # the writer is stalled in the sink
+        started = time.perf_counter()
+        for i in range(1000):
+            self.log.info("step:", i)
+        assert time.perf_counter() - started < 0.05
+        self.writer.stop()
+        assert sink.lines[0].endswith("Stepper: first")
+        assert len(sink.lines) >= 1+20
+
+    def test_configure(self):
+        with self.assertRaises(ValueError):
+            self.writer.configure('verbose')
+        with self.assertRaises(ValueError):
+            self.writer.configure('info', 'syslog')
+
+    def test_failed_sink(self):
+        # a directory below a file cannot be created
+        self.writer.configure('info', 'file:' + os.path.join(self.path, 'mirror.log'))
+        stderr = io.StringIO()
+        with patch('sys.stderr', stderr):
+            self.log.info("first")
+            self.writer.flush()
+            self.log.info("second")
+            self.writer.flush()
+        lines = stderr.getvalue().splitlines()
+        assert len(lines) == 3
+        assert "ERROR Log: cannot write to file:" in lines[0]
+        assert lines[2].endswith("Stepper: second")
+        # a working sink again
+        self.writer.configure('info', 'file:' + self.path)
+        self.log.info("third")
+        assert self.read()[-1].endswith("Stepper: third")
+
+if __name__ == '__main__':
+    unittest.main()
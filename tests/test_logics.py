@@ -3,7 +3,10 @@
 import unittest
 from unittest.mock import patch, MagicMock
 
-from asterisk_mirror.logics import AsteriskLogic, MorseLogic, YearLogic
+from asterisk_mirror.logics import AsteriskLogic, MorseLogic, YearLogic, FlucLogic, compile_morse
+from asterisk_mirror.clock import VirtualClock
+from asterisk_mirror.planner import Rest
+from asterisk_mirror.gpio import RecordingBackend
 from asterisk_mirror.stepper import Stepper
 
 import time
@@ -41,10 +44,25 @@ class TestMorseLogic(unittest.TestCase):
             logic.set_message(message)
             assert logic.morse == morse
 
+    def test_compile_morse(self):
+        steps, holds = compile_morse("... --- ...", 40, 0.1)
+        assert list(steps) == [40, 40, 40, 120, 120, 120, 40, 40, 40]
+        # gaps are merged into the hold of the preceding symbol
+        assert [round(hold/0.1) for hold in holds] == [1, 1, 3, 1, 1, 3, 1, 1, 9]
+        # a leading gap and an empty message
+        steps, holds = compile_morse("/ .", 40, 0.1)
+        assert list(steps) == [0, 40]
+        assert [round(hold/0.1) for hold in holds] == [6, 9]
+        steps, holds = compile_morse("", 40, 0.1)
+        assert list(steps) == [0] and list(holds) == [0.8]
+        # compiled once per message, speed and steps
+        assert compile_morse("... --- ...", 40, 0.1) is compile_morse("... --- ...", 40, 0.1)
+
     def test_execute(self):
-        def add_rotate_steps(rotate_steps:int, speed: float):
+        def add_rotate_steps(rotate_steps:int, offsets: list):
             #print("steps: ", rotate_steps, flush=True)
             self.rotate_steps += rotate_steps
+            return rotate_steps
         def add_wait_duration(wait_duration:float):
             #print("wait: ", wait_duration, flush=True)
             self.wait_duration += wait_duration
@@ -52,9 +70,11 @@ class TestMorseLogic(unittest.TestCase):
         with patch('asterisk_mirror.stepper.Stepper') as StepperMock:
             stepper = StepperMock()
             stepper.is_interrupted.return_value = False
-            stepper.rotate_by_steps.side_effect = add_rotate_steps
+            stepper.rotate_by_offsets.side_effect = add_rotate_steps
             stepper.wait.side_effect = add_wait_duration
             stepper.base_time = 0.001
+            stepper.number_of_steps = 1600
+            stepper.current_step = 0
             for message, morse in self.test_morses.items():
                 self.rotate_steps = 0
                 self.wait_duration = 0
@@ -72,21 +92,117 @@ class TestMorseLogic(unittest.TestCase):
                 assert self.rotate_steps == rotate_steps
                 assert int(round(self.wait_duration/logic.dot_interval)+rotate_steps/logic.dot_steps) == duration
 
+    def test_moves(self):
+        logic = MorseLogic(Stepper(backend=RecordingBackend(), clock=VirtualClock()))
+        logic.set_message("SOS")
+        items = list(logic.moves())
+        moves = [item for item in items if isinstance(item, tuple)]
+        # the planned runs of execute(): a dot or a dash each, timed by offsets
+        assert [steps for steps, _ in moves] == [40, 40, 40, 120, 120, 120, 40, 40, 40]
+        assert all(len(offsets) == steps for steps, offsets in moves)
+        assert round(sum(item for item in items if not isinstance(item, tuple))/logic.dot_interval) == 1+1+3+1+1+3+1+1+9
+
 class TestYearLogic(unittest.TestCase):
     def _calc(self) -> int:
         return 0
     
     def test_20180602(self):
-        with patch('asterisk_mirror.stepper.Stepper') as StepperMock:
-            stepper = StepperMock()
-            logic = YearLogic(stepper, datetime(2018, 6, 2))
+        stepper = Stepper(backend=RecordingBackend(), clock=VirtualClock())
+        logic = YearLogic(stepper, datetime(2018, 6, 2))
+        logic.execute()
+        # angle: 0.83286 rad -> 150 deg
+        # echo "scale=5; ( `date -ju 0602000018 +%s` - `date -ju 0101000018 +%s` ) / ( `date -ju 0101000019 +%s` - `date -ju 0101000018 +%s` ) * 2.0" | bc
+        assert round(stepper.current_step/stepper.number_of_steps*360) == 150
+
+    def test_sleep_until_boundary(self):
+        start = datetime(2018, 6, 2).timestamp()
+        clock = VirtualClock(start=start)
+        stepper = Stepper(backend=RecordingBackend(), clock=clock)
+        logic = YearLogic(stepper)
+        wakeups = []
+        wait = stepper.wait
+        def count_wait(time: float):
+            wakeups.append(time)
+            wait(time)
+        stepper.wait = count_wait
+        logic.execute()
+        position = stepper.current_step
+        # one step per boundary (a year / 1600 steps = 5.475 hours) over a day
+        while clock.time() < start + 24*60*60:
             logic.execute()
-            # angle: 0.83286 rad -> 150 deg
-            # echo "scale=5; ( `date -ju 0602000018 +%s` - `date -ju 0101000018 +%s` ) / ( `date -ju 0101000019 +%s` - `date -ju 0101000018 +%s` ) * 2.0" | bc
-            args, _ = stepper.set_angle.call_args
-            # print("call_args:", args[0]*180)
-            assert round(args[0]*180) == 150
+        assert stepper.current_step - position == 4
+        assert len(stepper.backend.pulses(stepper.step_pin)) == position + 4
+        # wakes up every max_sleep secs at most instead of every 10 secs
+        assert len(wakeups) <= 24*60*60/logic.max_sleep + 15
+
+    def test_clock_jump(self):
+        start = datetime(2018, 6, 2).timestamp()
+        clock = VirtualClock(start=start)
+        stepper = Stepper(backend=RecordingBackend(), clock=clock)
+        logic = YearLogic(stepper)
+        logic.execute()
+        position = stepper.current_step
+        # the wall clock is set 10 days ahead while sleeping
+        def jump():
+            clock.epoch += 10*24*60*60
+        clock.schedule(60, jump)
+        started = clock.monotonic_ns()
+        logic.execute()
+        assert clock.monotonic_ns() - started <= (60+logic.max_sleep)*1000000000
+        logic.execute()
+        assert stepper.current_step - position == round(10*1600/365)
+
+    def test_moves(self):
+        start = datetime(2018, 6, 2).timestamp()
+        clock = VirtualClock(start=start)
+        stepper = Stepper(backend=RecordingBackend(), clock=clock)
+        logic = YearLogic(stepper)
+        moves = logic.moves()
+        steps, offsets = next(moves)
+        # the move of set_angle, then holds up to the next step boundary
+        assert steps == int(1600*2.0*(start-datetime(2018, 1, 1).timestamp())/(datetime(2019, 1, 1).timestamp()-datetime(2018, 1, 1).timestamp())/2.0)
+        assert len(offsets) == steps
+        hold = moves.send(steps)
+        # the driver is disabled until the boundary
+        assert isinstance(hold, Rest) and 0 < hold <= logic.max_sleep
+
+class TestFlucLogic(unittest.TestCase):
+    def test_execute(self):
+        clock = VirtualClock()
+        backend = RecordingBackend()
+        stepper = Stepper([1,2,3], backend=backend, clock=clock)
+        logic = FlucLogic(stepper)
+        logic.fluctuate = True
+        # the reference: the per-step intermittent map
+        fluc = 0.4
+        offsets = []
+        elapsed = 0
+        for _ in range(3000):
+            fluc = fluc+2*fluc*fluc if fluc < 0.5 else fluc-2*(1-fluc)*(1-fluc)
+            elapsed += int(stepper.base_time/logic.speed*(1-logic.rate+fluc*logic.rate)*1000000000)
+            offsets.append(elapsed)
+        # interrupt in the middle of the 3rd chunk
+        clock.schedule(offsets[2500-1]/1000000000, stepper.interrupt)
+        logic.execute()
+        pulses = backend.pulses(1)
+        assert len(pulses) == 2500
+        # every step of every chunk follows the map exactly
+        assert [pulse-pulses[0] for pulse in pulses[1:]] == offsets[:2500-1]
+
+    def test_moves(self):
+        stepper = Stepper([1,2,3], backend=RecordingBackend(), clock=VirtualClock())
+        logic = FlucLogic(stepper)
+        moves = logic.moves()
+        # a chunk of delays as one move
+        steps, offsets = next(moves)
+        assert steps == logic.chunk_steps and len(offsets) == steps
+        assert offsets == sorted(offsets)
+        assert moves.send(steps)[0] == logic.chunk_steps
 
+    def test_drive(self):
+        # no moves: the logic runs blocking only
+        assert AsteriskLogic(Stepper(backend=RecordingBackend())).drive() is None
+        assert FlucLogic(Stepper(backend=RecordingBackend())).drive() is not None
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
 import unittest
+import os
+import tempfile
 from unittest.mock import patch, MagicMock
 
+from asterisk_mirror.config import AsteriskConfig
 from asterisk_mirror.main import AsteriskMirror
 
 import time
@@ -20,5 +23,63 @@ class TestAsterisk(unittest.TestCase):
         time.sleep(0.01) # wait for stopping threads
         assert asterisk.stop_event.is_set() == True
 
+    def test_apply_config(self):
+        AsteriskConfig().load()
+        asterisk = AsteriskMirror()
+        assert asterisk.logics[0].message == 'asterisk'
+        # a reloaded config is applied at the next transition
+        AsteriskConfig().load(['tests/asterisk-mirror.cfg'])
+        asterisk.apply_config()
+        assert asterisk.transition == 60
+        assert asterisk.logics[0].message == 'hello h.o world!'
+        AsteriskConfig().load()
+
+    def test_lazy_logics(self):
+        AsteriskConfig().load()
+        asterisk = AsteriskMirror()
+        assert not any(logic.loaded for logic in asterisk.logics)
+        asterisk.next_logic()
+        asterisk.logics[0].get()
+        # released when the next scene becomes active
+        asterisk.next_logic()
+        assert not asterisk.logics[0].loaded
+        assert asterisk.state()['message'] == 'asterisk'
+
+    def test_home(self):
+        fd, path = tempfile.mkstemp(suffix='.cfg')
+        with os.fdopen(fd, 'w') as f:
+            f.write("[System]\ngpio = simulated\nhome_pin = 26\nhome_interval = 60\n")
+        AsteriskConfig().load([path])
+        asterisk = AsteriskMirror()
+        AsteriskConfig().load()
+        asterisk.stepper.backend.position = 300
+        # at startup, then every home_interval secs
+        asterisk.home()
+        assert asterisk.stepper.backend.position == 0
+        asterisk.stepper.rotate_by_steps(10)
+        asterisk.home()
+        assert asterisk.stepper.current_step == 10
+        asterisk.homed_at -= 60
+        asterisk.home()
+        assert asterisk.stepper.current_step == 0
+        assert asterisk.stepper.backend.position == 0
+
+    def test_pause_before_scene(self):
+        AsteriskConfig().load()
+        asterisk = AsteriskMirror()
+        runs = []
+        for logic in asterisk.logics:
+            logic.run = lambda clear=True: runs.append(clear)
+        # paused after the run loop has checked the pause
+        apply_config = asterisk.apply_config
+        def pause_on_apply():
+            apply_config()
+            asterisk.pause()
+        asterisk.apply_config = pause_on_apply
+        asterisk.start()
+        time.sleep(0.05)
+        asterisk.stop()
+        assert runs == []
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from asterisk_mirror.clock import VirtualClock
+from asterisk_mirror.easing import delay_table
+from asterisk_mirror.gpio import RecordingBackend
+from asterisk_mirror.logics import MorseLogic
+from asterisk_mirror.planner import MotionPlanner, shortest_steps, blend
+from asterisk_mirror.stepper import Stepper
+
+class TestMotionPlanner(unittest.TestCase):
+    def create(self) -> Stepper:
+        return Stepper(backend=RecordingBackend(), clock=VirtualClock())
+
+    def test_shortest_steps(self):
+        assert shortest_steps(1590, 10, 1600) == 20
+        assert shortest_steps(10, 1590, 1600) == -20
+        assert shortest_steps(0, 800, 1600) == 800
+        assert shortest_steps(200, 1200, 1600) == -600
+
+    def test_set_angle(self):
+        stepper = self.create()
+        stepper.rotate_by_steps(1590)
+        # wraps around instead of sweeping back
+        assert stepper.set_angle(10/800) == 20
+        assert stepper.current_step == 10
+
+    def test_coalesce(self):
+        planner = MotionPlanner(self.create())
+        planner.move_by(40).move_by(40).move_by(-10).hold(0.1).move_by(-10).move_to(0)
+        assert planner.segments == [[80, 1.0, 'linear', 0.0], [-10, 1.0, 'linear', 0.1], [-70, 1.0, 'linear', 0.0]]
+        assert [(steps, hold) for steps, _, hold in planner.plan()] == [(80, 0.0), (-10, 0.1), (-70, 0.0)]
+
+    def test_blend(self):
+        planner = MotionPlanner(self.create())
+        planner.move_by(400, 1.0, 'trapezoid').move_by(400, 2.0, 'trapezoid')
+        runs = planner.plan()
+        assert len(runs) == 1
+        steps, offsets, _ = runs[0]
+        assert steps == 800
+        # faster than two moves which stop in between
+        separate = delay_table(400, 1.0, 'trapezoid', 0.001)[-1] + delay_table(400, 2.0, 'trapezoid', 0.001)[-1]
+        assert offsets[-1] < separate
+        # no stop at the joint: the speed stays between both speeds
+        intervals = [b-a for a, b in zip(offsets, offsets[1:])]
+        assert all(500000-1 <= interval <= 1000000+1 for interval in intervals[300:500])
+        assert blend(((400, 1.0), (400, 2.0)), 'trapezoid', 0.001) is blend(((400, 1.0), (400, 2.0)), 'trapezoid', 0.001)
+
+    def test_execute(self):
+        stepper = self.create()
+        planner = MotionPlanner(stepper)
+        planner.move_by(40).hold(0.1).move_by(120).hold(0.1).move_to(0)
+        assert planner.execute() == 0
+        assert stepper.current_step == 0
+        # the driver is enabled once for the sequence (active low)
+        enables = [value for _, pin, value in stepper.backend.edges() if pin == stepper.enable_pin]
+        assert enables == [False, False, True]
+
+    def test_morse(self):
+        stepper = self.create()
+        logic = MorseLogic(stepper)
+        logic.set_message("SOS")
+        logic.execute()
+        assert len(stepper.backend.pulses(stepper.step_pin)) == 6*logic.dot_steps + 3*3*logic.dot_steps
+        enables = [value for _, pin, value in stepper.backend.edges() if pin == stepper.enable_pin]
+        assert enables == [False, False, True]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import tempfile
+
+from asterisk_mirror.config import AsteriskConfig
+from asterisk_mirror.logics import FlucLogic
+from asterisk_mirror.main import AsteriskMirror
+from asterisk_mirror.process import ProcessStepper
+
+from threading import Thread
+import time
+
+class TestProcessStepper(unittest.TestCase):
+    def setUp(self):
+        self.stepper = ProcessStepper([1,2,3], base_time=0.0001, backend='recording')
+
+    def tearDown(self):
+        self.stepper.exit()
+        assert not self.stepper.process.is_alive()
+
+    def test_rotate(self):
+        steps = self.stepper.rotate_by_steps(100, 10)
+        assert steps == 100
+        assert self.stepper.current_step == 100
+        steps = self.stepper.set_angle(-0.5)
+        assert steps == -500
+        assert self.stepper.current_step == 1200
+        # queued steps are shared back
+        for _ in range(10):
+            self.stepper.step(-1)
+        self.stepper.rotate_by_steps(10)
+        assert self.stepper.current_step == 1200
+
+    def test_position(self):
+        self.stepper.current_step = 1610
+        assert self.stepper.current_step == 10
+        assert self.stepper.reset() == -10
+
+    def test_interrupt(self):
+        def interrupt():
+            time.sleep(0.02)
+            self.stepper.interrupt()
+        thread = Thread(target=interrupt)
+        thread.start()
+        steps = self.stepper.rotate_by_steps(100000)
+        thread.join()
+        assert 0 < steps < 100000
+        assert self.stepper.current_step == steps % self.stepper.number_of_steps
+        assert self.stepper.is_interrupted()
+        self.stepper.clear()
+        assert not self.stepper.is_interrupted()
+
+    def test_delays(self):
+        stepper = ProcessStepper([1,2,3], base_time=0.0001, backend='recording', delay_capacity=16)
+        try:
+            # more delays than the shared buffer are sent in chunks
+            assert stepper.rotate_by_delays([0.0001]*40, -1) == -40
+            assert stepper.current_step == 1560
+        finally:
+            stepper.exit()
+
+    def test_fluc(self):
+        AsteriskConfig().load(['tests/asterisk-mirror.cfg'])
+        try:
+            logic = FlucLogic(self.stepper)
+            thread = Thread(target=logic.run)
+            thread.start()
+            time.sleep(0.2)
+            self.stepper.interrupt()
+            thread.join()
+            assert self.stepper.current_step > 0
+        finally:
+            AsteriskConfig().load()
+
+    def test_no_telemetry(self):
+        path = os.path.join(tempfile.mkdtemp(), 'asterisk-mirror.cfg')
+        with open(path, 'w') as f:
+            f.write("[System]\ngpio = recording\nprocess = True\n[Telemetry]\nenabled = True\n")
+        AsteriskConfig().load([path])
+        mirror = AsteriskMirror()
+        try:
+            # the child process steps: no metrics of zeros
+            assert mirror.stepper.telemetry is None
+            assert mirror.metrics_server is None
+        finally:
+            mirror.stop()
+            AsteriskConfig().load()
+
+if __name__ == '__main__':
+    unittest.main()
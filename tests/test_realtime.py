@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest.mock import patch
+import os
+
+from asterisk_mirror import realtime
+from asterisk_mirror.realtime import apply_realtime, parse_cpus
+
+from threading import Thread
+
+class TestRealtime(unittest.TestCase):
+    def test_parse_cpus(self):
+        assert parse_cpus('') == []
+        assert parse_cpus('3') == [3]
+        assert parse_cpus('0-2, 5') == [0, 1, 2, 5]
+
+    def test_none(self):
+        assert apply_realtime() == {}
+
+    def test_affinity(self):
+        cpus = sorted(os.sched_getaffinity(0))[:1]
+        results = []
+        # applies to the calling thread only
+        thread = Thread(target=lambda: results.append(apply_realtime(cpus=cpus)))
+        thread.start()
+        thread.join()
+        assert results[0]['cpus'] == cpus
+
+    def test_degrade(self):
+        def deny(*args):
+            raise PermissionError(1, 'Operation not permitted')
+        with patch.object(os, 'sched_setscheduler', deny), patch.object(realtime, 'set_memory_lock', lambda: False):
+            obtained = apply_realtime(policy='fifo', priority=50, lock_memory=True)
+        assert obtained == {}
+
+    def test_settings(self):
+        # the settings of AsteriskMirror as they are
+        with patch.object(realtime, 'set_memory_lock', lambda: True):
+            obtained = apply_realtime(**{'policy': 'none', 'priority': 50, 'cpus': [], 'lock_memory': True})
+        assert obtained == {'lock_memory': True}
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import tempfile
+from importlib import metadata
+from unittest.mock import patch
+
+from asterisk_mirror.config import AsteriskConfig
+from asterisk_mirror.gpio import RecordingBackend
+from asterisk_mirror.logics import AsteriskLogic
+from asterisk_mirror.registry import LogicRegistry, LazyLogic
+from asterisk_mirror.stepper import Stepper
+
+class TideLogic(AsteriskLogic):
+    # a logic of another package
+    def execute(self):
+        self.stepper.rotate_by_steps(10)
+
+class TestLogicRegistry(unittest.TestCase):
+    def setUp(self):
+        AsteriskConfig().load()
+        self.stepper = Stepper(backend=RecordingBackend())
+
+    def test_entry_points(self):
+        entry_points = [
+            metadata.EntryPoint('TideLogic', 'tests.test_registry:TideLogic', LogicRegistry.group),
+            metadata.EntryPoint('MorseLogic', 'tests.test_registry:TideLogic', LogicRegistry.group),
+        ]
+        with patch('asterisk_mirror.registry._entry_points', return_value=entry_points):
+            registry = LogicRegistry()
+        assert registry.names() == ['MorseLogic', 'YearLogic', 'FlucLogic', 'TideLogic']
+        # the built-in logics are not replaced
+        assert registry.load('MorseLogic').__module__ == 'asterisk_mirror.logics'
+        assert isinstance(registry.create('TideLogic', self.stepper), TideLogic)
+        assert set(registry.import_times) == {'MorseLogic', 'TideLogic'}
+        with self.assertRaises(ValueError):
+            registry.load('SunLogic')
+
+    def test_lazy(self):
+        registry = LogicRegistry()
+        logic = LazyLogic(registry, 'MorseLogic', self.stepper)
+        assert str(logic) == 'MorseLogic'
+        assert not logic.loaded
+        assert logic.message == 'asterisk'
+        assert logic.loaded
+        logic.release()
+        assert not logic.loaded
+        with self.assertRaises(ValueError):
+            LazyLogic(registry, 'SunLogic', self.stepper)
+
+    def test_overrides(self):
+        logic = LazyLogic(LogicRegistry(), 'MorseLogic', self.stepper)
+        logic.set_message('sos')
+        logic.set_speed(2.0)
+        logic.release()
+        # applied again when the scene becomes active
+        assert logic.message == 'sos'
+        assert logic.get_speed() == 2.0
+        # until a reloaded config replaces them
+        logic.configure()
+        logic.release()
+        assert logic.message == 'asterisk'
+
+    def test_source(self):
+        fd, path = tempfile.mkstemp(suffix='.cfg')
+        os.write(fd, b"[MorseLogic]\nsource = queue\n")
+        os.close(fd)
+        AsteriskConfig().load([path])
+        try:
+            logic = LazyLogic(LogicRegistry(), 'MorseLogic', self.stepper)
+            source = logic.source
+            source.put("sos")
+            logic.release()
+            # the next scene reads on from the same source
+            assert logic.source is source
+            assert logic.source.next_word() == "sos"
+            assert not source.closed.is_set()
+        finally:
+            AsteriskConfig().load()
+            os.remove(path)
+        # closed when the config names another source
+        logic.configure()
+        assert source.closed.is_set()
+
+if __name__ == '__main__':
+    unittest.main()
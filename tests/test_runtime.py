@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import json
+import os
+import tempfile
+from urllib.request import urlopen
+
+from asterisk_mirror.config import AsteriskConfig
+from asterisk_mirror.main import AsteriskMirror
+
+import time
+
+class TestAsyncRuntime(unittest.TestCase):
+    def setUp(self):
+        fd, path = tempfile.mkstemp(suffix='.cfg')
+        with os.fdopen(fd, 'w') as f:
+            f.write("[System]\nruntime = asyncio\ngpio = recording\ntransition = 1\n[Control]\nlisten = 127.0.0.1:0\n")
+        AsteriskConfig().load([path])
+        self.mirror = AsteriskMirror()
+
+    def tearDown(self):
+        self.mirror.stop()
+        AsteriskConfig().load()
+
+    def wait_for(self, condition, timeout: float=2.0):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_transitions(self):
+        mirror = self.mirror
+        mirror.start()
+        assert self.wait_for(lambda: mirror.logic_index == 0)
+        # the transition timer runs on the loop
+        assert self.wait_for(lambda: mirror.logic_index == 1)
+        # a selected logic cancels the scene right away
+        mirror.select_logic('MorseLogic')
+        assert self.wait_for(lambda: mirror.logic_index == 0, 0.5)
+        assert len(mirror.stepper.backend.edges()) > 0
+
+    def test_control_and_pause(self):
+        mirror = self.mirror
+        mirror.start()
+        assert self.wait_for(lambda: mirror.logic_index == 0)
+        # the control server is served from the loop
+        host, port = mirror.control_server.address()
+        state = json.loads(urlopen('http://%s:%d/state' % (host, port)).read().decode('utf-8'))
+        assert state['logic'] == 'MorseLogic'
+        mirror.pause()
+        time.sleep(0.1)
+        mirror.stepper.backend.clear()
+        time.sleep(0.1)
+        assert len(mirror.stepper.backend.edges()) == 0
+        mirror.resume()
+        assert self.wait_for(lambda: len(mirror.stepper.backend.edges()) > 0)
+
+    def test_stop(self):
+        mirror = self.mirror
+        mirror.start()
+        assert self.wait_for(lambda: mirror.logic_index == 0)
+        thread = mirror.runtime.thread
+        mirror.stop()
+        assert not thread.is_alive()
+        assert mirror.runtime.loop.is_closed()
+
+if __name__ == '__main__':
+    unittest.main()
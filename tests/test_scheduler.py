@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import tempfile
+import threading
+from threading import Thread
+from unittest.mock import MagicMock
+
+from asterisk_mirror.clock import VirtualClock
+from asterisk_mirror.config import AsteriskConfig
+from asterisk_mirror.gpio import RecordingBackend
+from asterisk_mirror.logics import AsteriskLogic
+from asterisk_mirror.main import AsteriskMirror
+from asterisk_mirror.motors import Motor, MotorDriver
+from asterisk_mirror.scheduler import StepScheduler, SchedulerStepper
+
+import time
+
+class TestStepScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.scheduler = StepScheduler(self.clock)
+        self.left = SchedulerStepper(self.scheduler, [13, 19, 9], backend=RecordingBackend())
+        self.right = SchedulerStepper(self.scheduler, [20, 21, 16], backend=RecordingBackend())
+        self.scheduler.start()
+
+    def tearDown(self):
+        self.scheduler.stop()
+
+    def test_rotate(self):
+        # a blocking move of one motor
+        assert self.left.rotate_by_steps(100) == 100
+        assert self.left.current_step == 100
+        pulses = self.left.backend.pulses(13)
+        assert len(pulses) == 100
+        assert pulses[1] - pulses[0] == 1000000
+
+    def test_concurrent(self):
+        # moves of two threads are merged into one timeline
+        results = {}
+        def rotate(stepper, steps, speed):
+            results[stepper.step_pin] = stepper.rotate_by_steps(steps, speed)
+        threads = [Thread(target=rotate, args=(self.left, 100, 1.0)), Thread(target=rotate, args=(self.right, -50, 0.5))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        assert results == {13: 100, 20: -50}
+        assert self.right.current_step == 1600-50
+        assert self.left.missed_deadlines == 0 and self.right.missed_deadlines == 0
+
+    def test_group(self):
+        # phase-locked moves start at the same deadline
+        offsets = [1000000*(i+1) for i in range(10)]
+        moves = self.scheduler.group([(self.left, 10, offsets), (self.right, -10, offsets)])
+        for move in moves:
+            assert move.done.wait(5)
+        assert [move.actual_steps for move in moves] == [10, -10]
+        assert self.left.backend.pulses(13) == self.right.backend.pulses(20)
+
+    def test_interrupt(self):
+        # the scheduler thread and the rotating thread run while advance() is called
+        clock = VirtualClock(threads=2)
+        scheduler = StepScheduler(clock)
+        stepper = SchedulerStepper(scheduler, backend=RecordingBackend())
+        scheduler.start()
+        results = []
+        thread = Thread(target=lambda: results.append(stepper.rotate_by_steps(100)))
+        thread.start()
+        clock.advance(0.0105)
+        stepper.interrupt()
+        thread.join(5)
+        scheduler.stop()
+        assert results == [11]
+
+class TestMotors(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        AsteriskConfig().load()
+        self.dir.cleanup()
+
+    def mirror(self, names: list, extra: str=""):
+        path = os.path.join(self.dir.name, 'motors.cfg')
+        with open(path, 'w') as f:
+            f.write("[System]\ngpio = recording\nlogics = MorseLogic, FlucLogic\n" + extra)
+            for index, name in enumerate(names):
+                f.write("[Motor:%s]\nstep_pin = %d\ndirection_pin = %d\nenable_pin = %d\nlogics = FlucLogic, MorseLogic\n"
+                    % (name, 20+index*3, 21+index*3, 22+index*3))
+        AsteriskConfig().load([path])
+        return AsteriskMirror()
+
+    def test_motors(self):
+        mirror = self.mirror(['left'])
+        try:
+            assert [motor.name for motor in mirror.motors] == ['left']
+            motor = mirror.motors[0]
+            assert motor.stepper.scheduler is mirror.scheduler
+            mirror.start()
+            time.sleep(0.3)
+            # each motor follows its own rotation
+            state = mirror.state()
+            assert state['logic'] == 'MorseLogic'
+            assert state['motors']['left']['logic'] == 'FlucLogic'
+            assert len(motor.stepper.backend.pulses(20)) > 0
+            assert len(mirror.stepper.backend.pulses(13)) > 0
+        finally:
+            mirror.stop()
+
+    def test_threads(self):
+        # more motors, no more threads
+        counts = []
+        for names in (['left'], ['left', 'right', 'top']):
+            before = set(threading.enumerate())
+            mirror = self.mirror(names)
+            try:
+                mirror.start()
+                time.sleep(0.3)
+                counts.append(len([thread for thread in threading.enumerate() if thread not in before and thread.is_alive()]))
+                for motor in mirror.motors:
+                    assert len(motor.stepper.backend.pulses(motor.stepper.step_pin)) > 0
+            finally:
+                mirror.stop()
+        assert counts[0] == counts[1]
+
+    def test_trace(self):
+        path = os.path.join(self.dir.name, 'trace')
+        mirror = self.mirror(['left', 'right'], "[Trace]\nfile = " + path + "\n")
+        try:
+            mirror.start()
+            time.sleep(0.3)
+        finally:
+            mirror.stop()
+        # next to the trace of the main stepper, as the state files are
+        for name in ('left', 'right'):
+            assert os.path.getsize(path + "." + name) > 0
+
+    def test_blocking_logic(self):
+        # a logic with execute only (e.g. of another package) runs on a thread of its own
+        class BlockingLogic(AsteriskLogic):
+            def execute(self):
+                self.stepper.rotate_by_steps(10)
+        scheduler = StepScheduler()
+        stepper = SchedulerStepper(scheduler, [20, 21, 22], backend=RecordingBackend())
+        motor = Motor('left', stepper, [BlockingLogic(stepper)])
+        mirror = MagicMock(home_interval=0)
+        mirror.stop_event.is_set.return_value = False
+        driver = MotorDriver(scheduler, [motor])
+        scheduler.start()
+        driver.start(mirror)
+        try:
+            motor.next_logic()
+            time.sleep(0.1)
+            assert motor.thread is not None and motor.thread.is_alive()
+            assert len(stepper.backend.pulses(20)) >= 10
+            thread = motor.thread
+            motor.next_logic()
+            thread.join(1.0)
+            assert not thread.is_alive()
+        finally:
+            stepper.interrupt()
+            driver.stop()
+            scheduler.stop()
+
+    def test_next_logic(self):
+        mirror = self.mirror(['left'])
+        try:
+            mirror.start()
+            time.sleep(0.2)
+            motor = mirror.motors[0]
+            program = motor.program
+            mirror.next_logic()
+            time.sleep(0.2)
+            # the program of the next logic replaces the interrupted one
+            assert mirror.state()['motors']['left']['logic'] == 'MorseLogic'
+            assert motor.program is not None and motor.program is not program
+        finally:
+            mirror.stop()
+
+if __name__ == '__main__':
+    unittest.main()
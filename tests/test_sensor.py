@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from asterisk_mirror.clock import VirtualClock
+from asterisk_mirror.gpio import SimulatedBackend
+from asterisk_mirror.sensor import GPIOSensor
+from asterisk_mirror.stepper import Stepper
+
+class TestHoming(unittest.TestCase):
+    def create(self, position: int) -> Stepper:
+        self.backend = SimulatedBackend(position=position)
+        stepper = Stepper(backend=self.backend, clock=VirtualClock())
+        stepper.sensor = GPIOSensor(self.backend, 26)
+        return stepper
+
+    def test_simulated_sensor(self):
+        stepper = self.create(1590)
+        assert not stepper.sensor.triggered()
+        stepper.rotate_by_steps(10)
+        assert self.backend.position == 0
+        assert stepper.sensor.triggered()
+        stepper.rotate_by_steps(-1)
+        assert not stepper.sensor.triggered()
+
+    def test_rotate_to_balance(self):
+        # the mirror is at 500 while the stepper assumes 0
+        stepper = self.create(500)
+        started = stepper.clock.time()
+        moved = stepper.rotate_to_balance()
+        # stops at the edge of the sensor and calls it zero
+        assert self.backend.position == 0
+        assert stepper.current_step == 0
+        assert moved == 1100 - 40 + 40
+        # a coarse seek instead of a full slow revolution
+        assert stepper.clock.time() - started < 2.0
+
+    def test_leave_sensor(self):
+        # starts on the sensor: leaves it and comes back to its edge
+        stepper = self.create(3)
+        stepper.rotate_to_balance()
+        assert self.backend.position == 0
+        assert stepper.current_step == 0
+
+    def test_not_found(self):
+        stepper = self.create(500)
+        stepper.current_step = 7
+        # no magnet: one revolution without changing the position
+        self.backend.width = 0
+        assert stepper.rotate_to_balance() == 1600
+        assert stepper.current_step == 7
+        # always triggered (a wrong polarity): gives up
+        stepper.sensor = GPIOSensor(self.backend, 26, active_low=False)
+        assert stepper.rotate_to_balance() == -400
+        assert stepper.current_step == 7-400+1600
+
+if __name__ == '__main__':
+    unittest.main()
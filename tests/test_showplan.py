@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import subprocess
+import sys
+import time
+from datetime import datetime
+from unittest.mock import patch
+
+from asterisk_mirror.config import AsteriskConfig
+from asterisk_mirror.log import configure as configure_log
+from asterisk_mirror.logics import compile_morse
+from asterisk_mirror.main import main
+from asterisk_mirror.showplan import ShowPlanner, format_report
+
+class TestShowPlanner(unittest.TestCase):
+    def setUp(self):
+        AsteriskConfig().load(['tests/asterisk-mirror.cfg'])
+        self.planner = ShowPlanner()
+
+    def tearDown(self):
+        AsteriskConfig().load()
+
+    def test_scenes(self):
+        report = self.planner.plan(150, datetime(2024, 6, 1).timestamp())
+        assert [scene['logic'] for scene in report['scenes']] == ['MorseLogic', 'YearLogic', 'FlucLogic']
+        assert [scene['duration'] for scene in report['scenes']] == [60, 60, 30]
+        assert report['steps'] == sum(scene['steps'] for scene in report['scenes'])
+
+    def test_morse(self):
+        morse = self.planner.logics[0]
+        steps, holds = compile_morse(morse.morse, morse.dot_steps, morse.dot_interval)
+        # a message takes its moves (dot_steps each 1/speed msecs) and holds
+        secs = sum(steps)*self.planner.stepper.base_time/morse.speed + sum(holds)
+        scene = self.planner._plan_MorseLogic(morse, 0, secs, 0)
+        assert scene['steps'] == sum(steps)
+        assert abs(scene['enabled'] - secs) < 0.001
+        assert abs(scene['cycle'] - secs) < 0.001
+        assert scene['peak_rate'] == morse.speed/self.planner.stepper.base_time
+
+    def test_year(self):
+        year = self.planner.logics[1]
+        begin = datetime(2024, 1, 1).timestamp()
+        # 1600 steps a year: a step every 5.49 hours
+        scene = self.planner._plan_YearLogic(year, begin, 86400, 0)
+        assert scene['steps'] == 4
+        assert scene['moved'] == 4
+        assert scene['enabled'] < 0.01
+
+    def test_fluc(self):
+        fluc = self.planner.logics[2]
+        scene = self.planner._plan_FlucLogic(fluc, 0, 60, 0)
+        # 1/3 of the configured speed after the ramp
+        assert abs(scene['steps'] - 60*fluc.speed/self.planner.stepper.base_time) < 200
+        assert scene['enabled'] == 60
+
+    def test_horizon(self):
+        started = time.perf_counter()
+        report = self.planner.plan(86400)
+        assert len(report['scenes']) == 1440
+        assert time.perf_counter() - started < 1.0
+        assert 0.6 < report['duty_cycle'] < 0.7
+        assert 'total: 86400.0 secs' in format_report(report)
+
+    def test_cycle(self):
+        report = self.planner.plan(180, datetime(2024, 6, 1).timestamp())
+        cycle = report['scenes'][0]['cycle']
+        assert ("MorseLogic: %.1f secs a message" % cycle) in format_report(report)
+        # a message longer than a scene never ends
+        self.planner.transition = int(cycle/2)
+        assert "longer than the transition" in format_report(self.planner.plan(180))
+
+    def test_main(self):
+        self.addCleanup(configure_log)
+        with patch('builtins.print') as mock:
+            assert main(['plan', '--config', 'tests/asterisk-mirror.cfg', '--horizon', '180', '--start', '2024-06-01T12:00']) == 0
+        assert 'total: 180.0 secs' in mock.call_args[0][0]
+        # the logs go to stderr, apart from the report
+        result = subprocess.run([sys.executable, '-m', 'asterisk_mirror.main', 'plan', '--config', 'tests/asterisk-mirror.cfg',
+            '--horizon', '180'], capture_output=True, text=True, check=True)
+        assert result.stdout.splitlines()[0].split() == ['start', 'logic', 'secs', 'steps', 'peak', 'steps/s', 'duty']
+        assert ' INFO ' not in result.stdout and ' INFO ' in result.stderr
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest.mock import patch
+import os
+import tempfile
+import time
+
+from asterisk_mirror.logics import MorseLogic
+from asterisk_mirror.sources import MessageSource, FileSource, FifoSource, create_source, words
+
+class TestSources(unittest.TestCase):
+    def test_words(self):
+        chunks = ["hel", "lo wor", "ld\n", "  h.o", "\n"]
+        assert list(words(chunks)) == ["hello", "world", "h.o"]
+        # the rest of a word carried to the next chunk is emitted once it reaches max_word
+        # (cut at a chunk boundary, not at max_word: the carried text stays bounded)
+        assert list(words(["a"*5, "a"*5], max_word=8)) == ["a"*10]
+        assert list(words(["a"*5, "a"*5, "b"], max_word=4)) == ["a"*5, "a"*5, "b"]
+
+    def test_file_source(self):
+        path = os.path.join(tempfile.mkdtemp(), 'message.txt')
+        with open(path, 'w') as f:
+            f.write("sos\n")
+        source = FileSource(path, interval=0.01)
+        source.start()
+        assert self._next_word(source) == "sos"
+        # an appended line is picked up
+        with open(path, 'a') as f:
+            f.write("hello world\n")
+        assert self._next_word(source) == "hello"
+        assert self._next_word(source) == "world"
+        source.close()
+
+    def test_missing_file(self):
+        path = os.path.join(tempfile.mkdtemp(), 'message.txt')
+        source = FileSource(path, interval=0.01)
+        source.retry_interval = 0.01
+        source.start()
+        time.sleep(0.05)
+        # the reader keeps trying until the file appears
+        with open(path, 'w') as f:
+            f.write("sos\n")
+        assert self._next_word(source) == "sos"
+        source.close()
+
+    def test_fifo_source(self):
+        path = os.path.join(tempfile.mkdtemp(), 'message.fifo')
+        os.mkfifo(path)
+        source = FifoSource(path)
+        source.start()
+        with open(path, 'w') as f:
+            f.write("asterisk mirror\n")
+        assert self._next_word(source) == "asterisk"
+        assert self._next_word(source) == "mirror"
+        source.close()
+
+    def test_create_source(self):
+        assert create_source('') is None
+        assert isinstance(create_source('file:/tmp/a.txt'), FileSource)
+        with self.assertRaises(ValueError):
+            create_source('http://example.com')
+
+    def test_stream(self):
+        with patch('asterisk_mirror.stepper.Stepper') as StepperMock:
+            stepper = StepperMock()
+            stepper.is_interrupted.return_value = False
+            stepper.base_time = 0.001
+            stepper.number_of_steps = 1600
+            stepper.current_step = 0
+            logic = MorseLogic(stepper)
+            logic.source = MessageSource()
+            logic.source.put("e t #")
+            logic.execute()
+            # "e" and "t" are transmitted with inter-word gaps and "#" is skipped
+            steps = [args[0] for args, _ in stepper.rotate_by_offsets.call_args_list]
+            assert steps == [logic.dot_steps, logic.dot_steps*3]
+            holds = [round(args[0]/logic.dot_interval) for args, _ in stepper.wait.call_args_list]
+            assert holds == [7, 7]
+            # waits for words when the source is empty
+            logic.execute()
+            assert round(stepper.wait.call_args[0][0]/logic.dot_interval) == 8
+
+    def _next_word(self, source: MessageSource) -> str:
+        for _ in range(200):
+            word = source.next_word()
+            if word is not None:
+                return word
+            time.sleep(0.01)
+        return None
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import tempfile
+
+from asterisk_mirror.clock import VirtualClock
+from asterisk_mirror.gpio import RecordingBackend
+from asterisk_mirror.state import StateFile, restore, _RECORD
+from asterisk_mirror.stepper import Stepper
+
+class TestStateFile(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'state')
+
+    def test_save_and_load(self):
+        state = StateFile(self.path)
+        assert state.load() is None
+        state.save(100, 1600)
+        state.save(120, 1600)
+        assert StateFile(self.path).load() == (120, 1600, False)
+        state.close()
+        assert StateFile(self.path).load() == (120, 1600, True)
+
+    def test_torn_write(self):
+        state = StateFile(self.path)
+        state.save(100, 1600)
+        state.save(120, 1600)
+        state.close()
+        # breaks the newest slot (seq 3 is in slot 1)
+        with open(self.path, 'r+b') as f:
+            f.seek(_RECORD.size + 8)
+            f.write(b'\xff')
+        assert StateFile(self.path).load() == (120, 1600, False)
+
+    def test_warm_start(self):
+        stepper = Stepper(backend=RecordingBackend(), clock=VirtualClock())
+        restore(stepper, StateFile(self.path))
+        stepper.rotate_by_steps(150)
+        stepper.rotate_by_steps(-20)
+        stepper.exit()
+        # a new process resumes from the recorded position
+        stepper = Stepper(backend=RecordingBackend(), clock=VirtualClock())
+        restore(stepper, StateFile(self.path))
+        assert stepper.current_step == 130
+        assert stepper.state.load() == (130, 1600, True)
+
+    def test_exit_during_move(self):
+        clock = VirtualClock()
+        stepper = Stepper(backend=RecordingBackend(), clock=clock)
+        restore(stepper, StateFile(self.path))
+        state = stepper.state
+        # SIGTERM in the middle of a long move
+        clock.schedule(0.05, stepper.exit)
+        stepper.rotate_by_steps(5000)
+        position = stepper.current_step
+        assert 0 < position < 5000
+        # the move saves nothing after the close
+        assert state.map is None
+        assert StateFile(self.path).load() == (position, 1600, True)
+
+if __name__ == '__main__':
+    unittest.main()
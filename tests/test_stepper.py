@@ -3,9 +3,11 @@
 import unittest
 from unittest.mock import patch
 
+from asterisk_mirror.clock import VirtualClock
+from asterisk_mirror.easing import delay_table
+from asterisk_mirror.gpio import RecordingBackend
 from asterisk_mirror.stepper import Stepper
 
-from threading import Thread
 import time
 
 class TestStepper(unittest.TestCase):
@@ -51,27 +53,37 @@ class TestStepper(unittest.TestCase):
         assert steps == -test_steps
 
     def test_interrupt(self):
-        stepper = Stepper()
-        def interrupt():
-            # interrupt stepper thread after 50ms
-            time.sleep(0.005)
-            stepper.interrupt()
-        # 1st test
-        thread = Thread(target=interrupt)
-        thread.start()
+        clock = VirtualClock()
+        stepper = Stepper(clock=clock)
+        # 1st test: interrupt stepper after 5ms
+        clock.schedule(0.005, stepper.interrupt)
         steps = stepper.rotate_by_steps(100)
         #print("steps=", steps, ", current=", stepper.current_step)
-        assert steps in range(4,7)
+        assert steps == 5
         assert stepper.current_step == steps
         # 2nd test
         stepper.reset()
-        thread = Thread(target=interrupt)
-        thread.start()
+        clock.schedule(0.005, stepper.interrupt)
         steps = stepper.rotate_by_steps(-100)
         #print("steps=", steps, ", current=", stepper.current_step)
-        assert steps in range(-6,-3)
+        assert steps == -5
         assert stepper.current_step == stepper.number_of_steps + steps
 
+    def test_deadline(self):
+        stepper = Stepper(base_time=0.002)
+        step = stepper.step
+        def slow_step(dir: int=1):
+            # emulate GPIO overhead of 1ms per step
+            time.sleep(0.001)
+            step(dir)
+        stepper.step = slow_step
+        # 50 steps x 2ms should take 100ms regardless of the overhead
+        started = time.monotonic()
+        steps = stepper.rotate_by_steps(50)
+        elapsed = time.monotonic() - started
+        assert steps == 50
+        assert 0.1 <= elapsed < 0.13
+
     def test_rotate_by_angle(self):
         stepper = Stepper(base_time=0.00001)
         # rotate 180 degrees
@@ -104,5 +116,58 @@ class TestStepper(unittest.TestCase):
     #         stepper.foo()
     #         stepper.foo.assert_called()
 
+    def microstepper(self) -> Stepper:
+        stepper = Stepper(backend=RecordingBackend(), clock=VirtualClock())
+        stepper.configure_microsteps(16, [17, 27, 22], 4, 0.0005)
+        return stepper
+
+    def pulses(self, stepper) -> int:
+        backend = stepper.backend
+        return sum(1 for i in range(backend.count) if backend.pins[i] == stepper.step_pin and backend.values[i])
+
+    def test_microsteps(self):
+        stepper = self.microstepper()
+        assert stepper.number_of_steps == 3200
+        assert [stepper.backend.levels[pin] for pin in stepper.mode_pins] == [True, True, True]
+        with self.assertRaises(ValueError):
+            stepper.configure_microsteps(32)
+
+    def test_transit(self):
+        stepper = self.microstepper()
+        stepper.current_step = 3
+        started = stepper.clock.monotonic_ns()
+        # a fast revolution: aligned to the coarse grid first, then 4 microsteps a pulse
+        assert stepper.rotate_by_steps(3200, 4.0, 'trapezoid') == 3200
+        assert stepper.current_step == 3
+        assert self.pulses(stepper) < 3200/4 + 2*200
+        # the same deadlines as in the finest microsteps
+        assert stepper.clock.monotonic_ns() - started == delay_table(3200, 4.0, 'trapezoid', 0.001)[-1]
+        assert stepper.step_size == 1
+        assert [stepper.backend.levels[pin] for pin in stepper.mode_pins] == [True, True, True]
+
+    def test_phase(self):
+        stepper = self.microstepper()
+        stepper.rotate_by_steps(2, 0.1)
+        # a restored position does not move the translator of the driver
+        stepper.current_step = 0
+        switches = []
+        set_step_size = stepper.set_step_size
+        def record(size: int) -> bool:
+            if size != stepper.step_size:
+                switches.append(stepper.phase)
+            return set_step_size(size)
+        stepper.set_step_size = record
+        assert stepper.rotate_by_steps(3200, 4.0, 'trapezoid') == 3200
+        assert stepper.current_step == 0
+        assert stepper.phase == 2
+        # modes switch at coarse steps of the translator
+        assert len(switches) >= 2 and all(phase % 4 == 0 for phase in switches)
+
+    def test_slow_moves(self):
+        stepper = self.microstepper()
+        assert stepper.rotate_by_steps(-400, 1.0) == -400
+        assert self.pulses(stepper) == 400
+        assert stepper.current_step == 2800
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import socket
+import tempfile
+from urllib.request import urlopen
+
+from asterisk_mirror.clock import VirtualClock
+from asterisk_mirror.stepper import Stepper
+from asterisk_mirror.telemetry import StepTelemetry, MetricsServer
+
+class TestStepTelemetry(unittest.TestCase):
+    def test_ring_buffer(self):
+        telemetry = StepTelemetry(capacity=3)
+        for i in range(5):
+            telemetry.record(i*1000000, i*1000000+i*1000)
+        assert telemetry.count == 5
+        assert telemetry.latencies() == [0.000002, 0.000003, 0.000004]
+        assert telemetry.histogram()[0] == 3
+
+    def test_stepper(self):
+        telemetry = StepTelemetry()
+        stepper = Stepper(clock=VirtualClock())
+        stepper.telemetry = telemetry
+        telemetry.set_label('MorseLogic')
+        stepper.rotate_by_steps(100)
+        telemetry.set_label('FlucLogic')
+        stepper.rotate_by_steps(-50, 2.0)
+        # no latency on a virtual clock
+        assert telemetry.count == 150
+        assert max(telemetry.latencies()) == 0
+        assert telemetry.steps == [0, 100, 50]
+        text = telemetry.render()
+        assert 'asterisk_mirror_steps_total{logic="MorseLogic"} 100' in text
+        assert 'asterisk_mirror_step_latency_seconds_count 150' in text
+        assert 'asterisk_mirror_missed_deadlines_total 0' in text
+
+class TestMetricsServer(unittest.TestCase):
+    def test_http(self):
+        telemetry = StepTelemetry()
+        telemetry.record(0, 1000)
+        server = MetricsServer(telemetry, '127.0.0.1:0')
+        server.start()
+        try:
+            host, port = server.address()
+            body = urlopen('http://%s:%d/metrics' % (host, port)).read().decode('utf-8')
+            assert 'asterisk_mirror_step_latency_seconds_count 1' in body
+        finally:
+            server.stop()
+
+    def test_unix_socket(self):
+        path = os.path.join(tempfile.mkdtemp(), 'metrics.sock')
+        server = MetricsServer(StepTelemetry(), path)
+        server.start()
+        try:
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(path)
+            client.sendall(b'GET /metrics HTTP/1.0\r\n\r\n')
+            response = b''
+            while True:
+                data = client.recv(4096)
+                if not data:
+                    break
+                response += data
+            client.close()
+            assert response.startswith(b'HTTP/1.0 200')
+            assert b'asterisk_mirror_missed_deadlines_total 0' in response
+        finally:
+            server.stop()
+        assert not os.path.exists(path)
+
+if __name__ == '__main__':
+    unittest.main()
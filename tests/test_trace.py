@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import tempfile
+
+from asterisk_mirror.clock import VirtualClock
+from asterisk_mirror.gpio import RecordingBackend
+from asterisk_mirror.stepper import Stepper
+from asterisk_mirror.trace import TraceRecorder, read_trace, replay, diff, main, _RECORD
+
+class TestTrace(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'motion.trace')
+
+    def record_show(self, path: str, easing: str='trapezoid') -> Stepper:
+        stepper = Stepper(backend=RecordingBackend(), clock=VirtualClock())
+        stepper.trace = TraceRecorder(path, clock=stepper.clock)
+        stepper.trace.set_label('MorseLogic')
+        stepper.rotate_by_steps(400, 2.0, easing)
+        stepper.wait(1.0)
+        stepper.trace.set_label('FlucLogic')
+        stepper.rotate_by_steps(-100)
+        stepper.exit()
+        return stepper
+
+    def test_record(self):
+        stepper = self.record_show(self.path, 'linear')
+        steps = read_trace(self.path)
+        assert len(steps) == 500
+        assert sum(dir for _, dir, _ in steps) == 300 == stepper.current_step
+        assert steps[0][2] == 'MorseLogic' and steps[-1][2] == 'FlucLogic'
+        # usecs of the recorded pulses
+        pulses = stepper.backend.pulses(stepper.step_pin)
+        assert [time for time, _, _ in steps] == [(pulse-pulses[0])//1000 + steps[0][0] for pulse in pulses]
+        # constant speed moves are run-length encoded
+        assert os.path.getsize(self.path) < 200
+
+    def test_replay(self):
+        recorded = self.record_show(self.path)
+        stepper = Stepper(backend=RecordingBackend(), clock=VirtualClock())
+        assert replay(read_trace(self.path), stepper) == 300
+        # the same pulses at the same times
+        a = recorded.backend.pulses(recorded.step_pin)
+        b = stepper.backend.pulses(stepper.step_pin)
+        assert [(t-a[0])//1000 for t in a] == [(t-b[0])//1000 for t in b]
+
+    def test_replay_microsteps(self):
+        recorded = Stepper(backend=RecordingBackend(), clock=VirtualClock())
+        recorded.configure_microsteps(8, [17, 27, 22], 2)
+        recorded.trace = TraceRecorder(self.path, clock=recorded.clock)
+        recorded.rotate_by_steps(800, 4.0)
+        recorded.exit()
+        steps = read_trace(self.path)
+        assert sum(dir for _, dir, _ in steps) == 800 and len(steps) < 800
+        # with the mode pins, or in the finest microsteps without them
+        for mode_pins in ([17, 27, 22], None):
+            stepper = Stepper(backend=RecordingBackend(), clock=VirtualClock())
+            stepper.configure_microsteps(8, mode_pins, 2)
+            assert replay(steps, stepper) == 800
+            assert stepper.current_step == 800
+
+    def test_diff(self):
+        other = os.path.join(self.directory, 'other.trace')
+        self.record_show(self.path)
+        self.record_show(other)
+        result = diff(read_trace(self.path), read_trace(other))
+        assert result['divergence'] is None and result['max_deviation'] == 0
+        assert main(['diff', self.path, other]) == 0
+        self.record_show(other, 'linear')
+        result = diff(read_trace(self.path), read_trace(other))
+        assert result['divergence']['index'] == 1
+        assert main(['diff', self.path, other]) == 1
+
+    def test_rotation(self):
+        stepper = Stepper(backend=RecordingBackend(), clock=VirtualClock())
+        stepper.trace = TraceRecorder(self.path, max_bytes=1024, backups=2, clock=stepper.clock)
+        stepper.trace.batch_size = 256
+        stepper.rotate_by_steps(1000, 1.0, 'sine')
+        stepper.exit()
+        assert os.path.exists(self.path + ".1") and os.path.exists(self.path + ".2")
+        assert not os.path.exists(self.path + ".3")
+        assert os.path.getsize(self.path) <= 1024 + 256 + _RECORD.size
+
+if __name__ == '__main__':
+    unittest.main()
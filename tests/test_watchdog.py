@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import socket
+import tempfile
+import time
+from threading import Event
+from unittest.mock import Mock, patch
+
+from asterisk_mirror.clock import VirtualClock
+from asterisk_mirror.config import AsteriskConfig
+from asterisk_mirror.gpio import create_backend
+from asterisk_mirror.main import AsteriskMirror
+from asterisk_mirror.stepper import Stepper
+from asterisk_mirror.watchdog import Watchdog, SystemdNotifier, SceneStalled
+
+class TestWatchdog(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.actions = []
+        self.watchdog = Watchdog(10, 1, lambda name, action: self.actions.append((name, action)),
+            self.clock, SystemdNotifier(''))
+
+    def sleep(self, secs: float):
+        self.clock.wait(Event(), secs)
+
+    def test_escalation(self):
+        self.watchdog.beat('timer', 300)
+        self.sleep(305)
+        assert self.watchdog.check()
+        # one more action each timeout
+        for secs in (10, 0, 10, 10, 10):
+            self.sleep(secs)
+            assert not self.watchdog.check()
+        assert self.actions == [('timer', 'interrupt'), ('timer', 'restart'), ('timer', 'exit')]
+        # a beat ends the escalation
+        self.watchdog.beat('timer', 300)
+        assert self.watchdog.check()
+        assert self.watchdog.stalls == {}
+
+    def test_idle(self):
+        self.watchdog.beat('step', 2)
+        self.sleep(5)
+        self.watchdog.idle('step')
+        self.sleep(3600)
+        assert self.watchdog.check()
+        assert self.actions == []
+
+    def test_stepper(self):
+        stepper = Stepper(backend=create_backend('recording'), clock=self.clock)
+        stepper.watchdog = Mock()
+        stepper.rotate_by_steps(100, 1.0)
+        name, within = stepper.watchdog.beat.call_args[0]
+        # the move ends by its last deadline
+        assert name == 'step' and 0 < within <= 100*stepper.base_time*2
+        stepper.watchdog.idle.assert_called_once_with('step')
+
+class TestNotifier(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'notify')
+        self.manager = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.manager.bind(self.path)
+        self.manager.settimeout(1)
+
+    def tearDown(self):
+        self.manager.close()
+        self.dir.cleanup()
+
+    def test_notify(self):
+        with patch.dict(os.environ, {'NOTIFY_SOCKET': self.path, 'WATCHDOG_USEC': '1000000'}):
+            watchdog = Watchdog(10, 1)
+        # twice as often as the service manager expects
+        assert watchdog.interval == 0.5
+        stop_event = Event()
+        watchdog.clock.wait = lambda event, timeout: stop_event.set()
+        watchdog.run(stop_event)
+        assert [self.manager.recv(64) for _ in range(3)] == [b'READY=1', b'WATCHDOG=1', b'STOPPING=1']
+
+    def test_abstract(self):
+        notifier = SystemdNotifier('@asterisk-mirror-test')
+        assert notifier.address == '\0asterisk-mirror-test'
+        # no service manager: a warning without raising
+        assert not notifier.notify('WATCHDOG=1')
+        assert not SystemdNotifier('').notify('WATCHDOG=1')
+
+class TestSupervision(unittest.TestCase):
+    def setUp(self):
+        AsteriskConfig().load(['tests/asterisk-mirror.cfg'])
+        self.mirror = AsteriskMirror()
+
+    def tearDown(self):
+        self.mirror.stop()
+        AsteriskConfig().load()
+
+    def test_restart(self):
+        runs = []
+        def run_logic(clear: bool=True):
+            runs.append(time.monotonic())
+            if len(runs) == 1:
+                # stuck without checking the interrupt
+                while True:
+                    time.sleep(0.01)
+            self.mirror.stepper.clear()
+            self.mirror.stepper.wait(None)
+        for logic in self.mirror.logics:
+            logic.run = run_logic
+        self.mirror.start()
+        time.sleep(0.2)
+        self.mirror.escalate('logic', 'interrupt')
+        time.sleep(0.2)
+        assert len(runs) == 1
+        self.mirror.escalate('logic', 'restart')
+        time.sleep(0.2)
+        assert len(runs) == 2
+
+    def test_stall_between_scenes(self):
+        runs = []
+        def run_logic(clear: bool=True):
+            runs.append(clear)
+            self.mirror.stepper.wait(None)
+        for logic in self.mirror.logics:
+            logic.run = run_logic
+        # raised in the run loop outside of a scene
+        idle = self.mirror.idle
+        stalls = [SceneStalled()]
+        def stalled_idle(name: str):
+            if stalls:
+                raise stalls.pop()
+            idle(name)
+        self.mirror.idle = stalled_idle
+        self.mirror.start()
+        time.sleep(0.2)
+        assert self.mirror.main_thread.is_alive()
+        assert len(runs) == 1
+
+    def test_exit(self):
+        with patch('os._exit') as mock:
+            self.mirror.escalate('timer', 'restart')
+            self.mirror.escalate('timer', 'exit')
+        mock.assert_called_once_with(1)
+
+if __name__ == '__main__':
+    unittest.main()